@@ -4,7 +4,8 @@ Persona-Driven Document Intelligence Service
 """
 
 import os
-from typing import Optional, List
+import socket
+from typing import Dict, Optional, List
 from pathlib import Path
 
 class Settings:
@@ -14,12 +15,16 @@ class Settings:
         self.round: str = os.getenv('ROUND', 'round1b')
         
         # Directory paths for Service 1B
-        self.collections_dir: str = '/app/collections'
+        self.collections_dir: str = os.getenv('COLLECTIONS_DIR', '/app/collections')  # folder, or a .zip/.tar archive
         self.models_dir: str = '/app/models'
         self.logs_dir: str = '/app/logs'
+        self.output_dir: Optional[str] = os.getenv('OUTPUT_DIR') or None  # default: next to each input
         
         # Logging
         self.log_level: str = os.getenv('LOG_LEVEL', 'INFO')
+        self.log_json: bool = os.getenv('LOG_JSON', 'false').lower() == 'true'      # also write logs/application.jsonl
+        self.log_sample_every: int = int(os.getenv('LOG_SAMPLE_EVERY', '10'))       # 1 keeps every per-document line
+        self.log_sample_burst: int = int(os.getenv('LOG_SAMPLE_BURST', '20'))       # always kept before sampling starts
         
         # Embedding Model Configuration
         self.embedding_model_name: str = 'sentence-transformers/all-MiniLM-L6-v2'
@@ -35,6 +40,41 @@ class Settings:
             'Software Engineer'
         ]
         
+        # Persona vocabulary - single source for query expansion and the persona bank
+        self.persona_queries: Dict[str, List[str]] = {
+            'QA Engineer': [
+                'testing procedures', 'test cases', 'quality assurance',
+                'bugs', 'defects', 'validation', 'verification'
+            ],
+            'Data Scientist': [
+                'data analysis', 'machine learning', 'statistics',
+                'algorithms', 'models', 'datasets', 'analytics',
+                'statistical analysis', 'data modeling', 'research methodology',
+                'analytics tools'
+            ],
+            'Digital Transformation Consultant': [
+                'digital strategy', 'transformation', 'technology adoption',
+                'process improvement', 'automation', 'innovation'
+            ],
+            'Product Manager': [
+                'product requirements', 'roadmap', 'features',
+                'user experience', 'business value', 'strategy',
+                'product strategy', 'user requirements', 'market analysis',
+                'roadmap planning', 'stakeholder management'
+            ],
+            'Software Engineer': [
+                'code', 'development', 'programming', 'architecture',
+                'implementation', 'technical specifications', 'APIs',
+                'technical implementation', 'coding practices', 'system architecture',
+                'development tools', 'programming languages'
+            ]
+        }
+        
+        # Persona bank - precomputed persona vectors and role resolution
+        self.persona_bank_path: str = '/app/app/models/round1b/persona_bank.npz'
+        self.persona_match_threshold: float = 0.5  # Min cosine to map a role onto a known persona
+        self.persona_expansion_terms: int = 3
+        
         # Query and Analysis Configuration
         self.max_results_per_query: int = 10
         self.relevance_threshold: float = 0.3
@@ -45,6 +85,31 @@ class Settings:
         self.timeout_seconds: int = 60   # Max 60 seconds per collection (hackathon req)
         self.max_concurrent_collections: int = 3
         
+        # Execution planning (workers x torch threads); 0 = let the planner decide
+        self.execution_workers: int = int(os.getenv('EXECUTION_WORKERS', '0'))
+        self.execution_threads: int = int(os.getenv('EXECUTION_THREADS', '0'))
+        self.target_threads_per_worker: int = 4  # MiniLM on short headings stops scaling around here
+        self.worker_memory_mb: int = 350         # Resident size of one worker with the model loaded
+        self.worker_shared_memory_mb: int = 190  # Of that, shared copy-on-write by forked workers (~55%, README PSS table)
+        self.execution_plan_file: str = 'execution_plan.json'  # Calibrated plans, under logs_dir
+        
+        # Encoder profile (encode batch size, torch threads, precision), tuned per host with --tune;
+        # the env values below win over the tuned profile, which wins over the defaults
+        self.encode_batch_size: int = int(os.getenv('ENCODE_BATCH_SIZE', '0'))  # 0 = tuned or default
+        self.encode_precision: str = os.getenv('ENCODE_PRECISION', '')           # float32 | bfloat16 | int8
+        self.encode_max_tokens: int = int(os.getenv('ENCODE_MAX_TOKENS', '0'))   # 0 = the model's own limit (256)
+        self.encode_default_batch_size: int = 32                                 # sentence-transformers' default
+        self.encode_batch_candidates: List[int] = [16, 32, 64, 128]
+        self.encode_min_cosine: float = 0.99          # mean cosine to float32 a reduced precision must keep
+        self.encoder_autotune: bool = os.getenv('ENCODER_AUTOTUNE', 'false').lower() == 'true'  # tune on first run
+        self.encoder_profile_file: str = 'encoder_profile.json'  # Tuned profiles, under logs_dir
+        
+        # Supervised execution: collections run in worker processes that a watchdog kills at hard limits
+        self.supervised_enabled: bool = os.getenv('SUPERVISED', 'false').lower() == 'true'
+        self.supervisor_timeout_seconds: float = float(os.getenv('SUPERVISOR_TIMEOUT_SECONDS', str(self.timeout_seconds)))
+        self.supervisor_memory_mb: int = int(os.getenv('SUPERVISOR_MEMORY_MB', '0'))  # PSS per worker; 0 = its share of max_memory_mb
+        self.supervisor_poll_seconds: float = 0.1  # Watchdog checks between results
+        
         # Collection Processing Settings
         self.min_collections: int = 3
         self.max_collections: int = 10
@@ -56,11 +121,101 @@ class Settings:
         self.persona_weight: float = 0.3      # 30% persona relevance
         self.query_weight: float = 0.7        # 70% query relevance
         
+        # Embedding codec (float32 | float16 | int8 | pq) of the corpus store and federated shards;
+        # the configuration evaluator overrides these per candidate
+        self.embedding_codec: str = os.getenv('EMBEDDING_CODEC', 'float32')
+        self.codec_exact_rescore: bool = os.getenv('CODEC_EXACT_RESCORE', 'true').lower() == 'true'  # float32 final top-k
+        self.codec_rescore_factor: int = 4      # Candidates fetched per final result when rescoring
+        self.pq_subspaces: int = 48             # 384 / 48 = 8 dims per subspace, 48 bytes per vector
+        self.pq_centroids: int = 256
+        # Vectors the corpus store keeps as float32 before fitting its one codec per model
+        self.codec_train_vectors: int = int(os.getenv('CODEC_TRAIN_VECTORS', '4096'))
+        
+        # Collection scheduling (cost model learned from previous runs, under logs_dir)
+        self.schedule_mode: str = os.getenv('SCHEDULE_MODE', 'lpt')  # lpt (makespan), edf (deadlines) or fifo
+        self.schedule_model_file: str = 'collection_costs.json'
+        self.schedule_default_overhead: float = 0.5                # seconds per collection until fitted
+        self.schedule_default_tokens_per_second: float = 20000.0
+        self.schedule_history_size: int = 200                       # observations kept per host
+        self.schedule_min_token_spread: float = 0.25                # (max - min) / mean tokens before fitting an overhead
+        
+        # Branch-and-bound tree search over large documents with stored embeddings
+        self.outline_tree_enabled: bool = os.getenv('OUTLINE_TREE', 'false').lower() == 'true'
+        self.outline_tree_min_sections: int = int(os.getenv('OUTLINE_TREE_MIN_SECTIONS', '10000'))  # below: one matmul is faster
+        self.outline_tree_branching: int = 8
+        self.outline_tree_cache_size: int = 64  # documents whose trees are kept
+        
+        # Result cache for repeated persona/task requests on the same documents
+        self.result_cache_enabled: bool = os.getenv('RESULT_CACHE', 'true').lower() == 'true'
+        self.result_cache_size: int = int(os.getenv('RESULT_CACHE_SIZE', '128'))     # outputs kept (LRU)
+        self.result_cache_persist: bool = os.getenv('RESULT_CACHE_PERSIST', 'true').lower() == 'true'  # across runs and workers
+        self.result_cache_file: str = 'result_cache.db'  # SQLite, under logs_dir
+        self.result_cache_near_enabled: bool = os.getenv('RESULT_CACHE_NEAR', 'false').lower() == 'true'
+        self.result_cache_near_threshold: float = float(os.getenv('RESULT_CACHE_NEAR_THRESHOLD', '0.95'))  # task cosine
+        
+        # Binary outline packs (mmap-loaded, rebuilt when the *_outline.json changes)
+        self.outline_packs_enabled: bool = os.getenv('OUTLINE_PACKS', 'true').lower() == 'true'
+        self.outline_pack_dir: Optional[str] = os.getenv('OUTLINE_PACK_DIR') or None  # default: logs_dir/outline_packs
+        
+        # Federated search: per-collection shards scanned in parallel, merged into one top-k
+        self.shard_dir_name: str = '.challenge1b_shard'  # inside each collection
+        self.federated_top_k: int = int(os.getenv('FEDERATED_TOP_K', '20'))
+        self.federated_executor: str = os.getenv('FEDERATED_EXECUTOR', 'threads')  # threads | processes
+        self.federated_workers: int = int(os.getenv('FEDERATED_WORKERS', '4'))     # shards scanned at once
+        self.federated_block_rows: int = 65536  # embedding rows per scan block (bounds memory)
+        
+        # Collection workers map persona and stored section matrices from one shared memory segment
+        self.shared_arena_enabled: bool = os.getenv('SHARED_ARENA', 'true').lower() == 'true'
+        
+        # Profiling hooks (cpu = cProfile, memory = tracemalloc, torch = torch profiler around encoding)
+        self.profile_enabled: bool = os.getenv('PROFILE', 'false').lower() == 'true'
+        self.profile_stages: List[str] = [s for s in os.getenv('PROFILE_STAGES', 'cpu,memory').split(',') if s]
+        self.profile_dir_name: str = 'profiles'  # under logs_dir
+        self.profile_top_n: int = 25
+        self.profile_traceback_depth: int = 1
+        
+        # Multi-node coordination through lease files on the shared collections volume
+        self.coordination_enabled: bool = os.getenv('COORDINATE', 'false').lower() == 'true'
+        self.node_id: str = os.getenv('NODE_ID', f'{socket.gethostname()}-{os.getpid()}')
+        self.lease_file_name: str = '.challenge1b.lease'
+        self.lease_ttl_seconds: float = float(os.getenv('LEASE_TTL', '30'))             # stale after this without a heartbeat
+        self.lease_heartbeat_seconds: float = float(os.getenv('LEASE_HEARTBEAT', '10'))
+        
+        # Watch mode: polling index over collection inputs
+        self.watch_poll_interval: float = float(os.getenv('WATCH_POLL_INTERVAL', '1.0'))   # seconds
+        self.watch_debounce_seconds: float = float(os.getenv('WATCH_DEBOUNCE', '2.0'))     # quiet period before processing
+        
+        # Cascade ranking: truncated-layer filter, then full model on the top N
+        self.cascade_enabled: bool = os.getenv('CASCADE_ENABLED', 'false').lower() == 'true'
+        self.cascade_layers: int = int(os.getenv('CASCADE_LAYERS', '2'))          # of MiniLM's 6
+        self.cascade_candidates: int = int(os.getenv('CASCADE_CANDIDATES', '32'))  # N re-scored per document
+        
+        # Near-duplicate section collapse (repeated headings are embedded once)
+        self.dedup_enabled: bool = True
+        self.dedup_fuzzy_enabled: bool = os.getenv('DEDUP_FUZZY', 'false').lower() == 'true'
+        self.dedup_fuzzy_threshold: float = 0.9   # Min estimated Jaccard of character shingles
+        self.dedup_minhash_permutations: int = 64
+        self.dedup_lsh_bands: int = 16            # 16 bands x 4 rows
+        self.dedup_shingle_size: int = 3
+        
         # Output Format Settings
         self.output_format: str = 'json'
+        self.max_extracted_sections: int = 20    # extracted_sections entries considered
+        self.max_subsection_analyses: int = 15   # subsection_analysis entries considered
         self.include_confidence_scores: bool = True
         self.include_document_metadata: bool = True
         
+        # Output sink: files = pretty challenge1b_output.json per collection; bulk = compact files
+        # plus one NDJSON results stream; ndjson = stream only (bulk/ndjson are batched and fsynced per batch)
+        self.output_mode: str = os.getenv('OUTPUT_MODE', 'files')
+        self.output_ndjson_path: Optional[str] = os.getenv('OUTPUT_NDJSON_PATH') or None  # '-' = stdout
+        self.output_ndjson_file: str = 'challenge1b_results.ndjson'  # under logs_dir by default
+        self.output_batch_size: int = int(os.getenv('OUTPUT_BATCH_SIZE', '64'))  # outputs per flush
+        
+        # Corpus store (SQLite) - cached sections, embeddings and rankings
+        self.corpus_store_enabled: bool = os.getenv('CORPUS_STORE_ENABLED', 'false').lower() == 'true'
+        self.corpus_store_path: str = os.getenv('CORPUS_STORE_PATH', '/app/data/corpus_store.db')
+        
         # Error handling
         self.continue_on_error: bool = True
         self.max_retries: int = 2
@@ -81,6 +236,20 @@ class Settings:
         """Get logs directory as Path object"""
         return Path(self.logs_dir)
     
+    def get_outline_pack_dir(self) -> Path:
+        """Cache of binary outline packs; input folders are never written to"""
+        return Path(self.outline_pack_dir) if self.outline_pack_dir else self.get_logs_path() / 'outline_packs'
+    
+    def get_output_file(self, collection_path: Path) -> Path:
+        """A collection's challenge1b_output.json: under OUTPUT_DIR/<collection>/ when set, else next to its input"""
+        if self.output_dir:
+            return Path(self.output_dir) / Path(collection_path).name / self.challenge_output_file
+        return Path(collection_path) / self.challenge_output_file
+    
+    def get_output_ndjson_path(self) -> str:
+        """NDJSON results stream of the bulk output modes ('-' for stdout)"""
+        return self.output_ndjson_path or str(self.get_logs_path() / self.output_ndjson_file)
+    
     def get_embedding_model_path(self) -> Path:
         """Get embedding model directory as Path object"""
         return Path(self.embedding_model_path)
@@ -88,7 +257,8 @@ class Settings:
     def validate_directories(self) -> bool:
         """Ensure required directories exist"""
         try:
-            self.get_collections_path().mkdir(parents=True, exist_ok=True)
+            if not self.get_collections_path().is_file():  # archives are read in place
+                self.get_collections_path().mkdir(parents=True, exist_ok=True)
             self.get_logs_path().mkdir(parents=True, exist_ok=True)
             # Models directory should already exist with pre-trained embeddings
             return True
@@ -107,28 +277,10 @@ class Settings:
         """Check if persona is supported"""
         return persona in self.supported_personas
     
+    def get_ranking_top_k(self) -> int:
+        """Number of ranked sections the output formatter can consume"""
+        return max(self.max_extracted_sections, self.max_subsection_analyses)
+    
     def get_persona_queries(self, persona: str) -> List[str]:
         """Get persona-specific query expansions"""
-        persona_queries = {
-            'QA Engineer': [
-                'testing procedures', 'test cases', 'quality assurance',
-                'bugs', 'defects', 'validation', 'verification'
-            ],
-            'Data Scientist': [
-                'data analysis', 'machine learning', 'statistics',
-                'algorithms', 'models', 'datasets', 'analytics'
-            ],
-            'Digital Transformation Consultant': [
-                'digital strategy', 'transformation', 'technology adoption',
-                'process improvement', 'automation', 'innovation'
-            ],
-            'Product Manager': [
-                'product requirements', 'roadmap', 'features',
-                'user experience', 'business value', 'strategy'
-            ],
-            'Software Engineer': [
-                'code', 'development', 'programming', 'architecture',
-                'implementation', 'technical specifications', 'APIs'
-            ]
-        }
-        return persona_queries.get(persona, [])
+        return self.persona_queries.get(persona, [])
@@ -6,6 +6,8 @@ Adobe Hackathon 2025 - Challenge 1B Compliant
 import sys
 import os
 import time
+import argparse
+import json
 from pathlib import Path
 
 # Add the app directory to Python path
@@ -14,14 +16,51 @@ sys.path.insert(0, str(app_dir))
 
 from config.settings import Settings
 from services.round1b.collection_processor import CollectionProcessor
+from services.round1b.collection_watcher import CollectionWatcher
+from services.round1b.federated_search import FederatedSearch
+from services.round1b.output_sink import validate_output_mode
 from utils.logger import setup_logger
-from utils.json_validator import JSONValidator
+from utils.execution_planner import ExecutionPlanner
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Command line options for Service 1B"""
+    parser = argparse.ArgumentParser(description="Service 1B - Persona-Driven Document Intelligence")
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Benchmark workers x threads plans, save the fastest for this host and exit')
+    parser.add_argument('--tune', action='store_true',
+                        help='Sweep encode batch size, torch threads and precision, save the fastest for this host and exit')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep the model loaded and process collections as their files change')
+    parser.add_argument('--coordinate', action='store_true',
+                        help='Share the collections volume with other nodes through lease files')
+    parser.add_argument('--supervised', action='store_true',
+                        help='Run each collection in a forked worker that is killed at the hard time or memory limit')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile each collection and write reports to the logs directory')
+    parser.add_argument('--profile-stages', default=None,
+                        help='Comma-separated profilers to run: cpu, memory, torch (default: cpu,memory)')
+    parser.add_argument('--search-persona', default=None,
+                        help='Run one federated search across all collections for this persona (needs --search-task)')
+    parser.add_argument('--search-task', default=None,
+                        help='Task for the federated search; results go to the logs directory')
+    parser.add_argument('--search-top-k', type=int, default=None,
+                        help='Sections returned by the federated search (default: FEDERATED_TOP_K)')
+    parser.add_argument('--search-executor', choices=['threads', 'processes'], default=None,
+                        help='Scan shards in a thread pool or a process pool (default: FEDERATED_EXECUTOR)')
+    parser.add_argument('--search-filters', type=json.loads, default=None,
+                        help='JSON filters object for the federated search, as in the input payload')
+    return parser.parse_args(argv)
 
 def main():
     """Main application entry point for Service 1B - Persona-Driven Document Intelligence"""
+    args = parse_args()
+    if args.profile:
+        # Through the environment so spawned collection workers profile as well
+        os.environ['PROFILE'] = 'true'
+        if args.profile_stages:
+            os.environ['PROFILE_STAGES'] = args.profile_stages
     logger = setup_logger()
     settings = Settings()
-    validator = JSONValidator()
     
     logger.info("Starting Adobe Hackathon Service 1B - Persona-Driven Document Intelligence")
     logger.info(f"Service: {getattr(settings, 'service', '1B')}")
@@ -34,8 +73,27 @@ def main():
             logger.error("Failed to create required directories")
             sys.exit(1)
         
+        try:
+            validate_output_mode(settings.output_mode)
+        except ValueError as e:
+            logger.error(f"Invalid OUTPUT_MODE: {str(e)}")
+            sys.exit(1)
+        
+        if args.calibrate:
+            logger.info("Calibrating execution plan for this host...")
+            best_plan = ExecutionPlanner().calibrate()
+            logger.info(f"✅ Calibrated plan: {best_plan['workers']} worker(s) x {best_plan['threads_per_worker']} thread(s)")
+            return
+        
+        if args.tune or (settings.encoder_autotune and ExecutionPlanner().load_encoder_profile() is None):
+            logger.info("Tuning the encoder for this host...")
+            profile = ExecutionPlanner().tune_encoder()
+            logger.info(f"✅ Encoder profile: batch {profile['batch_size']}, {profile['threads']} thread(s), {profile['precision']}")
+            if args.tune:
+                return
+        
         logger.info("Initializing Challenge 1B Multi-Collection Processing")
-        collection_processor = CollectionProcessor()
+        collection_processor = CollectionProcessor(supervised=True if args.supervised else None)
         
         # Get collections directory from settings
         collections_dir = settings.get_collections_path()
@@ -47,8 +105,31 @@ def main():
             logger.info("Please ensure collections directory exists with challenge1b_input.json files")
             sys.exit(1)
         
+        if args.search_task:
+            collections = collection_processor.discover_collections(collections_dir, verbose=False)
+            federated = FederatedSearch(collection_processor.persona_matcher, collection_processor.manifest,
+                                        output_dir=collection_processor.settings.output_dir)
+            report = federated.search(
+                collections,
+                args.search_persona or '', args.search_task,
+                k=args.search_top_k, executor=args.search_executor, filters=args.search_filters
+            )
+            output_file = settings.get_logs_path() / 'federated_search.json'
+            collection_processor.file_handler.save_json(report, output_file)
+            for result in report['results']:
+                logger.info(f"  {result['importance_rank']:>3}. [{result['collection']}] {result['document']} "
+                            f"p{result['page_number']}: {result['section_title']} ({result['score']:.3f})")
+            for shard in report['shards']:
+                logger.info(f"  🧩 {shard['shard']}: {shard['sections']} sections in {shard['latency_ms']:.1f}ms")
+            logger.info(f"📄 Federated search results saved to {output_file}")
+            return
+        
+        if args.watch:
+            CollectionWatcher(collection_processor, collections_dir).run()
+            return
+        
         # Get collection statistics
-        stats = collection_processor.get_collection_stats()
+        stats = collection_processor.get_collection_stats(collections_dir)
         logger.info(f"Found {stats['total_collections']} collections to process")
         
         if stats['total_collections'] == 0:
@@ -62,23 +143,24 @@ def main():
         
         start_time = time.time()
         
-        # Process all collections
-        collection_processor.process_all_collections(collections_dir)
+        # Process all collections (outputs are validated in memory before being written);
+        # the manifest scanned for the stats above is reused
+        run_report = collection_processor.process_all_collections(
+            collections_dir, coordinate=args.coordinate or settings.coordination_enabled, rescan=False
+        )
         
         processing_time = time.time() - start_time
         
-        # Validate outputs
-        logger.info("Validating generated outputs...")
-        validation_summary = validate_all_outputs(collections_dir, validator, logger)
-        
         # Final summary
         logger.info("=" * 60)
         logger.info(f"Service 1B processing completed")
         logger.info(f"⏱️  Total processing time: {processing_time:.2f}s")
         logger.info(f"📊 Collections processed: {stats['total_collections']}")
-        logger.info(f"✅ Valid outputs: {validation_summary['valid']}")
-        if validation_summary['invalid'] > 0:
-            logger.warning(f"❌ Invalid outputs: {validation_summary['invalid']}")
+        logger.info(f"✅ Valid outputs: {run_report['valid_outputs']}")
+        if run_report['invalid_outputs'] > 0:
+            logger.warning(f"❌ Invalid outputs: {run_report['invalid_outputs']}")
+        if run_report.get('supervisor', {}).get('killed'):
+            logger.warning(f"🛑 Collections killed at hard limits: {run_report['supervisor']['killed']}")
         
         # Check timing compliance (≤60 seconds per collection average)
         avg_time_per_collection = processing_time / max(stats['total_collections'], 1)
@@ -93,30 +175,5 @@ def main():
         logger.error(traceback.format_exc())
         sys.exit(1)
 
-def validate_all_outputs(collections_dir: Path, validator: JSONValidator, logger) -> dict:
-    """Validate all generated challenge1b_output.json files"""
-    valid_count = 0
-    invalid_count = 0
-    
-    for collection_dir in collections_dir.iterdir():
-        if collection_dir.is_dir():
-            output_file = collection_dir / 'challenge1b_output.json'
-            if output_file.exists():
-                try:
-                    is_valid, errors = validator.validate_output_file(output_file)
-                    if is_valid:
-                        valid_count += 1
-                        logger.info(f"✅ {collection_dir.name}: Output validation passed")
-                    else:
-                        invalid_count += 1
-                        logger.error(f"❌ {collection_dir.name}: Output validation failed")
-                        for error in errors[:3]:  # Show first 3 errors
-                            logger.error(f"   - {error}")
-                except Exception as e:
-                    invalid_count += 1
-                    logger.error(f"❌ {collection_dir.name}: Validation error - {str(e)}")
-    
-    return {'valid': valid_count, 'invalid': invalid_count}
-
 if __name__ == "__main__":
     main()
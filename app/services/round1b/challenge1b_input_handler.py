@@ -8,21 +8,23 @@ import logging
 from pathlib import Path
 from typing import Dict, List
 
+from utils.archive_reader import read_path_bytes
+from utils.json_validator import JSONValidator
+
 class Challenge1BInputHandler:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.validator = JSONValidator()
     
     def load_challenge_input(self, input_file: Path) -> Dict:
         """Load challenge1b_input.json with exact specification format"""
         try:
-            with open(input_file, 'r', encoding='utf-8-sig') as f:
-                data = json.load(f)
+            # Plain file or a member of a zip/tar collections archive
+            data = json.loads(read_path_bytes(input_file).decode('utf-8-sig'))
             
-            # Validate required fields
-            required_fields = ['challenge_info', 'documents', 'persona', 'job_to_be_done']
-            for field in required_fields:
-                if field not in data:
-                    raise ValueError(f"Missing required field: {field}")
+            # Schema checks happen once, in validate_input_schema
+            if not isinstance(data, dict):
+                raise ValueError("Challenge input must be a JSON object")
             
             self.logger.info(f"Loaded challenge input with {len(data.get('documents', []))} documents")
             return data
@@ -64,50 +66,17 @@ class Challenge1BInputHandler:
             "job_role": persona_role,
             "query": task,
             "documents": documents,
+            "filters": challenge_input.get("filters", {}),  # Optional level/page/document restrictions
             "original_input": challenge_input  # Keep for metadata
         }
     
     def validate_input_schema(self, data: Dict) -> bool:
         """Validate input follows official specification"""
-        try:
-            # Check top-level structure
-            required_keys = ['challenge_info', 'documents', 'persona', 'job_to_be_done']
-            for key in required_keys:
-                if key not in data:
-                    self.logger.error(f"Missing required top-level key: {key}")
-                    return False
-            
-            # Validate challenge_info
-            challenge_info = data['challenge_info']
-            if not isinstance(challenge_info, dict):
-                self.logger.error("challenge_info must be an object")
-                return False
-            
-            # Validate documents
-            documents = data['documents']
-            if not isinstance(documents, list):
-                self.logger.error("documents must be an array")
-                return False
-            
-            for doc in documents:
-                if 'filename' not in doc:
-                    self.logger.error("Each document must have a filename")
-                    return False
-            
-            # Validate persona
-            persona = data['persona']
-            if not isinstance(persona, dict) or 'role' not in persona:
-                self.logger.error("persona must have a role field")
-                return False
-            
-            # Validate job_to_be_done
-            job = data['job_to_be_done']
-            if not isinstance(job, dict) or 'task' not in job:
-                self.logger.error("job_to_be_done must have a task field")
-                return False
-            
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Error validating schema: {str(e)}")
-            return False
+        errors = self.get_input_errors(data)
+        for error in errors[:3]:  # Show first 3 errors
+            self.logger.error(f"Invalid challenge input: {error}")
+        return not errors
+    
+    def get_input_errors(self, data: Dict) -> List[str]:
+        """Run the compiled input schema validator"""
+        return self.validator.get_input_validator()(data)
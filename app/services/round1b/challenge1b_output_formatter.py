@@ -7,36 +7,41 @@ import json
 from typing import Dict, List, Tuple
 from pathlib import Path
 
+from config.settings import Settings
+from utils.json_validator import JSONValidator
+
 class Challenge1BOutputFormatter:
     def __init__(self):
-        pass
+        self.settings = Settings()
+        self.validator = JSONValidator()
     
-    def format_challenge_output(self, query_data: Dict, ranked_sections: List[Tuple], 
-                              all_sections: List[Dict]) -> Dict:
-        """Format results to exact challenge1b_output.json specification"""
-        
-        # Extract metadata from original input
-        original_input = query_data.get("original_input", {})
+    def build_metadata(self, query_data: Dict) -> Dict:
+        """Output metadata for a request (documents, persona, job to be done)"""
         documents = query_data.get("documents", [])
-        
-        # Build metadata section (exact spec compliance)
-        metadata = {
+        return {
             "input_documents": [doc["name"] for doc in documents],
             "persona": query_data.get("job_role", ""),
             "job_to_be_done": query_data.get("query", "")
         }
+    
+    def format_challenge_output(self, query_data: Dict, ranked_sections: List[Tuple], 
+                              all_sections: List[Dict] = None) -> Dict:
+        """Format results to exact challenge1b_output.json specification"""
+        
+        # Build metadata section (exact spec compliance)
+        metadata = self.build_metadata(query_data)
         
         # Build extracted_sections (top-ranked sections with exact spec format)
         extracted_sections = []
         processed_sections = set()  # Avoid duplicates
         
-        for idx, (section, score) in enumerate(ranked_sections[:20]):  # Top 20 sections
+        for idx, (section, score) in enumerate(ranked_sections[:self.settings.max_extracted_sections]):  # Top 20 sections
             section_text = section.get('text', '').strip()
             document_name = section.get('document', 'unknown.pdf')
             page_number = section.get('page', 1)
             
             # Create unique key to avoid duplicates
-            section_key = f"{document_name}-{section_text}-{page_number}"
+            section_key = (document_name, section_text, page_number)
             
             if section_key not in processed_sections and section_text:
                 extracted_sections.append({
@@ -51,7 +56,7 @@ class Challenge1BOutputFormatter:
         subsection_analysis = []
         processed_subsections = set()
         
-        for idx, (section, score) in enumerate(ranked_sections[:15]):  # Top 15 for detailed analysis
+        for idx, (section, score) in enumerate(ranked_sections[:self.settings.max_subsection_analyses]):  # Top 15 for detailed analysis
             section_text = section.get('text', '').strip()
             document_name = section.get('document', 'unknown.pdf')
             page_number = section.get('page', 1)
@@ -68,7 +73,7 @@ class Challenge1BOutputFormatter:
             if len(refined_text) < 5:  # Skip very short text
                 continue
             
-            subsection_key = f"{document_name}-{refined_text[:50]}-{page_number}"
+            subsection_key = (document_name, refined_text[:50], page_number)
             
             if subsection_key not in processed_subsections:
                 subsection_analysis.append({
@@ -87,31 +92,8 @@ class Challenge1BOutputFormatter:
     
     def validate_output_schema(self, output_data: Dict) -> bool:
         """Validate output follows official specification"""
-        required_keys = ['metadata', 'extracted_sections', 'subsection_analysis']
-        
-        for key in required_keys:
-            if key not in output_data:
-                return False
-        
-        # Validate metadata structure
-        metadata = output_data['metadata']
-        metadata_keys = ['input_documents', 'persona', 'job_to_be_done']
-        for key in metadata_keys:
-            if key not in metadata:
-                return False
-        
-        # Validate extracted_sections structure
-        for section in output_data['extracted_sections']:
-            section_keys = ['document', 'section_title', 'importance_rank', 'page_number']
-            for key in section_keys:
-                if key not in section:
-                    return False
-        
-        # Validate subsection_analysis structure
-        for subsection in output_data['subsection_analysis']:
-            subsection_keys = ['document', 'refined_text', 'page_number']
-            for key in subsection_keys:
-                if key not in subsection:
-                    return False
-        
-        return True
+        return not self.get_output_errors(output_data)
+    
+    def get_output_errors(self, output_data: Dict) -> List[str]:
+        """Run the compiled output schema validator"""
+        return self.validator.get_output_validator()(output_data)
@@ -12,8 +12,9 @@ from services.round1b.document_loader import DocumentLoader
 from services.round1b.persona_matcher import PersonaMatcher
 from services.round1b.challenge1b_input_handler import Challenge1BInputHandler
 from services.round1b.challenge1b_output_formatter import Challenge1BOutputFormatter
+from services.round1b.topk_accumulator import TopKAccumulator
 from utils.file_handler import FileHandler
-from utils.logger import setup_logger
+from utils.logger import SAMPLED, setup_logger
 
 class Challenge1BRelevanceRanker:
     def __init__(self):
@@ -84,14 +85,13 @@ class Challenge1BRelevanceRanker:
         search_query = query_data.get('query', '')
         documents = query_data.get('documents', [])
         
-        all_sections = []
-        all_ranked_sections = []
+        top_k = TopKAccumulator(self.settings.get_ranking_top_k())
         
         for doc_info in documents:
             # ✅ FIXED - Look for outline file in same collection directory
             outline_path = collection_dir / doc_info['outline_file']
             
-            self.logger.debug(f'Looking for outline: {outline_path}')
+            self.logger.debug('Looking for outline: %s', outline_path, extra=SAMPLED)
             
             if outline_path.exists():
                 try:
@@ -103,30 +103,25 @@ class Challenge1BRelevanceRanker:
                     for section in sections:
                         section['document'] = doc_info['name']
                     
-                    all_sections.extend(sections)
-                    
-                    # Rank sections for this document
-                    ranked_sections = self.persona_matcher.rank_sections(
+                    # Score sections for this document and stream them into the top-k
+                    scores = self.persona_matcher.score_sections(
                         sections, job_role, search_query
                     )
                     
-                    all_ranked_sections.extend(ranked_sections)
+                    top_k.add(sections, scores)
                     
-                    self.logger.info(f'   Processed {len(sections)} sections from {doc_info["name"]}')
+                    self.logger.info('   Processed %d sections from %s', len(sections), doc_info['name'], extra=SAMPLED)
                     
                 except Exception as e:
                     self.logger.error(f'Error processing {doc_info["name"]}: {str(e)}')
             else:
                 self.logger.warning(f'Outline not found: {outline_path}')
         
-        # Sort all sections by relevance score
-        all_ranked_sections.sort(key=lambda x: x[1], reverse=True)
-        
-        self.logger.info(f'   Total ranked sections: {len(all_ranked_sections)}')
+        self.logger.info(f'   Total ranked sections: {top_k.total_seen}')
         
         # Format to challenge1b output structure
         return self.output_formatter.format_challenge_output(
-            query_data, all_ranked_sections, all_sections
+            query_data, top_k.results()
         )
     
     def process_single_collection(self, collection_path: Path) -> bool:
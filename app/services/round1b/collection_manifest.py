@@ -0,0 +1,144 @@
+﻿"""
+Per-run collection manifest: one scandir pass, each input parsed at most once
+"""
+
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import Settings
+from services.round1b.challenge1b_input_handler import Challenge1BInputHandler
+from utils.archive_reader import is_archive, open_archive, read_path_bytes, split_archive_path
+
+# (mtime_ns, size) per file, as seen by the scan
+FileStat = Tuple[int, int]
+
+class CollectionManifest:
+    """Snapshot of the collections root shared by stats, scheduling, processing and validation.
+    
+    The root and every collection folder are listed once with os.scandir, which
+    returns sizes and mtimes without a stat per file. Challenge inputs are parsed
+    and outline digests computed on first use and kept for the rest of the run,
+    keyed by the scanned (mtime, size) so a rescan invalidates only what changed.
+    Collections that were not part of the scan are listed on first access.
+    A zip/tar root is listed from the archive's member index instead.
+    Outputs, leases and run report entries are keyed by a collection's folder
+    name, so archive collections whose names clash are rejected, not merged.
+    """
+    
+    def __init__(self, root_path: Path = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        self.input_handler = Challenge1BInputHandler()
+        self.root_path = Path(root_path) if root_path is not None else None
+        self.collections: Dict[Path, Dict[str, FileStat]] = {}
+        self._inputs: Dict[Tuple[Path, FileStat], Dict] = {}   # (input file, stat) -> parsed input
+        self._digests: Dict[Tuple[Path, FileStat], str] = {}   # (file, stat) -> SHA-1
+        if self.root_path is not None:
+            self.scan()
+    
+    def scan(self):
+        """List the root and every collection folder holding a challenge input"""
+        self.collections = {}
+        if is_archive(self.root_path):
+            # Any archive folder with a challenge input is a collection, at any depth
+            archive = open_archive(self.root_path)
+            folders: Dict[str, List[Path]] = {}
+            for name in archive.names():
+                member = Path(name)
+                if member.name == self.settings.challenge_input_file and member.parent != Path('.'):
+                    folders.setdefault(member.parent.name, []).append(member.parent)
+            for folder_name, members in folders.items():
+                if len(members) > 1:
+                    self.logger.error(
+                        f"Skipping {len(members)} archive collections named '{folder_name}' "
+                        f"({', '.join(member.as_posix() for member in members)}): their outputs would collide"
+                    )
+                    continue
+                self.collections[self.root_path / members[0]] = archive.list_dir(members[0].as_posix())
+        else:
+            with os.scandir(self.root_path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        files = self._list_files(Path(entry.path))
+                        if self.settings.challenge_input_file in files:
+                            self.collections[Path(entry.path)] = files
+        
+        # Drop parses and digests of files that changed or disappeared since the last scan
+        for cache in (self._inputs, self._digests):
+            for file_path, stat in list(cache):
+                if self.collections.get(file_path.parent, {}).get(file_path.name) != stat:
+                    del cache[(file_path, stat)]
+    
+    def _list_files(self, collection_path: Path) -> Dict[str, FileStat]:
+        located = split_archive_path(collection_path)
+        if located is not None:
+            return open_archive(located[0]).list_dir(located[1])
+        
+        files = {}
+        try:
+            with os.scandir(collection_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            self.logger.debug(f'Could not list {collection_path}: {str(e)}')
+        return files
+    
+    def paths(self) -> List[Path]:
+        return list(self.collections)
+    
+    def files(self, collection_path: Path) -> Dict[str, FileStat]:
+        """Scanned files of a collection (listed now if it was not part of the scan)"""
+        collection_path = Path(collection_path)
+        if collection_path not in self.collections:
+            self.collections[collection_path] = self._list_files(collection_path)
+        return self.collections[collection_path]
+    
+    def stat(self, collection_path: Path, name: str) -> Optional[FileStat]:
+        return self.files(collection_path).get(name)
+    
+    def has_file(self, collection_path: Path, name: str) -> bool:
+        return name in self.files(collection_path)
+    
+    def challenge_input(self, collection_path: Path) -> Dict:
+        """Parsed challenge1b_input.json (read once per scanned version)"""
+        collection_path = Path(collection_path)
+        input_file = collection_path / self.settings.challenge_input_file
+        key = (input_file, self.stat(collection_path, self.settings.challenge_input_file))
+        if key not in self._inputs:
+            self._inputs[key] = self.input_handler.load_challenge_input(input_file)
+        return self._inputs[key]
+    
+    def query_data(self, collection_path: Path) -> Dict:
+        """Internal query format of the collection's input"""
+        return self.input_handler.convert_to_internal_format(self.challenge_input(collection_path))
+    
+    def read_bytes(self, file_path: Path) -> bytes:
+        """Raw bytes of a collection file; the digest is recorded so content_hash needs no second read"""
+        file_path = Path(file_path)
+        raw = read_path_bytes(file_path)
+        self._digests[(file_path, self.stat(file_path.parent, file_path.name))] = hashlib.sha1(raw).hexdigest()
+        return raw
+    
+    def has_digest(self, file_path: Path) -> bool:
+        """Whether content_hash is already known for the scanned version (no read needed)"""
+        file_path = Path(file_path)
+        return (file_path, self.stat(file_path.parent, file_path.name)) in self._digests
+    
+    def content_hash(self, file_path: Path) -> str:
+        """SHA-1 of a collection file, computed once per scanned version"""
+        file_path = Path(file_path)
+        key = (file_path, self.stat(file_path.parent, file_path.name))
+        if key not in self._digests:
+            self.read_bytes(file_path)
+        return self._digests[key]
+    
+    def newest_input_mtime(self, collection_path: Path) -> Optional[int]:
+        """Latest mtime_ns of the challenge input and outlines, as scanned"""
+        mtimes = [stat[0] for name, stat in self.files(collection_path).items()
+                  if name == self.settings.challenge_input_file or name.endswith('_outline.json')]
+        return max(mtimes, default=None)
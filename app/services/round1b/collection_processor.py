@@ -5,83 +5,240 @@ Discovers and processes multiple collection folders
 
 import logging
 from pathlib import Path
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional, Tuple, Union
 import json
+import multiprocessing
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 
 from config.settings import Settings  # ADD THIS IMPORT
 from services.round1b.challenge1b_input_handler import Challenge1BInputHandler
 from services.round1b.challenge1b_output_formatter import Challenge1BOutputFormatter
+from services.round1b.collection_manifest import CollectionManifest
+from services.round1b.collection_scheduler import CollectionScheduler
+from services.round1b.collection_supervisor import CollectionSupervisor, fork_available
+from services.round1b.corpus_store import CorpusStore
+from services.round1b.document_loader import DocumentLoader
+from services.round1b.embedding_generator import encoder_has_run
+from services.round1b.outline_tree_index import OutlineTreeIndex
+from services.round1b.output_sink import OutputSink, validate_output_mode
 from services.round1b.persona_matcher import PersonaMatcher
+from services.round1b.result_cache import ResultCache
+from services.round1b.section_filter_index import SectionFilterIndex, normalize_filters
+from services.round1b.shared_vector_arena import SharedVectorArena
+from services.round1b.topk_accumulator import TopKAccumulator
+from services.round1b.vector_codecs import EncodedVectors
+from utils.archive_reader import archive_stem, is_archive
+from utils.execution_planner import ExecutionPlanner
 from utils.file_handler import FileHandler
-from utils.logger import setup_logger
+from utils.lease_manager import LeaseManager
+from utils.logger import SAMPLED, restart_logging_after_fork, setup_logger
+from utils.profiler import CollectionProfiler
 
 class CollectionProcessor:
-    def __init__(self):
+    def __init__(self, shared_arena: SharedVectorArena = None, output_dir: str = None,
+                 supervised: Optional[bool] = None):
         self.logger = setup_logger(__name__)
         self.settings = Settings()  # ADD THIS
+        # Output root chosen by the driving process (e.g. next to an archive); handed to
+        # the sink, leases and workers explicitly rather than through the environment
+        if output_dir:
+            self.settings.output_dir = output_dir
+        # --supervised, likewise passed in; None keeps SUPERVISED
+        if supervised is not None:
+            self.settings.supervised_enabled = supervised
+        # Fail on a bad OUTPUT_MODE now, not after the first collection has been processed
+        self.settings.output_mode = validate_output_mode(self.settings.output_mode)
         self.input_handler = Challenge1BInputHandler()
         self.output_formatter = Challenge1BOutputFormatter()
-        self.persona_matcher = PersonaMatcher()
+        
+        # Worker processes read persona and stored section matrices from the
+        # parent's shared memory arena instead of holding private copies
+        self.shared_arena = shared_arena
+        self.persona_matcher = PersonaMatcher(shared_arena)
         self.file_handler = FileHandler()
+        self.document_loader = DocumentLoader()
+        self.execution_planner = ExecutionPlanner()
+        
+        # Parsed inputs, file sizes and mtimes for the current run (refreshed by discovery)
+        self.manifest = CollectionManifest()
+        
+        # Bulk output modes: outputs travel back with the run record and are written
+        # in batches by the sink of the process that drives the run
+        self.output_sink: Optional[OutputSink] = None
+        self._outputs: Dict[str, Dict] = {}
+        
+        # Per-run outcome of every collection, including its validation result
+        self.run_report = self._new_run_report()
+        
+        # Bounding-cone trees over large stored documents, LRU by (collection, document, content hash)
+        self._outline_trees: 'OrderedDict[Tuple, OutlineTreeIndex]' = OrderedDict()
+        
+        # LRU of outputs for repeated persona/task requests on the same documents, backed by
+        # a file under logs_dir so later runs and other workers hit it too
+        self.result_cache = None
+        if self.settings.result_cache_enabled:
+            cache_file = self.settings.get_logs_path() / self.settings.result_cache_file
+            self.result_cache = ResultCache(db_path=cache_file if self.settings.result_cache_persist else None)
+        
+        # Optional per-collection cProfile / tracemalloc / torch profiler reports
+        self.profiler = CollectionProfiler() if self.settings.profile_enabled else None
+        
+        # Optional SQLite cache of parsed sections, embeddings and rankings
+        self.corpus_store = None
+        if self.settings.corpus_store_enabled:
+            self.corpus_store = CorpusStore(self.settings.corpus_store_path, self.settings.embedding_codec)
     
-    def discover_collections(self, root_path: Path = None) -> List[Path]:
-        """Discover all collection folders containing challenge1b_input.json"""
+    def discover_collections(self, root_path: Path = None, verbose: bool = True) -> List[Path]:
+        """Discover all collection folders containing challenge1b_input.json (rebuilds the run manifest)"""
         if root_path is None:
             root_path = self.settings.get_collections_path()  # USE SETTINGS
         
-        collections = []
+        # Watch mode rescans every poll; keep those scans out of the info log
+        log = self.logger.info if verbose else self.logger.debug
         
         if not root_path.exists():
             self.logger.warning(f"Root path does not exist: {root_path}")
-            return collections
+            return []
         
-        # Look for collection directories
-        for item in root_path.iterdir():
-            if item.is_dir():
-                input_file = item / self.settings.challenge_input_file  # USE SETTINGS
-                if input_file.exists():
-                    collections.append(item)
-                    self.logger.info(f"Found collection: {item.name}")
+        if is_archive(root_path) and not self.settings.output_dir:
+            # Archives are read in place; outputs go to a sibling folder (passed on to workers)
+            self.settings.output_dir = str(root_path.parent / f"{archive_stem(root_path)}_output")
+            log(f"Reading collections from archive {root_path.name}; outputs go to {self.settings.output_dir}")
         
-        self.logger.info(f"Discovered {len(collections)} collections in {root_path}")
+        # One scandir pass over the root and each collection folder; rescanning the
+        # same root keeps parses of unchanged files (watch mode polls this)
+        if self.manifest.root_path == Path(root_path):
+            self.manifest.scan()
+        else:
+            self.manifest = CollectionManifest(root_path)
+        collections = self.manifest.paths()
+        for item in collections:
+            log(f"Found collection: {item.name}")
+        
+        log(f"Discovered {len(collections)} collections in {root_path}")
         return collections
     
-    def process_all_collections(self, root_path: Path = None):
-        """Process all discovered collections"""
+    def _new_run_report(self) -> Dict:
+        """Empty run report"""
+        return {
+            'collections': {},
+            'successful': 0,
+            'failed': 0,
+            'valid_outputs': 0,
+            'invalid_outputs': 0
+        }
+    
+    def _record_collection(self, collection_name: str, **fields):
+        """Merge fields into a collection's run report entry"""
+        self.run_report['collections'].setdefault(collection_name, {}).update(fields)
+    
+    def process_all_collections(self, root_path: Path = None, coordinate: bool = None, rescan: bool = True) -> Dict:
+        """Process all discovered collections and return the run report.
+        
+        With rescan=False the manifest from the last discovery of the same root
+        (e.g. get_collection_stats just before) is reused instead of listed again.
+        """
         if root_path is None:
             root_path = self.settings.get_collections_path()  # USE SETTINGS
+        if coordinate is None:
+            coordinate = self.settings.coordination_enabled
+        
+        self.run_report = self._new_run_report()
         
         # Validate collections directory exists
         if not self.settings.validate_directories():
             self.logger.error("Failed to create/validate directories")
-            return
+            return self.run_report
         
-        collections = self.discover_collections(root_path)
+        if not rescan and self.manifest.root_path == Path(root_path):
+            collections = self.manifest.paths()
+        else:
+            collections = self.discover_collections(root_path)
         
         if not collections:
             self.logger.warning("No collections found with challenge1b_input.json files")
             self.logger.info(f"Expected structure: collections/Collection_Name/{self.settings.challenge_input_file}")
-            return
+            return self.run_report
         
         self.logger.info(f"Processing {len(collections)} collections")
         
+        # Split the CPUs between collection workers and encoder threads
+        # (coordinated nodes process one leased collection at a time); workers
+        # are forked, sharing the model's memory, while it has not run here yet
+        plan = self.execution_planner.plan(1 if coordinate else len(collections),
+                                           forked=fork_available() and not encoder_has_run())
+        self.execution_planner.apply_plan(plan)
+        
+        # Order (and, through submission order, pack) collections by predicted cost;
+        # coordinated nodes keep their own lease order
+        scheduler, schedule = None, None
+        if not coordinate:
+            scheduler = CollectionScheduler()
+            schedule = scheduler.schedule(collections, plan['workers'], self.manifest)
+            collections = schedule['order']
+        started = time.time()
+        
+        supervisor = None
+        if coordinate:
+            outcomes = self._process_with_leases(collections)
+        elif self.settings.supervised_enabled:
+            # Workers killed at the hard time/memory limits (forked with the model preloaded when safe)
+            supervisor = CollectionSupervisor(self, plan)
+            outcomes = supervisor.run(collections)
+        elif plan['workers'] > 1:
+            outcomes = self._process_in_workers(collections, plan)
+        else:
+            outcomes = ((path, self.run_collection(path)) for path in collections)
+        
         successful_count = 0
         failed_count = 0
+        # Collections that processed fine but whose bulk output could not be written
+        write_failed = 0
         
-        for collection_path in collections:
-            try:
-                if self.process_single_collection(collection_path):
-                    successful_count += 1
-                    self.logger.info(f"✅ Successfully processed {collection_path.name}")
-                else:
-                    failed_count += 1
-                    self.logger.error(f"❌ Failed to process {collection_path.name}")
-                    
-            except Exception as e:
+        for collection_path, (success, record) in outcomes:
+            output = record.pop('output', None)
+            self._record_collection(collection_path.name, **record)
+            if success:
+                successful_count += 1
+                self.logger.info(f"✅ Successfully processed {collection_path.name}")
+            else:
                 failed_count += 1
-                self.logger.error(f"❌ Error processing collection {collection_path.name}: {str(e)}")
-                import traceback
-                self.logger.error(traceback.format_exc())
+                self.logger.error(f"❌ Failed to process {collection_path.name}")
+            if output is not None:
+                write_failed += self.collect_output(collection_path, {'output': output})
+            if coordinate:
+                # Other nodes judge freshness by the output file, so write it before the lease goes
+                write_failed += self.flush_outputs()
+        
+        write_failed += self.close_outputs()
+        successful_count -= write_failed
+        failed_count += write_failed
+        
+        entries = self.run_report['collections'].values()
+        self.run_report['successful'] = successful_count
+        self.run_report['failed'] = failed_count
+        self.run_report['valid_outputs'] = sum(1 for entry in entries if entry.get('output_valid') is True)
+        self.run_report['invalid_outputs'] = sum(1 for entry in entries if entry.get('output_valid') is False)
+        if schedule is not None:
+            self.run_report['schedule'] = scheduler.record(
+                schedule, self.run_report['collections'], time.time() - started
+            )
+        if self.result_cache is not None:
+            # Counted from the per-collection entries, so worker processes are included
+            matches = [entry.get('result_cache') for entry in entries]
+            self.run_report['result_cache'] = {kind: matches.count(kind) for kind in ('exact', 'near', 'miss')}
+        self.run_report['execution_plan'] = {
+            'workers': plan['workers'],
+            'threads_per_worker': plan['threads_per_worker'],
+            'source': plan['source']
+        }
+        if supervisor is not None:
+            self.run_report['supervisor'] = supervisor.report()
         
         # Final summary
         self.logger.info("=" * 50)
@@ -89,105 +246,313 @@ class CollectionProcessor:
         self.logger.info(f"✅ Successfully processed: {successful_count} collections")
         if failed_count > 0:
             self.logger.warning(f"❌ Failed: {failed_count} collections")
+        if self.run_report.get('supervisor', {}).get('killed'):
+            for failure in self.run_report['supervisor']['failures']:
+                self.logger.warning(f"🛑 Stopped: {failure['collection']} ({failure['reason']}: {failure['detail']})")
+        if self.run_report.get('result_cache'):
+            cache_report = self.run_report['result_cache']
+            self.logger.info(f"⚡ Result cache: {cache_report['exact']} exact hits, "
+                             f"{cache_report['near']} near hits, {cache_report['miss']} misses")
+        
+        return self.run_report
+    
+    def run_collection(self, collection_path: Path) -> Tuple[bool, Dict]:
+        """Process one collection, returning its success flag and run report entry"""
+        try:
+            if self.profiler is not None:
+                with self.profiler.profile_collection(
+                    collection_path.name, self.persona_matcher.embedding_generator
+                ):
+                    success = self.process_single_collection(collection_path)
+            else:
+                success = self.process_single_collection(collection_path)
+        except Exception as e:
+            success = False
+            self._record_collection(collection_path.name, success=False, error=str(e))
+            self.logger.error(f"❌ Error processing collection {collection_path.name}: {str(e)}")
+            import traceback
+            self.logger.error(traceback.format_exc())
+        
+        record = dict(self.run_report['collections'].get(collection_path.name, {}))
+        output = self._outputs.pop(collection_path.name, None)
+        if output is not None:
+            record['output'] = output
+        return success, record
+    
+    def collect_output(self, collection_path: Path, record: Dict) -> int:
+        """Hand an output returned in a run record to the bulk output sink (returns as flush_outputs)"""
+        output = record.pop('output', None)
+        if output is None:
+            return 0
+        if self.output_sink is None:
+            self.output_sink = OutputSink(output_dir=self.settings.output_dir)
+        return self._record_write_failures(self.output_sink.add(collection_path, output))
+    
+    def flush_outputs(self) -> int:
+        """Write queued outputs; returns how many successful collections failed to write"""
+        if self.output_sink is None:
+            return 0
+        return self._record_write_failures(self.output_sink.flush())
+    
+    def close_outputs(self) -> int:
+        """Write what is left and close the sink (returns as flush_outputs)"""
+        if self.output_sink is None:
+            return 0
+        failures = self.output_sink.close()
+        self.output_sink = None
+        return self._record_write_failures(failures)
+    
+    def _record_write_failures(self, failures: Dict[Path, str]) -> int:
+        """Mark collections whose output never reached disk as failed in the run report"""
+        flipped = 0
+        for collection_path, error in failures.items():
+            entry = self.run_report['collections'].get(collection_path.name, {})
+            if entry.get('success'):
+                flipped += 1
+            self._record_collection(collection_path.name, success=False, output_written=False, error=error)
+            self.logger.error(f"❌ Output for {collection_path.name} was not written: {error}")
+        return flipped
+    
+    def build_shared_arena(self, collections: List[Path]) -> Optional[SharedVectorArena]:
+        """Put persona matrices (and stored, still-current section embeddings) in shared memory"""
+        if not self.settings.shared_arena_enabled:
+            return None
+        
+        bank = self.persona_matcher.persona_bank
+        arrays = dict(bank.export_arrays())
+        
+        if self.corpus_store is not None:
+            model_fingerprint = self.persona_matcher.embedding_generator.get_model_fingerprint()
+            for collection_path in collections:
+                for name, document_id, content_hash in self._stored_documents(collection_path):
+                    embeddings = self.corpus_store.load_embeddings(document_id, model_fingerprint)
+                    if embeddings is not None:
+                        arrays[self._arena_key(collection_path.name, name, content_hash)] = embeddings
+        
+        try:
+            return SharedVectorArena.create(arrays, metadata={'persona_names': list(bank.names)})
+        except OSError as e:
+            self.logger.warning(f"⚠️ Shared arena unavailable, workers will load private copies: {str(e)}")
+            return None
+    
+    def _stored_documents(self, collection_path: Path) -> Iterator[Tuple[str, int, str]]:
+        """(name, document_id, hash) of stored documents whose outline is unchanged on disk"""
+        try:
+            query_data = self.manifest.query_data(collection_path)
+        except Exception:
+            return
+        for doc_info in query_data.get('documents', []):
+            stored = self.corpus_store.get_document(collection_path.name, doc_info['name'])
+            if stored is None or not self.manifest.has_file(collection_path, doc_info['outline_file']):
+                continue
+            content_hash = self.manifest.content_hash(collection_path / doc_info['outline_file'])
+            if stored['content_hash'] == content_hash:
+                yield doc_info['name'], stored['id'], content_hash
+    
+    def _arena_key(self, collection_name: str, document_name: str, content_hash: str) -> str:
+        return f"sections/{collection_name}/{document_name}/{content_hash}"
+    
+    def reinit_after_fork(self):
+        """In a forked worker: restart logging and open private corpus store and result cache connections"""
+        restart_logging_after_fork()
+        if self.result_cache is not None:
+            self.result_cache.reopen()
+        # SQLite connections must not be used across fork
+        if self.corpus_store is not None:
+            self.corpus_store = CorpusStore(self.settings.corpus_store_path, self.settings.embedding_codec)
+    
+    def _process_in_workers(self, collections: List[Path], plan: Dict) -> Iterator[Tuple[Path, Tuple[bool, Dict]]]:
+        """Fan collections out to worker processes, yielding outcomes as they finish.
+        
+        Workers are forked from this process while it holds the loaded model but
+        has not run it yet, so the model weights, persona bank and everything else
+        are shared copy-on-write rather than loaded per worker. Once the model
+        has run here (torch thread pools do not survive fork), or where fork is
+        unavailable, workers are spawned: each loads its own model, and only
+        persona and stored section matrices are shared through the arena.
+        """
+        global _worker_processor
+        forked = fork_available() and not encoder_has_run()
+        context = multiprocessing.get_context('fork' if forked else 'spawn')
+        
+        # Each worker takes one slot index, which selects its CPU set
+        worker_slots = context.Queue()
+        for worker_index in range(plan['workers']):
+            worker_slots.put(worker_index)
+        
+        arena = None
+        if forked:
+            # Inherited by every forked worker
+            _worker_processor = self
+        else:
+            arena = self.build_shared_arena(collections)
+        
+        try:
+            with ProcessPoolExecutor(
+                max_workers=plan['workers'],
+                mp_context=context,
+                initializer=_init_collection_worker,
+                initargs=(plan, worker_slots, arena.descriptor() if arena else None, forked, self.settings.output_dir)
+            ) as pool:
+                futures = {pool.submit(_run_collection_in_worker, path): path for path in collections}
+                
+                for future in as_completed(futures):
+                    collection_path = futures[future]
+                    try:
+                        yield collection_path, future.result()
+                    except Exception as e:
+                        self.logger.error(f"❌ Worker failed on {collection_path.name}: {str(e)}")
+                        yield collection_path, (False, {'success': False, 'error': str(e)})
+        finally:
+            _worker_processor = None
+            if arena is not None:
+                arena.destroy()
+    
+    def _output_is_current(self, collection_path: Path) -> bool:
+        """Output exists and is newer than the input and every outline.
+        
+        Inputs come from the run manifest; the output is stat'ed live because
+        another node may have written it since the scan.
+        """
+        output_file = self.settings.get_output_file(collection_path)
+        try:
+            output_mtime = output_file.stat().st_mtime_ns
+        except OSError:
+            return False
+        newest_input = self.manifest.newest_input_mtime(collection_path)
+        return newest_input is not None and newest_input <= output_mtime
+    
+    def _process_with_leases(self, collections: List[Path]) -> Iterator[Tuple[Path, Tuple[bool, Dict]]]:
+        """Process only collections this node manages to lease on the shared volume"""
+        leases = LeaseManager(output_dir=self.settings.output_dir)
+        self.logger.info(f"Coordinating as node {leases.owner_id}")
+        
+        # Each node walks the collections in its own order, so claims rarely collide
+        order = list(collections)
+        random.Random(leases.owner_id).shuffle(order)
+        
+        leases.start_heartbeat()
+        try:
+            for collection_path in order:
+                if self._output_is_current(collection_path):
+                    continue
+                if not leases.acquire(collection_path):
+                    self.logger.debug(f"Collection {collection_path.name} is leased by another node")
+                    continue
+                
+                try:
+                    # Another node may have finished it between our check and our claim
+                    if self._output_is_current(collection_path):
+                        continue
+                    outcome = self.run_collection(collection_path)
+                    if not leases.still_held(collection_path):
+                        self.logger.warning(f"⚠️ Lease on {collection_path.name} expired while processing")
+                    yield collection_path, outcome
+                finally:
+                    leases.release(collection_path)
+        finally:
+            leases.stop_heartbeat()
     
     def process_single_collection(self, collection_path: Path) -> bool:
         """Process a single collection folder"""
         try:
             start_time = __import__('time').time()
             self.logger.info(f"Processing collection: {collection_path.name}")
+            self._record_collection(collection_path.name, success=False)
             
-            # Load challenge input
+            # Load challenge input (parsed once per run through the manifest)
             input_file = collection_path / self.settings.challenge_input_file
             
-            if not input_file.exists():
+            if not self.manifest.has_file(collection_path, self.settings.challenge_input_file):
                 self.logger.error(f"Challenge input file not found: {input_file}")
                 return False
             
-            challenge_input = self.input_handler.load_challenge_input(input_file)
+            challenge_input = self.manifest.challenge_input(collection_path)
             
-            # Validate input schema
-            if not self.input_handler.validate_input_schema(challenge_input):
+            # Validate input schema (compiled validator, single pass)
+            input_errors = self.input_handler.get_input_errors(challenge_input)
+            self._record_collection(collection_path.name, input_valid=not input_errors)
+            if input_errors:
+                self._record_collection(collection_path.name, validation_errors=input_errors)
                 self.logger.error(f"Invalid input schema in {collection_path.name}")
+                for error in input_errors[:3]:  # Show first 3 errors
+                    self.logger.error(f"   - {error}")
                 return False
             
             # Convert to internal format
             query_data = self.input_handler.convert_to_internal_format(challenge_input)
             
-            # Process documents in this collection
-            all_ranked_sections = []
-            all_sections = []
-            
             documents = query_data.get('documents', [])
             job_role = query_data.get('job_role', '')
             search_query = query_data.get('query', '')
             
             self.logger.info(f"   Processing {len(documents)} documents for persona: {job_role}")
             
-            for doc_info in documents:
-                # ✅ FIXED - Look for outline files in collection directory only
-                outline_filename = doc_info['outline_file']
-                outline_path = collection_path / outline_filename
+            # Same documents and settings with the same (or a near-identical) persona/task
+            cache_context = self._result_cache_context(collection_path, documents, query_data.get('filters'))
+            cached = None
+            if cache_context is not None:
+                cached = self.result_cache.lookup(
+                    cache_context, job_role, search_query, lambda: self._near_cache_key(job_role, search_query)
+                )
+            
+            if cached is not None:
+                result, match = cached
+                result['metadata'] = self.output_formatter.build_metadata(query_data)
+                self._record_collection(collection_path.name, result_cache=match)
+                self.logger.info(f"   ⚡ Result cache hit ({match}) for {collection_path.name}")
+            else:
+                # Process documents in this collection, keeping only the best k sections
+                top_k = self._rank_documents(collection_path, query_data)
                 
-                self.logger.debug(f"   Looking for outline: {outline_path}")
+                if not top_k.total_seen:
+                    self.logger.warning(f"No sections found to rank in collection {collection_path.name}")
+                    return False
                 
-                if outline_path.exists():
-                    try:
-                        # Load document outline
-                        outline_data = self.file_handler.load_json(outline_path)
-                        sections = outline_data.get('outline', [])
-                        
-                        if not sections:
-                            self.logger.warning(f"No sections found in {outline_filename}")
-                            continue
-                        
-                        # Add document metadata to each section
-                        for section in sections:
-                            section['document'] = doc_info['name']
-                            section['title'] = doc_info.get('title', doc_info['name'])
-                            section['collection'] = collection_path.name
-                        
-                        all_sections.extend(sections)
-                        
-                        # Rank sections for this document
-                        ranked_sections = self.persona_matcher.rank_sections(
-                            sections, job_role, search_query
-                        )
-                        
-                        all_ranked_sections.extend(ranked_sections)
-                        
-                        self.logger.info(f"   ✅ Processed {len(sections)} sections from {doc_info['name']}")
-                        
-                    except Exception as e:
-                        self.logger.error(f"   ❌ Error processing document {doc_info['name']}: {str(e)}")
-                        continue
-                else:
-                    self.logger.warning(f"   ⚠️  Outline not found: {outline_filename}")
-                    continue
-            
-            if not all_ranked_sections:
-                self.logger.warning(f"No sections found to rank in collection {collection_path.name}")
-                return False
-            
-            # Sort all sections by relevance score
-            all_ranked_sections.sort(key=lambda x: x[1], reverse=True)
+                # Top-k is already ordered by relevance score
+                ranked_sections = top_k.results()
+                
+                # Format to challenge1b output structure
+                result = self.output_formatter.format_challenge_output(
+                    query_data, ranked_sections
+                )
+                if cache_context is not None:
+                    self._record_collection(collection_path.name, result_cache='miss')
             
-            # Format to challenge1b output structure
-            result = self.output_formatter.format_challenge_output(
-                query_data, all_ranked_sections, all_sections
+            # Validate output schema once, in memory, before writing
+            output_errors = self.output_formatter.get_output_errors(result)
+            self._record_collection(
+                collection_path.name, output_valid=not output_errors, validation_errors=output_errors
             )
-            
-            # Validate output schema
-            if not self.output_formatter.validate_output_schema(result):
+            if output_errors:
                 self.logger.error(f"Generated output failed schema validation for {collection_path.name}")
+                for error in output_errors[:3]:  # Show first 3 errors
+                    self.logger.error(f"   - {error}")
                 return False
             
-            # Save output to collection folder
-            output_file = collection_path / self.settings.challenge_output_file
+            if cache_context is not None and cached is None:
+                # Near lookups need the resolved persona and task vector (both cached by the matcher)
+                resolved, vector = None, None
+                if self.result_cache.near_threshold is not None:
+                    resolved, vector = self._near_cache_key(job_role, search_query)
+                self.result_cache.store(cache_context, job_role, search_query, result, resolved, vector)
+            
+            # Save output to collection folder, or queue it for the batched bulk sink
+            output_file = self.settings.get_output_file(collection_path)
             
-            if not self.file_handler.save_json(result, output_file):
+            if self.settings.output_mode != 'files':
+                self._outputs[collection_path.name] = result
+            elif not (self.file_handler.ensure_directory(output_file.parent) and
+                      self.file_handler.save_json(result, output_file)):
                 self.logger.error(f"Failed to save output file: {output_file}")
                 return False
             
+            if self.corpus_store is not None:
+                self.corpus_store.save_ranking(
+                    collection_path.name, job_role, search_query,
+                    self.persona_matcher.embedding_generator.get_model_fingerprint(), result
+                )
+            
             processing_time = __import__('time').time() - start_time
             challenge_id = query_data.get('challenge_id', 'unknown')
             
@@ -195,17 +560,238 @@ class CollectionProcessor:
             if processing_time > self.settings.timeout_seconds:
                 self.logger.warning(f"Processing time {processing_time:.2f}s exceeds {self.settings.timeout_seconds}s limit")
             
+            self._record_collection(collection_path.name, success=True, processing_time=processing_time)
+            
             self.logger.info(f"   📊 Generated {len(result.get('extracted_sections', []))} extracted sections")
             self.logger.info(f"   📊 Generated {len(result.get('subsection_analysis', []))} subsection analyses")
             self.logger.info(f"   ⏱️  Processing time: {processing_time:.2f}s")
-            self.logger.info(f"   💾 Output saved: {self.settings.challenge_output_file}")
+            if self.settings.output_mode != 'files':
+                self.logger.info(f"   💾 Output queued for the {self.settings.output_mode} sink")
+            else:
+                self.logger.info(f"   💾 Output saved: {self.settings.challenge_output_file}")
             
             return True
             
         except Exception as e:
+            self._record_collection(collection_path.name, success=False, error=str(e))
             self.logger.error(f"Unexpected error processing {collection_path.name}: {str(e)}")
             return False
     
+    def _rank_documents(self, collection_path: Path, query_data: Dict) -> TopKAccumulator:
+        """Score every document of a collection and keep the best k sections"""
+        top_k = TopKAccumulator(self.settings.get_ranking_top_k())
+        job_role = query_data.get('job_role', '')
+        search_query = query_data.get('query', '')
+        filter_index = SectionFilterIndex(query_data.get('filters'))
+        
+        for doc_info in query_data.get('documents', []):
+            if not filter_index.allows_document(doc_info['name']):
+                continue
+            
+            # ✅ FIXED - Look for outline files in collection directory only
+            outline_filename = doc_info['outline_file']
+            outline_path = collection_path / outline_filename
+            
+            self.logger.debug("   Looking for outline: %s", outline_path, extra=SAMPLED)
+            
+            if self.manifest.has_file(collection_path, outline_filename):
+                try:
+                    # Load document outline (and cached embeddings, if stored)
+                    sections, embeddings, content_hash = self._load_document(collection_path, doc_info)
+                    
+                    if not sections:
+                        self.logger.warning(f"No sections found in {outline_filename}")
+                        continue
+                    
+                    # Add document metadata to each section (lazily for packed outlines)
+                    self.document_loader.apply_defaults(sections, {
+                        'document': doc_info['name'],
+                        'title': doc_info.get('title', doc_info['name']),
+                        'collection': collection_path.name
+                    })
+                    
+                    # Level/page filters: only the matching rows are embedded and scored
+                    rows = filter_index.rows(filter_index.add_document(doc_info['name'], sections))
+                    if rows is not None and not len(rows):
+                        continue
+                    
+                    # Score sections for this document and stream them into the top-k
+                    if embeddings is not None:
+                        self._add_embedded_document(
+                            top_k, sections, embeddings, job_role, search_query,
+                            (collection_path.name, doc_info['name'], content_hash), rows
+                        )
+                    elif rows is not None:
+                        scores = self.persona_matcher.score_sections(
+                            [sections[int(row)] for row in rows], job_role, search_query
+                        )
+                        top_k.add(sections, scores, rows=rows)
+                    else:
+                        scores = self.persona_matcher.score_sections(
+                            sections, job_role, search_query
+                        )
+                        top_k.add(sections, scores)
+                    
+                    self.logger.info("   ✅ Processed %d sections from %s", len(sections), doc_info['name'], extra=SAMPLED)
+                    
+                except Exception as e:
+                    self.logger.error(f"   ❌ Error processing document {doc_info['name']}: {str(e)}")
+                    continue
+            else:
+                self.logger.warning(f"   ⚠️  Outline not found: {outline_filename}")
+                continue
+        
+        return top_k
+    
+    def _result_cache_context(self, collection_path: Path, documents: List[Dict], filters: Dict = None) -> Optional[str]:
+        """Result cache key for the collection's documents (by scanned version) and ranking settings"""
+        if self.result_cache is None:
+            return None
+        
+        # (mtime_ns, size) from the scan, like outline packs: keying by content would
+        # read every outline here and again when a miss loads it
+        fingerprints = [(doc_info['name'], doc_info.get('title', doc_info['name']),
+                         self.manifest.stat(collection_path, doc_info['outline_file']))
+                        for doc_info in documents]
+        
+        model_fingerprint = self.persona_matcher.embedding_generator.get_model_fingerprint()
+        # Persona terms steer the ranking as much as the model does
+        persona_definitions = self.persona_matcher.persona_bank._definition_hash()
+        return self.result_cache.context_key(fingerprints, model_fingerprint, normalize_filters(filters),
+                                             persona_definitions)
+    
+    def _near_cache_key(self, job_role: str, search_query: str) -> Tuple[Optional[str], np.ndarray]:
+        """Resolved persona and task embedding; ranking depends on nothing else of the request"""
+        resolved = self.persona_matcher.persona_bank.resolve_role(job_role)
+        return resolved, self.persona_matcher.encode_query(search_query)
+    
+    def rerank_stored_collection(self, collection_name: str, query_data: Dict) -> Optional[Dict]:
+        """Re-rank a stored collection for a new persona/task without touching its files"""
+        if self.corpus_store is None:
+            self.logger.error("Corpus store is disabled (set CORPUS_STORE_ENABLED=true)")
+            return None
+        
+        model_fingerprint = self.persona_matcher.embedding_generator.get_model_fingerprint()
+        job_role = query_data.get('job_role', '')
+        search_query = query_data.get('query', '')
+        top_k = TopKAccumulator(self.settings.get_ranking_top_k())
+        filter_index = SectionFilterIndex(query_data.get('filters'))
+        
+        for doc_info in query_data.get('documents', []):
+            if not filter_index.allows_document(doc_info['name']):
+                continue
+            stored = self.corpus_store.get_document(collection_name, doc_info['name'])
+            if not stored:
+                self.logger.warning(f"   ⚠️  {doc_info['name']} not in corpus store for {collection_name}")
+                continue
+            
+            embeddings = self.corpus_store.load_codes(stored['id'], model_fingerprint)
+            if embeddings is None:
+                self.logger.warning(f"   ⚠️  No stored embeddings for {doc_info['name']} with this model")
+                continue
+            
+            sections = self.corpus_store.load_sections(stored['id'])
+            for section in sections:
+                section['document'] = doc_info['name']
+                section['title'] = doc_info.get('title', doc_info['name'])
+                section['collection'] = collection_name
+            
+            # Query embedding plus one matmul (or a pruned tree search) per document
+            rows = filter_index.rows(filter_index.add_document(doc_info['name'], sections))
+            self._add_embedded_document(
+                top_k, sections, embeddings, job_role, search_query,
+                (collection_name, doc_info['name'], stored['content_hash']), rows
+            )
+        
+        if not top_k.total_seen:
+            return None
+        
+        result = self.output_formatter.format_challenge_output(query_data, top_k.results())
+        self.corpus_store.save_ranking(collection_name, job_role, search_query, model_fingerprint, result)
+        return result
+    
+    def _add_embedded_document(self, top_k: TopKAccumulator, sections: List[Dict],
+                               embeddings: Union[np.ndarray, EncodedVectors],
+                               job_role: str, search_query: str, tree_key: Tuple, rows: np.ndarray = None):
+        """Score a document with stored embeddings (or codec codes) into the top-k, by tree search when it is large.
+        
+        `rows` (level/page filters) restricts either path to the matching sections.
+        """
+        if not self.settings.outline_tree_enabled or len(sections) < self.settings.outline_tree_min_sections:
+            if rows is not None:
+                top_k.add(sections, self._score_stored(embeddings[rows], job_role, search_query), rows=rows)
+            else:
+                top_k.add(sections, self._score_stored(embeddings, job_role, search_query))
+            return
+        
+        # Trees depend only on the document, so they are reused across personas and tasks
+        tree = self._outline_trees.get(tree_key)
+        if tree is None:
+            # Tree centroids are float32, so codes are decoded once per cached tree
+            if isinstance(embeddings, EncodedVectors):
+                embeddings = embeddings.decode()
+            tree = OutlineTreeIndex(sections, embeddings, self.settings.outline_tree_branching)
+            self._outline_trees[tree_key] = tree
+            if len(self._outline_trees) > self.settings.outline_tree_cache_size:
+                self._outline_trees.popitem(last=False)
+        else:
+            self._outline_trees.move_to_end(tree_key)
+        
+        weights = self.persona_matcher.get_weight_vector(job_role, search_query)
+        rows, scores = tree.search(weights, top_k.k, floor=top_k.floor(), rows=rows)
+        top_k.add(sections, scores, rows=rows)
+        self.logger.debug("   Tree search scored %d of %d sections", tree.last_stats['scored'], len(sections), extra=SAMPLED)
+    
+    def _score_stored(self, embeddings: Union[np.ndarray, EncodedVectors], job_role: str, search_query: str) -> np.ndarray:
+        """Scores of stored vectors; codec codes are scored against the weight vector without decoding"""
+        if isinstance(embeddings, EncodedVectors):
+            return embeddings.score(self.persona_matcher.get_weight_vector(job_role, search_query))
+        return self.persona_matcher.score_embeddings(embeddings, job_role, search_query)
+    
+    def _load_document(self, collection_path: Path,
+                       doc_info: Dict) -> Tuple[List[Dict], Optional[Union[np.ndarray, EncodedVectors]], Optional[str]]:
+        """Load a document's sections (plus stored embeddings and content hash when the corpus store is on)"""
+        outline_path = collection_path / doc_info['outline_file']
+        
+        if self.corpus_store is None:
+            return self.document_loader.load_sections(outline_path), None, None
+        
+        model_fingerprint = self.persona_matcher.embedding_generator.get_model_fingerprint()
+        # Hashing reads the outline; the bytes are kept in case it has to be parsed
+        raw = None if self.manifest.has_digest(outline_path) else self.manifest.read_bytes(outline_path)
+        content_hash = self.manifest.content_hash(outline_path)
+        stored = self.corpus_store.get_document(collection_path.name, doc_info['name'])
+        
+        if stored and stored['content_hash'] == content_hash:
+            # Unchanged outline: no parse, and no encode if this model already embedded it
+            sections = self.corpus_store.load_sections(stored['id'])
+            embeddings = None
+            if self.shared_arena is not None:
+                embeddings = self.shared_arena.get(self._arena_key(collection_path.name, doc_info['name'], content_hash))
+            if embeddings is None:
+                embeddings = self.corpus_store.load_codes(stored['id'], model_fingerprint)
+            if embeddings is None and sections:
+                embeddings = self.persona_matcher.embed_sections(sections)
+                self.corpus_store.save_embeddings(stored['id'], model_fingerprint, embeddings)
+            return sections, embeddings, content_hash
+        
+        # New or modified outline: parse once, then store sections and embeddings
+        if raw is None:
+            raw = self.manifest.read_bytes(outline_path)
+        sections = self.file_handler.parse_json_bytes(raw, outline_path).get('outline', [])
+        document_id = self.corpus_store.upsert_document(
+            collection_path.name, doc_info['name'], doc_info.get('title', doc_info['name']),
+            content_hash, sections
+        )
+        
+        if not sections:
+            return sections, None, content_hash
+        
+        embeddings = self.persona_matcher.embed_sections(sections)
+        self.corpus_store.save_embeddings(document_id, model_fingerprint, embeddings)
+        self.logger.debug("   Stored %d sections for %s", len(sections), doc_info['name'], extra=SAMPLED)
+        return sections, embeddings, content_hash
+    
     def validate_collection_structure(self, collection_path: Path) -> bool:
         """Validate that collection has required structure"""
         required_files = [
@@ -213,15 +799,21 @@ class CollectionProcessor:
         ]
         
         for filename in required_files:
-            if not (collection_path / filename).exists():
+            if not self.manifest.has_file(collection_path, filename):
                 self.logger.error(f"Missing required file in {collection_path.name}: {filename}")
                 return False
         
         return True
     
-    def get_collection_stats(self) -> Dict:
+    def _has_output(self, collection_path: Path) -> bool:
+        output_file = self.settings.get_output_file(collection_path)
+        if output_file.parent == collection_path:
+            return self.manifest.has_file(collection_path, output_file.name)
+        return output_file.exists()
+    
+    def get_collection_stats(self, root_path: Path = None) -> Dict:
         """Get statistics about available collections"""
-        collections_dir = self.settings.get_collections_path()
+        collections_dir = root_path or self.settings.get_collections_path()
         collections = self.discover_collections(collections_dir)
         
         stats = {
@@ -231,14 +823,13 @@ class CollectionProcessor:
         
         for collection_path in collections:
             try:
-                input_file = collection_path / self.settings.challenge_input_file
-                challenge_input = self.input_handler.load_challenge_input(input_file)
+                challenge_input = self.manifest.challenge_input(collection_path)
                 documents = challenge_input.get('documents', [])
                 
                 collection_stats = {
                     'name': collection_path.name,
                     'document_count': len(documents),
-                    'has_output': (collection_path / self.settings.challenge_output_file).exists(),
+                    'has_output': self._has_output(collection_path),
                     'persona': challenge_input.get('persona', {}).get('role', 'Unknown')
                 }
                 stats['collections'].append(collection_stats)
@@ -247,3 +838,24 @@ class CollectionProcessor:
                 self.logger.error(f"Error getting stats for {collection_path.name}: {str(e)}")
         
         return stats
+
+# Per-process state for collection workers
+_worker_processor = None
+
+def _init_collection_worker(plan: Dict, worker_slots, arena_descriptor: Optional[Dict] = None, forked: bool = False,
+                            output_dir: Optional[str] = None):
+    """Worker initializer: apply this worker's slice of the plan, then load the model once
+    (forked workers already hold the parent's processor)"""
+    global _worker_processor
+    if forked:
+        _worker_processor.reinit_after_fork()
+    worker_index = worker_slots.get()
+    ExecutionPlanner().apply_plan(plan, worker_index)
+    
+    if not forked:
+        arena = SharedVectorArena.attach(arena_descriptor) if arena_descriptor else None
+        _worker_processor = CollectionProcessor(shared_arena=arena, output_dir=output_dir)
+
+def _run_collection_in_worker(collection_path: Path) -> Tuple[bool, Dict]:
+    """Process one collection inside a worker process"""
+    return _worker_processor.run_collection(collection_path)
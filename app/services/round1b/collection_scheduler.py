@@ -0,0 +1,244 @@
+﻿"""
+Cost-model-driven ordering of collections across workers (LPT or EDF)
+"""
+
+import heapq
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.settings import Settings
+from services.round1b.challenge1b_input_handler import Challenge1BInputHandler
+from services.round1b.collection_manifest import CollectionManifest
+from utils.execution_planner import ExecutionPlanner
+from utils.file_handler import FileHandler
+from utils.logger import setup_logger
+
+SCHEDULE_MODES = ('lpt', 'edf', 'fifo')
+
+# Outline JSON averages about 120 bytes per heading entry and 15 bytes per
+# WordPiece token of heading text (keys, levels and pages included), so the
+# scanned file size stands in for the outline itself without reading it
+OUTLINE_BYTES_PER_SECTION = 120
+OUTLINE_BYTES_PER_TOKEN = 15
+
+class CollectionScheduler:
+    """Predicts each collection's processing time and orders the batch accordingly.
+    
+    The cost model is seconds = overhead + tokens / tokens_per_second, fitted by
+    least squares over previous runs on this host shape and persisted next to the
+    calibrated execution plan. Workers pull collections in submission order, so
+    submitting longest-predicted first gives the greedy LPT packing; EDF orders
+    by deadline (input arrival plus the per-collection time limit) instead.
+    """
+    
+    def __init__(self, mode: str = None):
+        self.logger = setup_logger(__name__)
+        self.settings = Settings()
+        self.file_handler = FileHandler()
+        self.input_handler = Challenge1BInputHandler()
+        self.mode = (mode or self.settings.schedule_mode).lower()
+        if self.mode not in SCHEDULE_MODES:
+            raise ValueError(f"Unknown schedule mode '{self.mode}' (expected one of {', '.join(SCHEDULE_MODES)})")
+        
+        self.host = ExecutionPlanner().host_fingerprint()
+        self.model = self.load_model()
+        self._fit()  # models saved by older fits are corrected before the first schedule
+    
+    # ---- cost model -------------------------------------------------------------
+    
+    def _model_file(self) -> Path:
+        return self.settings.get_logs_path() / self.settings.schedule_model_file
+    
+    def load_model(self) -> Dict:
+        """Fitted model and recent observations for this host (defaults until runs are recorded)"""
+        model = {
+            'overhead_seconds': self.settings.schedule_default_overhead,
+            'tokens_per_second': self.settings.schedule_default_tokens_per_second,
+            'observations': []
+        }
+        try:
+            if self._model_file().exists():
+                model.update(self.file_handler.load_json(self._model_file()).get(self.host, {}))
+        except Exception as e:
+            self.logger.warning(f'Could not read schedule model: {str(e)}')
+        return model
+    
+    def save_model(self):
+        """Persist this host's model, keeping other hosts' entries"""
+        models = {}
+        try:
+            if self._model_file().exists():
+                models = self.file_handler.load_json(self._model_file())
+        except Exception:
+            models = {}
+        models[self.host] = self.model
+        self._model_file().parent.mkdir(parents=True, exist_ok=True)
+        self.file_handler.save_json(models, self._model_file())
+    
+    def estimate(self, collection_path: Path, manifest: Optional[CollectionManifest] = None) -> Dict:
+        """Cheap features (documents, sections, tokens) from file sizes, and the predicted seconds"""
+        features = {'documents': 0, 'sections': 0, 'tokens': 0}
+        try:
+            if manifest is not None:
+                documents = manifest.query_data(collection_path).get('documents', [])
+            else:
+                challenge_input = self.input_handler.load_challenge_input(collection_path / self.settings.challenge_input_file)
+                documents = self.input_handler.convert_to_internal_format(challenge_input).get('documents', [])
+            features['documents'] = len(documents)
+            for doc_info in documents:
+                outline_path = collection_path / doc_info['outline_file']
+                if manifest is not None:
+                    scanned = manifest.stat(outline_path.parent, outline_path.name)
+                    if scanned is None:
+                        continue
+                    size = scanned[1]
+                else:
+                    try:
+                        size = outline_path.stat().st_size
+                    except OSError:
+                        continue
+                features['sections'] += size // OUTLINE_BYTES_PER_SECTION
+                features['tokens'] += size // OUTLINE_BYTES_PER_TOKEN
+        except Exception as e:
+            self.logger.debug(f'Could not estimate {collection_path.name}: {str(e)}')
+        
+        features['predicted_seconds'] = self.predict(features['tokens'])
+        return features
+    
+    def predict(self, tokens: int) -> float:
+        return self.model['overhead_seconds'] + tokens / max(self.model['tokens_per_second'], 1e-9)
+    
+    def deadline(self, collection_path: Path, now: float, manifest: Optional[CollectionManifest] = None) -> float:
+        """Arrival of the collection's input plus the per-collection time limit.
+        
+        Inputs that landed before this run count as arriving now, so a backlog
+        of old collections is not reported as late before it starts.
+        """
+        scanned = manifest.stat(collection_path, self.settings.challenge_input_file) if manifest else None
+        try:
+            arrival = scanned[0] / 1e9 if scanned else (collection_path / self.settings.challenge_input_file).stat().st_mtime
+        except OSError:
+            arrival = now
+        return max(arrival, now) + self.settings.timeout_seconds
+    
+    # ---- scheduling -------------------------------------------------------------
+    
+    def schedule(self, collections: List[Path], workers: int, manifest: Optional[CollectionManifest] = None) -> Dict:
+        """Submission order plus the predicted per-worker packing and makespan"""
+        now = time.time()
+        estimates = {path: self.estimate(path, manifest) for path in collections}
+        deadlines = {path: self.deadline(path, now, manifest) for path in collections}
+        if self.mode == 'lpt':
+            order = sorted(collections, key=lambda path: -estimates[path]['predicted_seconds'])
+        elif self.mode == 'edf':
+            order = sorted(collections, key=lambda path: deadlines[path])
+        else:
+            order = list(collections)
+        
+        # Simulate workers taking the next collection as they free up
+        workers = max(1, workers)
+        loads = [(0.0, worker) for worker in range(workers)]
+        assignment, predicted_finish = {}, {}
+        for path in order:
+            load, worker = heapq.heappop(loads)
+            load += estimates[path]['predicted_seconds']
+            assignment[path.name] = worker
+            predicted_finish[path.name] = load
+            heapq.heappush(loads, (load, worker))
+        
+        # Collections predicted to finish after their deadline
+        late = [path.name for path in order if now + predicted_finish[path.name] > deadlines[path]]
+        
+        schedule = {
+            'mode': self.mode,
+            'workers': workers,
+            'order': order,
+            'estimates': {path.name: estimates[path] for path in collections},
+            'assignment': assignment,
+            'predicted_finish': predicted_finish,
+            'predicted_makespan': max(load for load, _ in loads) if order else 0.0,
+            'predicted_late': late
+        }
+        self.logger.info(
+            f"📅 Schedule ({self.mode}): {len(order)} collection(s) on {workers} worker(s), "
+            f"predicted makespan {schedule['predicted_makespan']:.2f}s"
+        )
+        if late:
+            self.logger.warning(f"⚠️ Predicted to miss their deadline: {', '.join(late)}")
+        return schedule
+    
+    def record(self, schedule: Dict, run_entries: Dict[str, Dict], wall_seconds: float) -> Dict:
+        """Compare predictions with actual times, refit the model and return the report"""
+        collections = {}
+        for name, estimate in schedule['estimates'].items():
+            entry = run_entries.get(name, {})
+            actual = entry.get('processing_time')
+            collections[name] = {
+                'predicted_seconds': round(estimate['predicted_seconds'], 3),
+                'actual_seconds': round(actual, 3) if actual is not None else None,
+                'tokens': estimate['tokens'],
+                'worker': schedule['assignment'].get(name)
+            }
+            # Cache hits and failures say nothing about ranking throughput
+            if actual is not None and entry.get('success') and entry.get('result_cache') not in ('exact', 'near'):
+                self.model['observations'].append([estimate['tokens'], actual])
+        
+        self.model['observations'] = self.model['observations'][-self.settings.schedule_history_size:]
+        self._fit()
+        try:
+            self.save_model()
+        except Exception as e:
+            self.logger.warning(f'Could not save schedule model: {str(e)}')
+        
+        errors = [abs(c['predicted_seconds'] - c['actual_seconds']) for c in collections.values()
+                  if c['actual_seconds'] is not None]
+        report = {
+            'mode': schedule['mode'],
+            'predicted_makespan': round(schedule['predicted_makespan'], 3),
+            'actual_makespan': round(wall_seconds, 3),
+            'mean_abs_error_seconds': round(float(np.mean(errors)), 3) if errors else None,
+            'predicted_late': schedule['predicted_late'],
+            'model': {key: round(self.model[key], 4) for key in ('overhead_seconds', 'tokens_per_second')},
+            'collections': collections
+        }
+        self.logger.info(
+            f"📅 Makespan predicted {report['predicted_makespan']:.2f}s, actual {report['actual_makespan']:.2f}s; "
+            f"model now {self.model['overhead_seconds']:.2f}s + tokens / {self.model['tokens_per_second']:.0f}/s"
+        )
+        return report
+    
+    def _fit(self):
+        """Overhead and throughput over the recorded observations, both kept non-negative.
+        
+        The two-parameter fit only runs once token counts spread enough to separate
+        overhead from per-token cost; otherwise, or when least squares puts the
+        overhead below zero, the line is refitted through the origin.
+        """
+        observations = np.asarray(self.model['observations'], dtype=np.float64).reshape(-1, 2)
+        observations = observations[observations[:, 0] > 0]
+        if not len(observations):
+            return
+        tokens, seconds = observations[:, 0], observations[:, 1]
+        
+        if len(observations) >= 2 and np.ptp(tokens) / tokens.mean() >= self.settings.schedule_min_token_spread:
+            design = np.column_stack([np.ones(len(observations)), tokens])
+            (overhead, seconds_per_token), *_ = np.linalg.lstsq(design, seconds, rcond=None)
+            if overhead > 0 and seconds_per_token > 0:
+                self.model['overhead_seconds'] = float(overhead)
+                self.model['tokens_per_second'] = float(1.0 / seconds_per_token)
+                return
+        else:
+            # Overhead and throughput are not separable yet: keep the overhead if it fits
+            net = seconds.sum() - len(observations) * self.model['overhead_seconds']
+            if net > 0:
+                self.model['tokens_per_second'] = float(tokens.sum() / net)
+                return
+        
+        # Through the origin: seconds_per_token = sum(t * s) / sum(t^2)
+        seconds_per_token = float(np.dot(tokens, seconds) / np.dot(tokens, tokens))
+        if seconds_per_token > 0:
+            self.model['overhead_seconds'] = 0.0
+            self.model['tokens_per_second'] = 1.0 / seconds_per_token
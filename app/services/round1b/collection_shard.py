@@ -0,0 +1,231 @@
+﻿"""
+On-disk per-collection shard (section embeddings or codec codes + metadata) and its top-k scan
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.round1b.section_filter_index import SectionFilterIndex
+from services.round1b.vector_codecs import get_codec, load_codec, save_codec
+
+EMBEDDINGS_FILE = 'embeddings.npy'
+CODES_FILE = 'codes.npy'
+CODEC_FILE = 'codec.npz'
+SECTIONS_FILE = 'sections.jsonl'
+OFFSETS_FILE = 'offsets.npy'
+LEVELS_FILE = 'levels.npy'
+PAGES_FILE = 'pages.npy'
+MANIFEST_FILE = 'manifest.json'
+
+# Bumped when the shard layout changes, so older shards are rebuilt
+SHARD_FORMAT = 2
+
+# Section fields kept in a shard (enough to format a result without the outline)
+SECTION_FIELDS = ('document', 'title', 'collection', 'text', 'level', 'page')
+
+def read_manifest(shard_dir: Path) -> Optional[Dict]:
+    """Manifest of a complete shard, or None (missing or half-written)"""
+    try:
+        with open(Path(shard_dir) / MANIFEST_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_shard(shard_dir: Path, sections: Sequence[Dict], embeddings: np.ndarray, manifest: Dict,
+                codec_name: str = 'float32', exact_rescore: bool = True):
+    """Write a shard into a temp directory, then swap it in; the manifest marks it complete.
+    
+    With a compressed codec the scan reads only its codes; the float32 vectors
+    are kept next to them for the final rescore when exact_rescore is set.
+    Level codes and pages are stored as columns, with the level table and each
+    document's row range in the manifest, so filtered scans never parse sections.
+    """
+    shard_dir = Path(shard_dir)
+    temp_dir = shard_dir.with_name(f'{shard_dir.name}.{os.getpid()}.tmp')
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if codec_name == 'float32' or exact_rescore:
+        np.save(temp_dir / EMBEDDINGS_FILE, embeddings)
+    if codec_name != 'float32':
+        codec = get_codec(codec_name)
+        codes = codec.fit(embeddings).encode(embeddings) if len(embeddings) else \
+            np.zeros((0, embeddings.shape[1]), dtype=codec.code_dtype)
+        np.save(temp_dir / CODES_FILE, np.ascontiguousarray(codes))
+        if len(embeddings):
+            save_codec(codec, temp_dir / CODEC_FILE)
+    
+    # One JSON line per section plus byte offsets, so a search reads only its hits
+    offsets = np.zeros(len(sections) + 1, dtype=np.uint64)
+    with open(temp_dir / SECTIONS_FILE, 'wb') as f:
+        for i, section in enumerate(sections):
+            line = json.dumps({key: section.get(key) for key in SECTION_FIELDS}, ensure_ascii=False).encode('utf-8')
+            f.write(line + b'\n')
+            offsets[i + 1] = offsets[i] + len(line) + 1
+    np.save(temp_dir / OFFSETS_FILE, offsets)
+    
+    # Filter columns; a document's sections are consecutive rows
+    level_table: List = []
+    level_codes = np.zeros(len(sections), dtype=np.uint8)
+    pages = np.zeros(len(sections), dtype=np.int32)
+    document_rows: List[List] = []
+    for i, section in enumerate(sections):
+        if section.get('level') not in level_table:
+            level_table.append(section.get('level'))
+        level_codes[i] = level_table.index(section.get('level'))
+        pages[i] = 1 if section.get('page') is None else section['page']
+        if not document_rows or document_rows[-1][0] != section.get('document'):
+            document_rows.append([section.get('document'), i, i])
+        document_rows[-1][2] = i + 1
+    np.save(temp_dir / LEVELS_FILE, level_codes)
+    np.save(temp_dir / PAGES_FILE, pages)
+    
+    with open(temp_dir / MANIFEST_FILE, 'w', encoding='utf-8') as f:
+        json.dump({**manifest, 'sections': len(sections), 'levels': level_table, 'document_rows': document_rows},
+                  f, indent=4, ensure_ascii=False)
+    
+    backup_dir = shard_dir.with_name(f'{shard_dir.name}.{os.getpid()}.old')
+    if shard_dir.exists():
+        os.replace(shard_dir, backup_dir)
+    os.replace(temp_dir, shard_dir)
+    shutil.rmtree(backup_dir, ignore_errors=True)
+
+def read_sections(shard_dir: Path, rows: Sequence[int]) -> List[Dict]:
+    """Metadata of selected rows only, by seeking to their offsets"""
+    shard_dir = Path(shard_dir)
+    offsets = np.load(shard_dir / OFFSETS_FILE, mmap_mode='r')
+    sections = []
+    with open(shard_dir / SECTIONS_FILE, 'rb') as f:
+        for row in rows:
+            start, end = int(offsets[row]), int(offsets[row + 1])
+            f.seek(start)
+            sections.append(json.loads(f.read(end - start)))
+    return sections
+
+def result_key(section: Dict) -> Optional[Tuple]:
+    """Duplicate key of the per-collection output rule; None for sections without a title"""
+    title = (section.get('text') or '').strip()
+    if not title:
+        return None
+    return section.get('collection'), section.get('document'), title, section.get('page') or 1
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, k: int):
+    """k best (rows, scores); ties at the cut go to the lowest rows so results are deterministic"""
+    kth = np.partition(-scores, k - 1)[k - 1]
+    above = -scores < kth
+    tied = np.flatnonzero(-scores == kth)
+    tied = tied[np.argsort(rows[tied], kind='stable')][:k - int(above.sum())]
+    keep = np.concatenate([np.flatnonzero(above), tied])
+    return rows[keep], scores[keep]
+
+def _filtered_rows(shard_dir: Path, manifest: Dict, filters: Dict) -> np.ndarray:
+    """Sorted rows of the shard that pass level/page/document filters, from its columns"""
+    index = SectionFilterIndex(filters)
+    level_codes = np.load(shard_dir / LEVELS_FILE, mmap_mode='r')
+    pages = np.load(shard_dir / PAGES_FILE, mmap_mode='r')
+    rows = [np.zeros(0, dtype=np.int64)]
+    for name, start, stop in manifest.get('document_rows', []):
+        if not index.allows_document(name):
+            continue
+        document_id = index.add_columns(name, manifest['levels'], level_codes[start:stop], pages[start:stop])
+        rows.append(start + index.rows(document_id))
+    return np.concatenate(rows)
+
+def _scan(score_block: Callable[[int, int], np.ndarray], count: int, k: int, block_rows: int,
+          selected: np.ndarray = None):
+    """k best (rows, scores) of a shard, best first; ties by row so results are deterministic.
+    
+    With `selected`, blocks are positions in that row list rather than in the shard.
+    """
+    best_rows = np.zeros(0, dtype=np.int64)
+    best_scores = np.zeros(0, dtype=np.float32)
+    for block_start in range(0, count, block_rows):
+        block_scores = score_block(block_start, min(count, block_start + block_rows))
+        rows = np.arange(block_start, block_start + len(block_scores))
+        if selected is not None:
+            rows = selected[rows]
+        best_rows = np.concatenate([best_rows, rows])
+        best_scores = np.concatenate([best_scores, block_scores])
+        if len(best_scores) > k:
+            best_rows, best_scores = _top_k(best_rows, best_scores, k)
+    
+    order = np.lexsort((best_rows, -best_scores))
+    return best_rows[order], best_scores[order]
+
+def search_shard(shard_dir: str, weights: np.ndarray, k: int, block_rows: int = 65536,
+                 rescore_factor: int = 4, filters: Dict = None) -> Dict:
+    """Top-k distinct titled sections of one shard by embeddings @ weights, with the scan latency.
+    
+    Embeddings (or the codec's codes) are memory-mapped and scored block by block,
+    so resident memory per shard stays bounded by the block size however large
+    the shard is. Coded shards that kept their float32 vectors fetch
+    rescore_factor candidates per row wanted and re-score only those exactly.
+    Untitled and duplicate sections are dropped here, before the cut to k, and
+    the scan is repeated with twice the depth while that leaves fewer than k,
+    so the merged federated result is never short because of them. Filters
+    (the input's "filters" object) select rows from the shard's level and page
+    columns, and only those rows are scored.
+    Module-level so process pools can run it without loading the model.
+    """
+    start = time.perf_counter()
+    shard_dir = Path(shard_dir)
+    result = {'shard': shard_dir.parent.name, 'hits': [], 'sections': 0}
+    try:
+        weights = np.asarray(weights, dtype=np.float32)
+        manifest = read_manifest(shard_dir) or {}
+        exact = None
+        if manifest.get('codec', 'float32') == 'float32':
+            vectors = np.load(shard_dir / EMBEDDINGS_FILE, mmap_mode='r')
+            score_vectors = lambda block: block @ weights
+        else:
+            vectors = np.load(shard_dir / CODES_FILE, mmap_mode='r')
+            codec = load_codec(shard_dir / CODEC_FILE) if len(vectors) else None
+            score_vectors = lambda block: codec.score(block, weights)
+            if manifest.get('exact_rescore') and (shard_dir / EMBEDDINGS_FILE).exists():
+                exact = np.load(shard_dir / EMBEDDINGS_FILE, mmap_mode='r')
+        result['sections'] = len(vectors)
+        
+        selected = _filtered_rows(shard_dir, manifest, filters) if SectionFilterIndex(filters).active else None
+        if selected is None:
+            count = len(vectors)
+            score_block = lambda start, stop: score_vectors(np.asarray(vectors[start:stop]))
+        else:
+            count = len(selected)
+            score_block = lambda start, stop: score_vectors(np.asarray(vectors[selected[start:stop]]))
+        
+        depth = k
+        while True:
+            if exact is None:
+                best_rows, best_scores = _scan(score_block, count, depth, block_rows, selected)
+            else:
+                # Over-fetch on codes, then exact scores for the candidates only (rows read in order)
+                candidates, _ = _scan(score_block, count, min(count, depth * rescore_factor), block_rows, selected)
+                candidates = np.sort(candidates)
+                exact_scores = np.asarray(exact[candidates], dtype=np.float32) @ weights
+                order = np.lexsort((candidates, -exact_scores))
+                best_rows, best_scores = candidates[order], exact_scores[order]
+            hits, seen = [], set()
+            for row, score, section in zip(best_rows, best_scores, read_sections(shard_dir, best_rows)):
+                key = result_key(section)
+                if key is None or key in seen:
+                    continue
+                seen.add(key)
+                hits.append({'row': int(row), 'score': float(score), 'section': section})
+                if len(hits) == k:
+                    break
+            if len(hits) == k or depth >= count:
+                break
+            depth = min(count, depth * 2)
+        result['hits'] = hits
+    except Exception as e:
+        result['error'] = str(e)
+    
+    result['latency_ms'] = 1000.0 * (time.perf_counter() - start)
+    return result
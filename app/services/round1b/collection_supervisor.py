@@ -0,0 +1,231 @@
+﻿"""
+Supervised collection execution: worker processes under a watchdog with hard time and memory limits
+"""
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.settings import Settings
+from services.round1b.embedding_generator import encoder_has_run
+from utils.execution_planner import ExecutionPlanner
+from utils.logger import setup_logger, stop_logging
+
+# First message of every worker, sent once its model is loaded
+WORKER_READY = 'ready'
+
+def fork_available() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def _pss_mb(pid: int) -> Optional[float]:
+    """Proportional set size of a process: shared (copy-on-write) pages count 1/n per sharer.
+    
+    Falls back to resident minus shared pages where smaps_rollup is missing,
+    and to None where /proc is not available at all.
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            _, resident, shared = (int(value) for value in f.read().split()[:3])
+        return (resident - shared) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
+
+class CollectionSupervisor:
+    """Runs collections one at a time per worker and kills workers that overrun.
+    
+    Workers are forked from the processor that already holds the model, so a
+    worker starts in milliseconds with the weights shared copy-on-write, and
+    stays up for as many collections as it completes. Forking is only safe
+    while this process has not run the model (torch's thread pools do not
+    survive fork); once it has, e.g. after building the persona bank, workers
+    are spawned and load their own model instead. A worker only gets a
+    collection after reporting ready, so model loading never counts against
+    the time limit.
+    
+    The parent only dispatches and waits: results are picked up as soon as
+    they arrive, and between results a watchdog checks each busy worker's wall
+    clock against supervisor_timeout_seconds and its PSS against the per-worker
+    memory budget. A worker over either limit, or one that dies, is killed and
+    replaced, its collection is reported as failed and the batch carries on.
+    """
+    
+    def __init__(self, processor, plan: Dict):
+        self.logger = setup_logger(__name__)
+        self.settings = Settings()
+        self.processor = processor
+        self.plan = plan
+        self.memory_mb = self.settings.supervisor_memory_mb or \
+            ExecutionPlanner().worker_memory_budget_mb(plan['workers'])
+        
+        if not fork_available():
+            self.start_method = 'spawn'
+        elif encoder_has_run():
+            self.start_method = 'spawn'
+            self.logger.warning("⚠️ The model already ran in this process; spawning supervised workers instead of forking")
+        else:
+            self.start_method = 'fork'
+        self.context = multiprocessing.get_context(self.start_method)
+        
+        self.workers: List[Dict] = []
+        self.failures: List[Dict] = []
+        self.respawned = 0
+    
+    def _spawn(self, slot: int) -> Dict:
+        """Start a worker for a CPU slot of the plan"""
+        parent_conn, child_conn = self.context.Pipe()
+        # Forked workers inherit the loaded processor; spawned ones build their own
+        processor = self.processor if self.start_method == 'fork' else None
+        process = self.context.Process(
+            target=_supervised_worker,
+            args=(processor, self.plan, slot, child_conn, self.processor.settings.output_dir),
+            name=f'collection-worker-{slot}',
+            daemon=True
+        )
+        process.start()
+        # Only the child keeps its end, so a dead worker reads as EOF here
+        child_conn.close()
+        return {'slot': slot, 'process': process, 'conn': parent_conn, 'ready': False,
+                'collection': None, 'started': None}
+    
+    def _stop(self, worker: Dict):
+        if worker['process'].is_alive():
+            worker['process'].kill()
+        worker['process'].join()
+        worker['conn'].close()
+    
+    def _replace(self, worker: Dict, reason: str, detail: str) -> Tuple[Path, Tuple[bool, Dict]]:
+        """Kill a worker, start its replacement and report its collection as failed"""
+        collection_path = worker['collection']
+        elapsed = time.monotonic() - worker['started']
+        self._stop(worker)
+        
+        self.workers[self.workers.index(worker)] = self._spawn(worker['slot'])
+        self.respawned += 1
+        
+        failure = {'collection': collection_path.name, 'reason': reason, 'detail': detail,
+                   'elapsed_seconds': round(elapsed, 3)}
+        self.failures.append(failure)
+        self.logger.error(f"🛑 Worker on {collection_path.name} stopped ({reason}): {detail}; started a fresh worker")
+        return collection_path, (False, {'success': False, 'error': f'{reason}: {detail}', 'supervisor': failure})
+    
+    def _check(self, worker: Dict) -> Optional[Tuple[str, str]]:
+        """(reason, detail) when a busy worker has to go, else None"""
+        if not worker['process'].is_alive():
+            return 'crashed', f"worker exited with code {worker['process'].exitcode}"
+        elapsed = time.monotonic() - worker['started']
+        if elapsed > self.settings.supervisor_timeout_seconds:
+            return 'timeout', f'{elapsed:.1f}s exceeds the {self.settings.supervisor_timeout_seconds:.0f}s hard limit'
+        pss = _pss_mb(worker['process'].pid)
+        if pss is not None and pss > self.memory_mb:
+            return 'memory', f'{pss:.0f} MB proportional set size exceeds the {self.memory_mb} MB per-worker budget'
+        return None
+    
+    def run(self, collections: List[Path]) -> Iterator[Tuple[Path, Tuple[bool, Dict]]]:
+        """Yield (collection, (success, record)) as collections finish or are killed"""
+        pending = deque(collections)
+        self.workers = [self._spawn(slot) for slot in range(max(1, min(self.plan['workers'], len(collections))))]
+        
+        try:
+            while True:
+                for worker in self.workers:
+                    if worker['ready'] and worker['collection'] is None and pending:
+                        worker['collection'], worker['started'] = pending.popleft(), time.monotonic()
+                        worker['conn'].send(worker['collection'])
+                
+                if not self.workers:
+                    # Not a single worker could start; nothing left to run them on
+                    while pending:
+                        collection_path = pending.popleft()
+                        yield collection_path, (False, {'success': False, 'error': 'no collection worker could start'})
+                    break
+                watched = [worker for worker in self.workers if not worker['ready'] or worker['collection'] is not None]
+                if not pending and not any(worker['collection'] is not None for worker in watched):
+                    break
+                
+                ready = wait([worker['conn'] for worker in watched], timeout=self.settings.supervisor_poll_seconds)
+                for worker in watched:
+                    if worker['conn'] in ready:
+                        try:
+                            message = worker['conn'].recv()
+                        except (EOFError, OSError):
+                            worker['process'].join(1.0)
+                            detail = f"worker exited with code {worker['process'].exitcode}"
+                            if worker['collection'] is not None:
+                                yield self._replace(worker, 'crashed', detail)
+                            else:
+                                # Died while loading: replacing it would most likely fail the same way
+                                self.logger.error(f"🛑 Collection worker failed to start ({detail})")
+                                self._stop(worker)
+                                self.workers.remove(worker)
+                            continue
+                        if message == WORKER_READY:
+                            worker['ready'] = True
+                            continue
+                        collection_path, worker['collection'] = worker['collection'], None
+                        yield collection_path, message
+                    elif worker['collection'] is not None:
+                        problem = self._check(worker)
+                        if problem is not None:
+                            yield self._replace(worker, *problem)
+        finally:
+            self.close()
+    
+    def close(self):
+        """Let idle workers exit, kill any still busy (the caller stopped early)"""
+        for worker in self.workers:
+            if worker['collection'] is not None:
+                worker['process'].kill()
+                continue
+            try:
+                worker['conn'].send(None)
+            except OSError:
+                pass
+        deadline = time.monotonic() + 5.0
+        for worker in self.workers:
+            worker['process'].join(max(0.0, deadline - time.monotonic()))
+            self._stop(worker)
+        self.workers = []
+    
+    def report(self) -> Dict:
+        """Supervisor section of the run report"""
+        return {
+            'start_method': self.start_method,
+            'timeout_seconds': self.settings.supervisor_timeout_seconds,
+            'memory_mb': self.memory_mb,
+            'killed': len(self.failures),
+            'respawned': self.respawned,
+            'failures': self.failures
+        }
+
+def _supervised_worker(processor, plan: Dict, slot: int, conn, output_dir: Optional[str] = None):
+    """Worker loop: run collections sent by the supervisor until told to stop"""
+    if processor is not None:
+        processor.reinit_after_fork()
+    ExecutionPlanner().apply_plan(plan, slot)
+    if processor is None:
+        # Imported here: the processor module imports this one
+        from services.round1b.collection_processor import CollectionProcessor
+        processor = CollectionProcessor(output_dir=output_dir)
+    
+    try:
+        conn.send(WORKER_READY)
+        while True:
+            collection_path = conn.recv()
+            if collection_path is None:
+                break
+            conn.send(processor.run_collection(collection_path))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        stop_logging()
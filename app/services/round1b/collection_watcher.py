@@ -0,0 +1,157 @@
+﻿"""
+Watch mode: keep the model warm and process collections as their files land
+"""
+
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Optional, Tuple
+
+from config.settings import Settings
+from services.round1b.collection_processor import CollectionProcessor
+from utils.logger import setup_logger
+
+# (mtime_ns, size) per watched file
+FileIndex = Dict[str, Tuple[int, int]]
+
+class CollectionWatcher:
+    def __init__(self, processor: CollectionProcessor = None, root_path: Path = None):
+        self.logger = setup_logger(__name__)
+        self.settings = Settings()
+        self.processor = processor or CollectionProcessor()
+        self.root_path = root_path or self.settings.get_collections_path()
+        
+        # Last processed file index per collection
+        self._indexed: Dict[Path, FileIndex] = {}
+        
+        # Collections whose files changed but may still be mid-write:
+        # path -> {'index', 'arrival', 'last_change'}
+        self._pending: Dict[Path, Dict] = {}
+        self._queue: Deque[Tuple[Path, float]] = deque()
+        
+        self.latencies = []
+    
+    def _is_watched(self, name: str) -> bool:
+        """Inputs that affect a collection's output (never the output itself)"""
+        return name == self.settings.challenge_input_file or name.endswith('_outline.json')
+    
+    def scan_collection(self, collection_path: Path) -> FileIndex:
+        """Cheap stat-only index of a collection's input files (from the poll's manifest scan)"""
+        files = self.processor.manifest.files(collection_path)
+        return {name: stat for name, stat in files.items() if self._is_watched(name)}
+    
+    def _has_current_output(self, collection_path: Path, index: FileIndex) -> bool:
+        """Output exists and is newer than every input file"""
+        output_file = self.processor.settings.get_output_file(collection_path)  # knows an archive root's output dir
+        try:
+            output_mtime = output_file.stat().st_mtime_ns
+        except OSError:
+            return False
+        return all(mtime <= output_mtime for mtime, _ in index.values())
+    
+    def prime(self, process_existing: bool = True):
+        """Index existing collections; queue those with a missing or stale output"""
+        for collection_path in self.processor.discover_collections(self.root_path):
+            index = self.scan_collection(collection_path)
+            if process_existing and not self._has_current_output(collection_path, index):
+                self._pending[collection_path] = {
+                    'index': index,
+                    'arrival': max((mtime for mtime, _ in index.values()), default=time.time_ns()) / 1e9,
+                    'last_change': 0.0
+                }
+            else:
+                self._indexed[collection_path] = index
+    
+    def poll(self, now: float = None):
+        """One polling pass: detect changes, debounce, queue settled collections"""
+        now = now or time.time()
+        
+        for collection_path in self.processor.discover_collections(self.root_path, verbose=False):
+            index = self.scan_collection(collection_path)
+            pending = self._pending.get(collection_path)
+            
+            if pending is None:
+                previous = self._indexed.get(collection_path)
+                if index == previous:
+                    continue
+                
+                # Arrival is when the earliest changed file landed
+                changed = [name for name, entry in index.items() if not previous or previous.get(name) != entry]
+                arrival = min((index[name][0] for name in changed), default=time.time_ns()) / 1e9
+                self._pending[collection_path] = {'index': index, 'arrival': arrival, 'last_change': now}
+                self.logger.info(f"👀 Change detected in {collection_path.name} ({len(changed)} file(s))")
+            elif index != pending['index']:
+                # Still being written; restart the quiet period
+                pending['index'] = index
+                pending['last_change'] = now
+        
+        # Collections whose files have not moved for the debounce window are ready
+        for collection_path, pending in list(self._pending.items()):
+            if now - pending['last_change'] >= self.settings.watch_debounce_seconds:
+                del self._pending[collection_path]
+                self._indexed[collection_path] = pending['index']
+                self._queue.append((collection_path, pending['arrival']))
+    
+    def process_queue(self) -> int:
+        """Process every queued collection with the warm processor"""
+        processed = 0
+        while self._queue:
+            collection_path, arrival = self._queue.popleft()
+            success, record = self.processor.run_collection(collection_path)
+            if self.processor.collect_output(collection_path, record) + self.processor.flush_outputs():
+                success = False
+            
+            latency = time.time() - arrival
+            self.latencies.append(latency)
+            self.processor._record_collection(collection_path.name, arrival_to_output_seconds=latency)
+            processed += 1
+            
+            if success:
+                self.logger.info(f"✅ {collection_path.name} processed, {latency:.2f}s from arrival to output")
+            else:
+                self.logger.error(f"❌ Failed to process {collection_path.name} ({latency:.2f}s after arrival)")
+        return processed
+    
+    def get_latency_stats(self) -> Dict:
+        """Arrival-to-output latency summary for this watch session"""
+        if not self.latencies:
+            return {'count': 0}
+        ordered = sorted(self.latencies)
+        return {
+            'count': len(ordered),
+            'mean_seconds': sum(ordered) / len(ordered),
+            'p50_seconds': ordered[len(ordered) // 2],
+            'max_seconds': ordered[-1]
+        }
+    
+    def run(self, max_polls: Optional[int] = None, process_existing: bool = True):
+        """Poll until interrupted (or for max_polls passes)"""
+        # One warm in-process worker; the whole CPU plan goes to the encoder
+        plan = self.processor.execution_planner.plan(1)
+        self.processor.execution_planner.apply_plan(plan)
+        
+        self.prime(process_existing)
+        self.logger.info(
+            f"Watching {self.root_path} (poll {self.settings.watch_poll_interval}s, "
+            f"debounce {self.settings.watch_debounce_seconds}s)"
+        )
+        
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                self.poll()
+                self.process_queue()
+                polls += 1
+                time.sleep(self.settings.watch_poll_interval)
+        except KeyboardInterrupt:
+            self.logger.info("Watch mode stopped")
+        finally:
+            self.processor.close_outputs()
+        
+        stats = self.get_latency_stats()
+        if stats['count']:
+            self.logger.info(
+                f"📊 {stats['count']} collection run(s): arrival-to-output mean {stats['mean_seconds']:.2f}s, "
+                f"p50 {stats['p50_seconds']:.2f}s, max {stats['max_seconds']:.2f}s"
+            )
+        return stats
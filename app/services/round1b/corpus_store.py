@@ -0,0 +1,340 @@
+﻿"""
+SQLite-backed corpus and results store for sections, embeddings and rankings
+"""
+
+import io
+import json
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from config.settings import Settings
+from services.round1b.vector_codecs import EncodedVectors, get_codec, load_codec, save_codec
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    name TEXT NOT NULL,
+    title TEXT,
+    content_hash TEXT NOT NULL,
+    section_count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (collection, name)
+);
+
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    level TEXT,
+    page INTEGER,
+    children TEXT,
+    UNIQUE (document_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS embeddings (
+    section_id INTEGER NOT NULL REFERENCES sections(id) ON DELETE CASCADE,
+    model_fingerprint TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (model_fingerprint, section_id)
+);
+
+CREATE TABLE IF NOT EXISTS embedding_codecs (
+    model_fingerprint TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    params BLOB NOT NULL,
+    PRIMARY KEY (model_fingerprint, codec)
+);
+
+CREATE TABLE IF NOT EXISTS document_codecs (
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    model_fingerprint TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    PRIMARY KEY (model_fingerprint, document_id)
+);
+
+CREATE TABLE IF NOT EXISTS rankings (
+    id INTEGER PRIMARY KEY,
+    collection TEXT NOT NULL,
+    persona TEXT NOT NULL,
+    task TEXT NOT NULL,
+    model_fingerprint TEXT NOT NULL,
+    output_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (collection, persona, task, model_fingerprint)
+);
+
+CREATE INDEX IF NOT EXISTS idx_documents_collection ON documents (collection, name);
+CREATE INDEX IF NOT EXISTS idx_sections_document ON sections (document_id, position);
+CREATE INDEX IF NOT EXISTS idx_embeddings_section ON embeddings (section_id);
+CREATE INDEX IF NOT EXISTS idx_rankings_lookup ON rankings (collection, persona, task);
+"""
+
+class CorpusStore:
+    def __init__(self, db_path: Union[str, Path], codec_name: str = 'float32'):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        self.db_path = Path(db_path)
+        self.codec_name = codec_name
+        get_codec(codec_name)  # unknown codecs fail here, not on the first save
+        # (model fingerprint, codec name) -> fitted codec, once it exists
+        self._codecs: Dict[Tuple[str, str], object] = {}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Autocommit mode; writes are grouped with explicit BEGIN/COMMIT
+        self.conn = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30.0)
+        self.conn.row_factory = sqlite3.Row
+        
+        # WAL lets readers in other processes run while a writer commits
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA foreign_keys=ON')
+        self._drop_document_fitted_codecs()
+        self.conn.executescript(SCHEMA)
+        
+        self.logger.info(f'Corpus store opened at: {self.db_path} ({self.codec_name} embeddings)')
+    
+    def close(self):
+        """Close the underlying connection"""
+        self.conn.close()
+    
+    def _drop_document_fitted_codecs(self):
+        """Stores that fitted a codec per document: drop those codes (they are re-embedded on use)"""
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(embedding_codecs)')]
+        if 'document_id' not in columns:
+            return
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM embeddings WHERE EXISTS (SELECT 1 FROM sections s JOIN embedding_codecs c '
+                'ON c.document_id = s.document_id WHERE s.id = embeddings.section_id '
+                'AND c.model_fingerprint = embeddings.model_fingerprint)'
+            )
+            conn.execute('DROP TABLE embedding_codecs')
+        self.logger.info('Dropped per-document codec embeddings; they are re-embedded on next use')
+    
+    @contextmanager
+    def _transaction(self):
+        """Run a block of writes as one transaction"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+    
+    # ---- documents and sections -------------------------------------------------
+    
+    def get_document(self, collection: str, name: str) -> Optional[Dict]:
+        """Look up a stored document by collection and filename"""
+        row = self.conn.execute(
+            'SELECT id, title, content_hash, section_count FROM documents WHERE collection = ? AND name = ?',
+            (collection, name)
+        ).fetchone()
+        return dict(row) if row else None
+    
+    def upsert_document(self, collection: str, name: str, title: str,
+                        content_hash: str, sections: List[Dict]) -> int:
+        """Replace a document and all its sections in a single transaction"""
+        with self._transaction() as conn:
+            # Cascades drop the stale sections and their embeddings
+            conn.execute('DELETE FROM documents WHERE collection = ? AND name = ?', (collection, name))
+            cursor = conn.execute(
+                'INSERT INTO documents (collection, name, title, content_hash, section_count, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (collection, name, title, content_hash, len(sections), time.time())
+            )
+            document_id = cursor.lastrowid
+            
+            conn.executemany(
+                'INSERT INTO sections (document_id, position, text, level, page, children) VALUES (?, ?, ?, ?, ?, ?)',
+                (
+                    (
+                        document_id,
+                        position,
+                        section.get('text', ''),
+                        section.get('level'),
+                        section.get('page'),
+                        json.dumps(section['children'], ensure_ascii=False) if section.get('children') else None
+                    )
+                    for position, section in enumerate(sections)
+                )
+            )
+        
+        return document_id
+    
+    def load_sections(self, document_id: int) -> List[Dict]:
+        """Load a document's sections in outline order"""
+        rows = self.conn.execute(
+            'SELECT text, level, page, children FROM sections WHERE document_id = ? ORDER BY position',
+            (document_id,)
+        ).fetchall()
+        
+        sections = []
+        for row in rows:
+            section = {'level': row['level'], 'text': row['text'], 'page': row['page']}
+            if row['children']:
+                section['children'] = json.loads(row['children'])
+            sections.append(section)
+        return sections
+    
+    # ---- embeddings -------------------------------------------------------------
+    
+    def save_embeddings(self, document_id: int, model_fingerprint: str, embeddings: np.ndarray):
+        """Store one blob of codes per section, keyed by model fingerprint.
+        
+        The store fits one codec per (model, codec) and encodes every document
+        with it. Until `codec_train_vectors` vectors are stored there is nothing
+        to fit on, so documents are kept as float32 and re-encoded once it is fitted.
+        """
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        
+        with self._transaction() as conn:
+            section_ids = [row[0] for row in conn.execute(
+                'SELECT id FROM sections WHERE document_id = ? ORDER BY position', (document_id,)
+            )]
+            if len(section_ids) != len(embeddings):
+                raise ValueError(f'Expected {len(section_ids)} embeddings, got {len(embeddings)}')
+            
+            codec = self._fitted_codec(model_fingerprint, self.codec_name) or get_codec('float32', self.settings)
+            codes = np.ascontiguousarray(codec.encode(embeddings))
+            conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (section_id, model_fingerprint, dim, vector) VALUES (?, ?, ?, ?)',
+                (
+                    (section_id, model_fingerprint, embeddings.shape[1], vector.tobytes())
+                    for section_id, vector in zip(section_ids, codes)
+                )
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO document_codecs (document_id, model_fingerprint, codec) VALUES (?, ?, ?)',
+                (document_id, model_fingerprint, codec.name)
+            )
+            if codec.name != self.codec_name:
+                self._fit_codec(conn, model_fingerprint)
+    
+    def _fitted_codec(self, model_fingerprint: str, codec_name: str):
+        """The store's codec for a model, or None while it still needs fitting"""
+        key = (model_fingerprint, codec_name)
+        if key not in self._codecs:
+            codec = get_codec(codec_name, self.settings)
+            if codec.needs_fit:
+                row = self.conn.execute(
+                    'SELECT params FROM embedding_codecs WHERE model_fingerprint = ? AND codec = ?', key
+                ).fetchone()
+                if row is None:
+                    return None
+                codec = load_codec(io.BytesIO(row['params']), self.settings)
+            self._codecs[key] = codec
+        return self._codecs[key]
+    
+    def _fit_codec(self, conn: sqlite3.Connection, model_fingerprint: str):
+        """Fit the codec once enough float32 vectors are stored, then re-encode them all"""
+        pending = (
+            'FROM embeddings e JOIN sections s ON s.id = e.section_id '
+            'JOIN document_codecs d ON d.document_id = s.document_id AND d.model_fingerprint = e.model_fingerprint '
+            "WHERE e.model_fingerprint = ? AND d.codec = 'float32'"
+        )
+        count = conn.execute(f'SELECT COUNT(*) {pending}', (model_fingerprint,)).fetchone()[0]
+        if count < self.settings.codec_train_vectors:
+            return
+        
+        # A random sample is enough to fit on; every pending row is then re-encoded in batches
+        sample = conn.execute(f'SELECT e.dim, e.vector {pending} ORDER BY RANDOM() LIMIT ?',
+                              (model_fingerprint, self.settings.codec_train_vectors)).fetchall()
+        dim = sample[0]['dim']
+        codec = get_codec(self.codec_name, self.settings).fit(
+            np.frombuffer(b''.join(row['vector'] for row in sample), dtype=np.float32).reshape(len(sample), dim)
+        )
+        params = io.BytesIO()
+        save_codec(codec, params)
+        conn.execute(
+            'INSERT INTO embedding_codecs (model_fingerprint, codec, params) VALUES (?, ?, ?)',
+            (model_fingerprint, codec.name, params.getvalue())
+        )
+        
+        cursor = conn.execute(f'SELECT e.section_id, e.vector {pending}', (model_fingerprint,))
+        updates = []
+        while True:
+            rows = cursor.fetchmany(self.settings.codec_train_vectors)
+            if not rows:
+                break
+            vectors = np.frombuffer(b''.join(row['vector'] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+            updates.extend((code.tobytes(), row['section_id'], model_fingerprint)
+                           for row, code in zip(rows, codec.encode(vectors)))
+        conn.executemany('UPDATE embeddings SET vector = ? WHERE section_id = ? AND model_fingerprint = ?', updates)
+        conn.execute(
+            "UPDATE document_codecs SET codec = ? WHERE model_fingerprint = ? AND codec = 'float32'",
+            (codec.name, model_fingerprint)
+        )
+        self._codecs[(model_fingerprint, codec.name)] = codec
+        self.logger.info(f'Fitted {codec.name} codec on {len(sample)} of {count} stored vectors, re-encoded them all')
+    
+    def load_codes(self, document_id: int, model_fingerprint: str) -> Optional[EncodedVectors]:
+        """A document's stored codes and their codec, or None if any section is missing one"""
+        rows = self.conn.execute(
+            'SELECT e.dim, e.vector FROM sections s '
+            'LEFT JOIN embeddings e ON e.section_id = s.id AND e.model_fingerprint = ? '
+            'WHERE s.document_id = ? ORDER BY s.position',
+            (model_fingerprint, document_id)
+        ).fetchall()
+        
+        if not rows or any(row['vector'] is None for row in rows):
+            return None
+        
+        codec_row = self.conn.execute(
+            'SELECT codec FROM document_codecs WHERE document_id = ? AND model_fingerprint = ?',
+            (document_id, model_fingerprint)
+        ).fetchone()
+        # Rows written before codecs were stored are plain float32
+        codec = self._fitted_codec(model_fingerprint, codec_row['codec'] if codec_row else 'float32')
+        if codec is None:
+            return None
+        
+        blob = b''.join(row['vector'] for row in rows)
+        codes = np.frombuffer(blob, dtype=codec.code_dtype).reshape(len(rows), -1)
+        return EncodedVectors(codes, codec)
+    
+    def load_embeddings(self, document_id: int, model_fingerprint: str) -> Optional[np.ndarray]:
+        """Load a document's embedding matrix decoded to float32, or None if any section is missing one"""
+        vectors = self.load_codes(document_id, model_fingerprint)
+        return vectors.decode() if vectors is not None else None
+    
+    def load_collection(self, collection: str, model_fingerprint: str) -> List[Tuple[str, List[Dict], Optional[np.ndarray]]]:
+        """Every stored document of a collection as (name, sections, embeddings)"""
+        documents = self.conn.execute(
+            'SELECT id, name FROM documents WHERE collection = ? ORDER BY name', (collection,)
+        ).fetchall()
+        
+        return [
+            (row['name'], self.load_sections(row['id']), self.load_embeddings(row['id'], model_fingerprint))
+            for row in documents
+        ]
+    
+    # ---- rankings ---------------------------------------------------------------
+    
+    def save_ranking(self, collection: str, persona: str, task: str,
+                     model_fingerprint: str, output: Dict):
+        """Record the formatted output for a (collection, persona, task)"""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO rankings (collection, persona, task, model_fingerprint, output_json, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (collection, persona, task, model_fingerprint, json.dumps(output, ensure_ascii=False), time.time())
+            )
+    
+    def load_ranking(self, collection: str, persona: str, task: str,
+                     model_fingerprint: str) -> Optional[Dict]:
+        """Fetch a previously stored output, if any"""
+        row = self.conn.execute(
+            'SELECT output_json FROM rankings WHERE collection = ? AND persona = ? AND task = ? AND model_fingerprint = ?',
+            (collection, persona, task, model_fingerprint)
+        ).fetchone()
+        return json.loads(row['output_json']) if row else None
@@ -2,17 +2,70 @@
 Document loading and preprocessing for Round 1B
 """
 
+import hashlib
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 
+from config.settings import Settings
+from services.round1b.outline_pack import OutlinePack, PackedSections, build_pack, pack_is_current
+from utils.archive_reader import split_archive_path
 from utils.file_handler import FileHandler
 
 class DocumentLoader:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
         self.file_handler = FileHandler()
     
+    def get_pack_path(self, outline_path: Path) -> Path:
+        """Pack file that mirrors an *_outline.json, under the pack cache directory.
+        
+        Folders are keyed by name plus a hash of their absolute path, so same-named
+        collections from different roots never share packs.
+        """
+        outline_path = Path(outline_path)
+        folder = outline_path.parent
+        folder_hash = hashlib.sha1(str(folder.resolve()).encode('utf-8')).hexdigest()[:8]
+        pack_dir = self.settings.get_outline_pack_dir() / f'{folder.name}-{folder_hash}'
+        return pack_dir / outline_path.with_suffix('.pack').name
+    
+    def open_pack(self, outline_path: Path) -> Optional[OutlinePack]:
+        """Open the outline's pack, (re)building it when missing or older than the JSON"""
+        pack_path = self.get_pack_path(outline_path)
+        try:
+            if not pack_is_current(outline_path, pack_path):
+                pack_path.parent.mkdir(parents=True, exist_ok=True)
+                build_pack(outline_path, pack_path)
+                self.logger.debug(f'Built outline pack: {pack_path}')
+            return OutlinePack(pack_path)
+        except Exception as e:
+            # Read-only volume, corrupt JSON, ...: the caller falls back to JSON
+            self.logger.warning(f'Could not use outline pack for {outline_path}: {str(e)}')
+            return None
+    
+    def load_sections(self, outline_path: Path, defaults: Dict = None) -> Sequence[Dict]:
+        """Top-level outline sections, lazily from a pack when enabled, with defaults merged in"""
+        # Archive members are parsed in memory; packs need a file next to the JSON
+        if self.settings.outline_packs_enabled and split_archive_path(outline_path) is None:
+            pack = self.open_pack(outline_path)
+            if pack is not None:
+                return PackedSections(pack, defaults)
+        
+        sections = self.file_handler.load_json(outline_path).get('outline', [])
+        if defaults:
+            for section in sections:
+                section.update(defaults)
+        return sections
+    
+    def apply_defaults(self, sections: Sequence[Dict], defaults: Dict):
+        """Attach per-document metadata without materializing packed rows"""
+        if isinstance(sections, PackedSections):
+            sections.add_defaults(defaults)
+        else:
+            for section in sections:
+                section.update(defaults)
+    
     def load_outline(self, outline_path: str) -> Optional[Dict]:
         """Load and validate document outline from Round 1A"""
         try:
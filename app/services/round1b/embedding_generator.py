@@ -2,15 +2,38 @@
 Embedding generation for semantic similarity
 """
 
+import hashlib
 import logging
+import threading
+from contextlib import contextmanager
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from typing import List, Union
 from pathlib import Path
 
+from config.settings import Settings
+from utils.execution_planner import ExecutionPlanner
+
+ENCODE_PRECISIONS = ('float32', 'bfloat16', 'int8')
+
+# Set once this process has run the model: torch's thread pools exist from then on,
+# and forking a process in that state can deadlock the child's first encode
+_encoder_has_run = False
+
+def encoder_has_run() -> bool:
+    return _encoder_has_run
+
 class EmbeddingGenerator:
-    def __init__(self):
+    def __init__(self, precision: str = None, batch_size: int = None, max_tokens: int = None):
         self.logger = logging.getLogger(__name__)
+        self.max_tokens = Settings().encode_max_tokens if max_tokens is None else max_tokens
+        
+        # Encode batch size and precision: explicit arguments, else env / tuned profile / defaults
+        profile = ExecutionPlanner().encoder_profile() if precision is None or batch_size is None else {}
+        self.precision = (precision or profile['precision']).lower()
+        self.batch_size = batch_size or profile['batch_size']
+        if self.precision not in ENCODE_PRECISIONS:
+            raise ValueError(f"Unknown encode precision '{self.precision}' (expected one of {', '.join(ENCODE_PRECISIONS)})")
         
         # ✅ FIXED: Use local model path instead of downloading
         local_model_path = '/app/app/models/round1b/embedding_model'
@@ -23,6 +46,11 @@ class EmbeddingGenerator:
             raise FileNotFoundError(f'Embedding model not found at {local_model_path}')
             
         self.model = None
+        self._precision_applied = False
+        self._model_fingerprint = None
+        # Held by every encode: a truncated encode swaps encoder.layer in place, so
+        # no other encode may run on the model meanwhile (re-entered by the truncated path)
+        self._layer_lock = threading.RLock()
         self._load_model()
     
     def _load_model(self):
@@ -30,11 +58,45 @@ class EmbeddingGenerator:
         try:
             # Load from local path with explicit device setting
             self.model = SentenceTransformer(self.model_path, device='cpu')
-            self.logger.info(f'Successfully loaded model from: {self.model_path}')
+            self._model_max_tokens = self.model.max_seq_length
+            self.set_max_tokens(self.max_tokens)
+            self._precision_applied = self.precision == 'float32'
+            if self.precision == 'int8':
+                import torch
+                if torch.backends.quantized.engine == 'none':
+                    raise RuntimeError('No quantized engine available for int8 inference')
+            self.logger.info(f'Successfully loaded model from: {self.model_path} ({self.precision})')
         except Exception as e:
             self.logger.error(f'Failed to load model from {self.model_path}: {str(e)}')
             raise
     
+    def _apply_precision(self):
+        '''Convert the loaded model to the configured inference precision, once.
+        
+        Deferred to the first encode: the conversion runs parallel kernels, and a
+        process that has run them can no longer fork workers safely. A parent that
+        only loads the model therefore keeps it in float32 and forks as usual,
+        and each worker converts its copy after the fork.
+        '''
+        if self._precision_applied:
+            return
+        import torch
+        # Conversion and quantization run parallel kernels, just like an encode
+        global _encoder_has_run
+        _encoder_has_run = True
+        if self.precision == 'bfloat16':
+            self.model.to(torch.bfloat16)
+        elif self.precision == 'int8':
+            # Dynamic quantization: int8 Linear weights, activations quantized per batch
+            torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        self._precision_applied = True
+    
+    def set_max_tokens(self, max_tokens: int):
+        '''Truncate encoder inputs to max_tokens WordPiece tokens (0 = the model's own limit)'''
+        self.max_tokens = max_tokens
+        self.model.max_seq_length = min(max_tokens, self._model_max_tokens) if max_tokens else self._model_max_tokens
+        self._model_fingerprint = None
+    
     def encode_texts(self, texts: List[str]) -> np.ndarray:
         '''Generate embeddings for a list of texts'''
         if not self.model:
@@ -44,8 +106,36 @@ class EmbeddingGenerator:
         clean_texts = [self._preprocess_text(text) for text in texts]
         
         # Generate embeddings
-        embeddings = self.model.encode(clean_texts, normalize_embeddings=True)
-        return embeddings
+        global _encoder_has_run
+        _encoder_has_run = True
+        with self._layer_lock:
+            self._apply_precision()
+            embeddings = self.model.encode(clean_texts, batch_size=self.batch_size, normalize_embeddings=True)
+        return np.asarray(embeddings, dtype=np.float32)
+    
+    @contextmanager
+    def _truncated_layers(self, num_layers: int):
+        '''Temporarily run only the first num_layers transformer blocks (shared weights)'''
+        encoder = self.model[0].auto_model.encoder
+        full_layers = encoder.layer
+        
+        with self._layer_lock:
+            # Convert every block before hiding some of them from the conversion
+            self._apply_precision()
+            encoder.layer = full_layers[:num_layers]
+            try:
+                yield
+            finally:
+                encoder.layer = full_layers
+    
+    def encode_texts_truncated(self, texts: List[str], num_layers: int) -> np.ndarray:
+        '''Cheap embeddings from the first num_layers blocks of the same model'''
+        with self._truncated_layers(num_layers):
+            return self.encode_texts(texts)
+    
+    def get_num_layers(self) -> int:
+        '''Number of transformer blocks in the loaded model'''
+        return len(self.model[0].auto_model.encoder.layer)
     
     def encode_single(self, text: str) -> np.ndarray:
         '''Generate embedding for a single text'''
@@ -62,6 +152,28 @@ class EmbeddingGenerator:
         
         return text
     
+    def get_model_fingerprint(self) -> str:
+        '''Stable identifier for the loaded model, used to key cached vectors'''
+        if self._model_fingerprint is None:
+            digest = hashlib.sha1()
+            model_dir = Path(self.model_path)
+            
+            # File names and sizes catch weight swaps, config contents catch edits
+            for file_path in sorted(p for p in model_dir.rglob('*') if p.is_file()):
+                digest.update(str(file_path.relative_to(model_dir)).encode('utf-8'))
+                digest.update(str(file_path.stat().st_size).encode('utf-8'))
+                if file_path.name in ('config.json', 'modules.json'):
+                    digest.update(file_path.read_bytes())
+            
+            self._model_fingerprint = digest.hexdigest()[:16]
+            if self.precision != 'float32':
+                # Reduced precision yields slightly different vectors; keep their caches apart
+                self._model_fingerprint += f'-{self.precision}'
+            if self.max_tokens and self.max_tokens < self._model_max_tokens:
+                self._model_fingerprint += f'-t{self.max_tokens}'
+        
+        return self._model_fingerprint
+    
     def calculate_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         '''Calculate cosine similarity between two embeddings'''
         return float(np.dot(embedding1, embedding2))
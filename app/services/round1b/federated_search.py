@@ -0,0 +1,187 @@
+﻿"""
+Federated persona/task search across every collection (scatter-gather top-k over shards)
+"""
+
+import heapq
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from config.settings import Settings
+from services.round1b.collection_manifest import CollectionManifest
+from services.round1b.collection_shard import SHARD_FORMAT, read_manifest, result_key, search_shard, write_shard
+from services.round1b.document_loader import DocumentLoader
+from services.round1b.persona_matcher import PersonaMatcher
+from services.round1b.section_filter_index import normalize_filters
+from utils.logger import setup_logger
+
+FEDERATED_EXECUTORS = ('threads', 'processes')
+
+class FederatedSearch:
+    """Answers one persona/task query against all collections at once.
+    
+    Each collection keeps a shard (section embeddings in the configured codec
+    plus per-row metadata) in its own directory, rebuilt only when an outline,
+    the model or the codec changes. A query is embedded once into the linear weight vector, scattered
+    to a bounded pool that scans every shard for its local top-k (only rows that
+    pass the level/page/document filters), and gathered with a k-way merge.
+    Shards are memory-mapped and only their top-k rows are
+    materialized, so memory does not grow with the corpus.
+    """
+    
+    def __init__(self, persona_matcher: PersonaMatcher = None, manifest: CollectionManifest = None,
+                 output_dir: str = None):
+        self.logger = setup_logger(__name__)
+        self.settings = Settings()
+        if output_dir:
+            self.settings.output_dir = output_dir
+        self.document_loader = DocumentLoader()
+        self.persona_matcher = persona_matcher or PersonaMatcher()
+        self.manifest = manifest or CollectionManifest()
+    
+    # ---- shards -----------------------------------------------------------------
+    
+    def get_shard_path(self, collection_path: Path) -> Path:
+        """Shard folder next to the collection's output (inside the collection by default)"""
+        return self.settings.get_output_file(collection_path).parent / self.settings.shard_dir_name
+    
+    def _shard_manifest(self, collection_path: Path, documents: List[Dict]) -> Dict:
+        """What the shard must have been built from to be current"""
+        fingerprint = self.persona_matcher.embedding_generator.get_model_fingerprint()
+        hashes = [[doc_info['name'], self.manifest.content_hash(collection_path / doc_info['outline_file'])]
+                  for doc_info in documents]
+        codec = self.settings.embedding_codec
+        return {'format': SHARD_FORMAT, 'model': fingerprint, 'documents': hashes, 'codec': codec,
+                'exact_rescore': codec != 'float32' and self.settings.codec_exact_rescore}
+    
+    def build_shard(self, collection_path: Path, force: bool = False) -> bool:
+        """Embed the collection's sections into its shard; returns False when already current"""
+        documents = [doc for doc in self.manifest.query_data(collection_path).get('documents', [])
+                     if self.manifest.has_file(collection_path, doc['outline_file'])]
+        
+        manifest = self._shard_manifest(collection_path, documents)
+        current = read_manifest(self.get_shard_path(collection_path))
+        if not force and current is not None and \
+                {key: current.get(key) for key in manifest} == manifest:
+            return False
+        
+        sections, blocks = [], []
+        for doc_info in documents:
+            defaults = {
+                'document': doc_info['name'],
+                'title': doc_info.get('title', doc_info['name']),
+                'collection': collection_path.name
+            }
+            document_sections = self.document_loader.load_sections(collection_path / doc_info['outline_file'], defaults)
+            if not len(document_sections):
+                continue
+            blocks.append(self.persona_matcher.embed_sections(document_sections))
+            sections.extend(document_sections[i] for i in range(len(document_sections)))
+        
+        embeddings = np.vstack(blocks) if blocks else np.zeros((0, self.settings.embedding_dimension), dtype=np.float32)
+        write_shard(self.get_shard_path(collection_path), sections, embeddings, manifest,
+                    manifest['codec'], manifest['exact_rescore'])
+        self.logger.info(f"🧩 Built shard for {collection_path.name}: {len(sections)} sections")
+        return True
+    
+    def build_shards(self, collections: List[Path], force: bool = False) -> List[Path]:
+        """Bring every collection's shard up to date; returns the shards that can be searched"""
+        shards = []
+        for collection_path in collections:
+            try:
+                self.build_shard(collection_path, force=force)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Could not build shard for {collection_path.name}: {str(e)}")
+            if read_manifest(self.get_shard_path(collection_path)) is not None:
+                shards.append(self.get_shard_path(collection_path))
+        return shards
+    
+    # ---- search -----------------------------------------------------------------
+    
+    def search(self, collections: List[Path], job_role: str, task: str, k: int = None,
+               executor: str = None, workers: int = None, refresh: bool = True, filters: Dict = None) -> Dict:
+        """Global top-k sections for persona/task (within `filters`, as in the input payload), with per-shard latency"""
+        k = k or self.settings.federated_top_k
+        filters = normalize_filters(filters)
+        executor = (executor or self.settings.federated_executor).lower()
+        workers = workers or self.settings.federated_workers
+        if executor not in FEDERATED_EXECUTORS:
+            raise ValueError(f"Unknown executor '{executor}' (expected one of {', '.join(FEDERATED_EXECUTORS)})")
+        
+        if refresh:
+            shards = self.build_shards(collections)
+        else:
+            shards = [self.get_shard_path(path) for path in collections
+                      if read_manifest(self.get_shard_path(path)) is not None]
+        
+        start = time.perf_counter()
+        weights = self.persona_matcher.get_weight_vector(job_role, task)
+        query_ms = 1000.0 * (time.perf_counter() - start)
+        
+        # Scatter: one scan per shard, at most `workers` at a time
+        workers = max(1, min(workers, len(shards) or 1))
+        if executor == 'processes':
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        with pool:
+            futures = [pool.submit(search_shard, str(shard), weights, k, self.settings.federated_block_rows,
+                                   self.settings.codec_rescore_factor, filters)
+                       for shard in shards]
+            shard_results = [future.result() for future in futures]
+        
+        # Gather: each shard's hits are already best first and distinct, so a k-way merge is enough
+        ranked = heapq.merge(
+            *[[(-hit['score'], index, hit['row'], hit) for hit in result['hits']]
+              for index, result in enumerate(shard_results)]
+        )
+        results, seen = [], set()
+        for *_, hit in ranked:
+            if len(results) >= k:
+                break
+            section = hit['section']
+            result = {
+                'collection': section.get('collection'),
+                'document': section.get('document'),
+                'section_title': (section.get('text') or '').strip(),
+                'level': section.get('level'),
+                'page_number': section.get('page') or 1,
+                'importance_rank': len(results) + 1,
+                'score': round(hit['score'], 6)
+            }
+            # Shards apply the same rule; this only matters for collections sharing a name
+            key = result_key(section)
+            if key is not None and key not in seen:
+                seen.add(key)
+                results.append(result)
+        total_ms = 1000.0 * (time.perf_counter() - start)
+
+        report = {
+            'persona': job_role,
+            'task': task,
+            'top_k': k,
+            'filters': filters,
+            'executor': executor,
+            'workers': workers,
+            'results': results,
+            'shards': [
+                {key: result[key] for key in ('shard', 'sections', 'latency_ms', 'error') if key in result}
+                for result in shard_results
+            ],
+            'query_ms': round(query_ms, 3),
+            'total_ms': round(total_ms, 3)
+        }
+        for shard in report['shards']:
+            shard['latency_ms'] = round(shard['latency_ms'], 3)
+            if 'error' in shard:
+                self.logger.warning(f"⚠️ Shard {shard['shard']} failed: {shard['error']}")
+        
+        self.logger.info(
+            f"🔎 Federated search over {len(shards)} shard(s), "
+            f"{sum(s['sections'] for s in report['shards'])} sections: top {len(results)} in {total_ms:.1f}ms"
+        )
+        return report
@@ -0,0 +1,201 @@
+﻿"""
+Binary packed outline format: string blobs with offsets plus fixed-width level/page columns
+"""
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+PACK_MAGIC = b'S1BOPK01'
+PACK_VERSION = 1
+
+# magic, version, section count, source mtime_ns, source size, metadata length
+_HEADER = struct.Struct('<8sIIqqI')
+
+def _align(offset: int, alignment: int = 8) -> int:
+    return -(-offset // alignment) * alignment
+
+def build_pack(json_path: Union[str, Path], pack_path: Union[str, Path]):
+    """Convert one *_outline.json into a pack, written atomically"""
+    json_path, pack_path = Path(json_path), Path(pack_path)
+    stat = json_path.stat()
+    outline_data = json.loads(json_path.read_bytes().decode('utf-8-sig'))
+    outline = outline_data.get('outline', [])
+    
+    # Levels are short strings ("H1".."H4"); store a code per row and the table once
+    level_table: List = []
+    level_codes = np.zeros(len(outline), dtype=np.uint8)
+    pages = np.zeros(len(outline), dtype=np.int32)
+    texts, extras = [], []
+    for i, section in enumerate(outline):
+        level = section.get('level')
+        if level not in level_table:
+            level_table.append(level)
+        level_codes[i] = level_table.index(level)
+        pages[i] = int(section['page']) if section.get('page') is not None else -1  # -1: no page
+        texts.append(section.get('text', '').encode('utf-8'))
+        
+        # Anything beyond level/text/page (e.g. children) is kept as per-row JSON
+        extra = {key: value for key, value in section.items() if key not in ('level', 'text', 'page')}
+        extras.append(json.dumps(extra, ensure_ascii=False).encode('utf-8') if extra else b'')
+    
+    text_offsets = np.zeros(len(texts) + 1, dtype=np.uint64)
+    np.cumsum([len(t) for t in texts], out=text_offsets[1:])
+    extra_offsets = np.zeros(len(extras) + 1, dtype=np.uint64)
+    np.cumsum([len(e) for e in extras], out=extra_offsets[1:])
+    
+    metadata = json.dumps({
+        'title': outline_data.get('title', ''),
+        'levels': level_table,
+        'document_fields': {k: v for k, v in outline_data.items() if k not in ('outline', 'title')}
+    }, ensure_ascii=False).encode('utf-8')
+    
+    temp_path = pack_path.with_name(f'.{pack_path.name}.{os.getpid()}.tmp')
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(PACK_MAGIC, PACK_VERSION, len(outline), stat.st_mtime_ns, stat.st_size, len(metadata)))
+        f.write(metadata)
+        # Numeric columns are 8-byte aligned so they map straight into numpy
+        for column in (text_offsets, extra_offsets, pages, level_codes):
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(column.tobytes())
+        f.write(b''.join(texts))
+        f.write(b''.join(extras))
+    os.replace(temp_path, pack_path)
+
+def pack_is_current(json_path: Union[str, Path], pack_path: Union[str, Path]) -> bool:
+    """The pack exists and was built from the JSON as it is now"""
+    try:
+        stat = Path(json_path).stat()
+        with open(pack_path, 'rb') as f:
+            header = f.read(_HEADER.size)
+        magic, version, _, source_mtime_ns, source_size, _ = _HEADER.unpack(header)
+    except (OSError, struct.error):
+        return False
+    return (magic == PACK_MAGIC and version == PACK_VERSION
+            and source_mtime_ns == stat.st_mtime_ns and source_size == stat.st_size)
+
+class OutlinePack:
+    """Read-only mmap view of a pack; rows are decoded only when asked for"""
+    
+    def __init__(self, pack_path: Union[str, Path]):
+        self.path = Path(pack_path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, version, count, _, _, meta_len = _HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError(f'Not an outline pack (v{PACK_VERSION}): {self.path}')
+        
+        offset = _HEADER.size
+        self.metadata = json.loads(bytes(self._map[offset:offset + meta_len]).decode('utf-8'))
+        offset += meta_len
+        self.count = count
+        
+        # Zero-copy column views straight over the mapping
+        def column(dtype, length):
+            nonlocal offset
+            offset = _align(offset)
+            view = np.frombuffer(self._map, dtype=dtype, count=length, offset=offset)
+            offset += view.nbytes
+            return view
+        
+        self.text_offsets = column(np.uint64, count + 1)
+        self.extra_offsets = column(np.uint64, count + 1)
+        self.pages = column(np.int32, count)
+        self.level_codes = column(np.uint8, count)
+        self._text_base = offset
+        self._extra_base = offset + int(self.text_offsets[-1])
+        self.levels = self.metadata['levels']
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    @property
+    def title(self) -> str:
+        return self.metadata.get('title', '')
+    
+    def text(self, i: int) -> str:
+        start = self._text_base + int(self.text_offsets[i])
+        end = self._text_base + int(self.text_offsets[i + 1])
+        return self._map[start:end].decode('utf-8')
+    
+    def extra(self, i: int) -> Optional[Dict]:
+        start, end = int(self.extra_offsets[i]), int(self.extra_offsets[i + 1])
+        if start == end:
+            return None
+        return json.loads(self._map[self._extra_base + start:self._extra_base + end].decode('utf-8'))
+    
+    def level(self, i: int):
+        return self.levels[self.level_codes[i]]
+    
+    def row(self, i: int) -> Dict:
+        """One section as the same dict the JSON outline would have produced"""
+        section = {'level': self.level(i), 'text': self.text(i)}
+        if self.pages[i] >= 0:
+            section['page'] = int(self.pages[i])
+        if section['level'] is None:
+            del section['level']
+        extra = self.extra(i)
+        if extra:
+            section.update(extra)
+        return section
+    
+    def close(self):
+        self._map.close()
+
+class PackedSections(Sequence):
+    """Sequence of section dicts over a pack, materialized (and cached) per row on access.
+    
+    `defaults` are merged into every materialized row, so per-document metadata
+    never forces a pass over all sections. Like the JSON path, they overwrite
+    fields of the same name.
+    """
+    
+    def __init__(self, pack: OutlinePack, defaults: Dict = None):
+        self.pack = pack
+        self.defaults: Dict = dict(defaults or {})
+        self._rows: Dict[int, Dict] = {}
+    
+    def __len__(self) -> int:
+        return len(self.pack)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        
+        row = self._rows.get(index)
+        if row is None:
+            row = self.pack.row(index)
+            row.update(self.defaults)
+            self._rows[index] = row
+        return row
+    
+    def add_defaults(self, defaults: Dict):
+        """Merge more defaults, into rows already materialized as well"""
+        self.defaults.update(defaults)
+        for row in self._rows.values():
+            row.update(defaults)
+    
+    def section_texts(self) -> List[str]:
+        """Embedding texts (heading plus child headings) without building row dicts"""
+        texts = []
+        for i in range(len(self)):
+            text = self.pack.text(i)
+            extra = self.pack.extra(i) if self.pack.extra_offsets[i] != self.pack.extra_offsets[i + 1] else None
+            if extra and extra.get('children'):
+                text += ' ' + ' '.join(child.get('text', '') for child in extra['children'])
+            texts.append(text)
+        return texts
+    
+    def pages(self) -> np.ndarray:
+        """Page per row (1 where the outline had none, as section.get('page', 1) would give)"""
+        return np.where(self.pack.pages < 0, 1, self.pack.pages)
@@ -0,0 +1,181 @@
+﻿"""
+Tree index over an outline's heading hierarchy for branch-and-bound top-k scoring
+"""
+
+import heapq
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Headings without a recognisable level hang off the document root
+DEFAULT_DEPTH = 1
+
+# Slack on cone bounds so float rounding never prunes a subtree that could qualify
+BOUND_EPSILON = 1e-5
+
+def heading_depth(level) -> int:
+    """'H1' -> 1, 'H3' -> 3; anything else is treated as a top-level heading"""
+    match = re.fullmatch(r'[Hh](\d+)', str(level or ''))
+    return int(match.group(1)) if match else DEFAULT_DEPTH
+
+class OutlineTreeIndex:
+    """Bounding-cone tree over one document's section embeddings.
+    
+    Nodes follow the outline (an H2 sits under the preceding H1, and so on);
+    wide child lists are split into consecutive groups of `branching` so a flat
+    outline still becomes a balanced tree. Every node stores a cone (unit axis
+    and half-angle) containing the embeddings of its whole subtree, which gives
+    an exact upper bound on the linear score e @ w of anything below it.
+    Search descends best-first and stops once no remaining bound can beat the
+    current k-th score, so the result equals exhaustive scoring.
+    """
+    
+    def __init__(self, sections: Sequence[Dict], embeddings: np.ndarray, branching: int = 8):
+        self.embeddings = embeddings
+        self.branching = max(2, branching)
+        
+        # Node arrays; node 0 is the virtual document root, rows are -1 for virtual nodes
+        self.node_rows: List[int] = [-1]
+        self.children: List[List[int]] = [[]]
+        self._build_hierarchy(sections)
+        self._split_wide_nodes()
+        self._build_cones()
+        
+        self.last_stats: Dict = {}
+    
+    # ---- construction -----------------------------------------------------------
+    
+    def _new_node(self, row: int) -> int:
+        self.node_rows.append(row)
+        self.children.append([])
+        return len(self.node_rows) - 1
+    
+    def _build_hierarchy(self, sections: Sequence[Dict]):
+        """Attach each heading to the nearest preceding heading of a shallower level"""
+        stack: List[Tuple[int, int]] = [(0, 0)]  # (depth, node)
+        for row in range(len(sections)):
+            depth = heading_depth(sections[row].get('level'))
+            while stack[-1][0] >= depth:
+                stack.pop()
+            node = self._new_node(row)
+            self.children[stack[-1][1]].append(node)
+            stack.append((depth, node))
+    
+    def _split_wide_nodes(self):
+        """Replace child lists longer than `branching` with groups of consecutive children"""
+        pending = [0]
+        while pending:
+            node = pending.pop()
+            while len(self.children[node]) > self.branching:
+                kids = self.children[node]
+                groups = []
+                for start in range(0, len(kids), self.branching):
+                    group = self._new_node(-1)
+                    self.children[group] = kids[start:start + self.branching]
+                    groups.append(group)
+                self.children[node] = groups
+            pending.extend(self.children[node])
+    
+    def _build_cones(self):
+        """Axis and half-angle of the cone around every subtree, children first"""
+        count = len(self.node_rows)
+        dimension = self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+        self.axes = np.zeros((count, dimension), dtype=np.float32)
+        self.cos_half_angle = np.ones(count, dtype=np.float32)
+        self.sin_half_angle = np.zeros(count, dtype=np.float32)
+        self.radius = np.zeros(count, dtype=np.float32)
+        
+        # Post-order without recursion: parents are appended after their subtrees
+        order, stack = [], [0]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend(self.children[node])
+        
+        members: Dict[int, List[int]] = {}
+        for node in reversed(order):
+            rows = [self.node_rows[node]] if self.node_rows[node] >= 0 else []
+            for child in self.children[node]:
+                rows.extend(members.pop(child))
+            members[node] = rows
+            if not rows:
+                continue
+            
+            vectors = np.asarray(self.embeddings[rows], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1)
+            directions = vectors / np.maximum(norms, 1e-12)[:, np.newaxis]
+            axis = directions.sum(axis=0)
+            norm = np.linalg.norm(axis)
+            axis = axis / norm if norm > 0 else directions[0]
+            # Widest member angle (and longest member, in case vectors are not unit length)
+            cos_min = float(np.clip((directions @ axis).min(), -1.0, 1.0))
+            self.axes[node] = axis
+            self.radius[node] = norms.max()
+            self.cos_half_angle[node] = cos_min
+            self.sin_half_angle[node] = np.sqrt(max(0.0, 1.0 - cos_min * cos_min))
+    
+    # ---- search -----------------------------------------------------------------
+    
+    def upper_bounds(self, nodes: List[int], weights: np.ndarray, weight_norm: float) -> np.ndarray:
+        """Max of e @ w over vectors e inside each node's cone (and radius)"""
+        if weight_norm == 0:
+            return np.zeros(len(nodes), dtype=np.float64)
+        cos_axis = np.clip((self.axes[nodes] @ weights) / weight_norm, -1.0, 1.0)
+        sin_axis = np.sqrt(np.maximum(0.0, 1.0 - cos_axis * cos_axis))
+        cos_half, sin_half = self.cos_half_angle[nodes], self.sin_half_angle[nodes]
+        
+        # cos(angle(w, axis) - half_angle), or 1 when w lies inside the cone
+        bound = cos_axis * cos_half + sin_axis * sin_half
+        bound = np.where(cos_axis >= cos_half, 1.0, bound)
+        return self.radius[nodes] * weight_norm * bound + BOUND_EPSILON
+    
+    def search(self, weights: np.ndarray, k: int, floor: float = -np.inf,
+               rows: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and scores of the k best sections by e @ weights, best first.
+        
+        Subtrees whose bound falls below `floor` (e.g. the k-th score already
+        held by a cross-document accumulator) are skipped too. With `rows`
+        (e.g. a level/page filter), other sections are still descended through
+        but never scored; a cone bounds its subtree's allowed rows as well, so
+        the result is still exact.
+        """
+        allowed = None
+        if rows is not None:
+            allowed = np.zeros(len(self.embeddings), dtype=bool)
+            allowed[rows] = True
+        weights = np.asarray(weights, dtype=np.float32)
+        weight_norm = float(np.linalg.norm(weights))
+        best: List[Tuple[float, int]] = []  # min-heap of (score, -row)
+        frontier = [(-float(self.upper_bounds([0], weights, weight_norm)[0]), 0)]
+        visited = scored = 0
+        
+        while frontier and k > 0:
+            threshold = best[0][0] if len(best) >= k else floor
+            negative_bound, node = heapq.heappop(frontier)
+            if -negative_bound < threshold:
+                break
+            visited += 1
+            
+            row = self.node_rows[node]
+            if row >= 0 and (allowed is None or allowed[row]):
+                score = float(self.embeddings[row] @ weights)
+                scored += 1
+                entry = (score, -row)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+                threshold = best[0][0] if len(best) >= k else floor
+            
+            kids = self.children[node]
+            if kids:
+                for child, bound in zip(kids, self.upper_bounds(kids, weights, weight_norm)):
+                    if bound >= threshold:
+                        heapq.heappush(frontier, (-float(bound), child))
+        
+        ordered = sorted(best, key=lambda item: (-item[0], -item[1]))
+        self.last_stats = {'nodes': len(self.node_rows), 'visited': visited, 'scored': scored}
+        rows = np.array([-negative_row for _, negative_row in ordered], dtype=np.int64)
+        scores = np.array([score for score, _ in ordered], dtype=np.float64)
+        return rows, scores
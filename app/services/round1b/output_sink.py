@@ -0,0 +1,158 @@
+﻿"""
+Bulk output sink: compact per-collection files and one NDJSON results stream, flushed in batches
+"""
+
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from config.settings import Settings
+
+OUTPUT_MODES = ('files', 'bulk', 'ndjson')
+
+def validate_output_mode(mode: str) -> str:
+    """Normalized output mode, or ValueError for an unknown one"""
+    mode = (mode or '').lower()
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{mode}' (expected one of {', '.join(OUTPUT_MODES)})")
+    return mode
+
+def _discard(path: Path):
+    """Best-effort removal of a staged temp file"""
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+def compact_json(data: Dict) -> str:
+    """Same JSON as the pretty-printed output minus insignificant whitespace"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+class OutputSink:
+    """Collects finished collection outputs and writes them a batch at a time.
+    
+    'bulk' writes each collection's challenge1b_output.json in compact form and
+    appends a {"collection", "output"} record per collection to one NDJSON file
+    (or stdout); 'ndjson' writes the stream only. The stream is appended and
+    fsynced once per batch. Per-collection files are staged under temp names,
+    fsynced and renamed into place together, so readers never see a partial
+    file and each directory is synced once per batch.
+    
+    Write errors never propagate: the collections they hit are handed back by
+    flush() and close() so the caller can report them as failed.
+    """
+    
+    def __init__(self, mode: str = None, ndjson_path: str = None, batch_size: int = None, output_dir: str = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        if output_dir:
+            self.settings.output_dir = output_dir
+        self.mode = validate_output_mode(mode or self.settings.output_mode)
+        self.write_files = self.mode == 'bulk'
+        self.write_stream = self.mode in ('bulk', 'ndjson')
+        self.ndjson_path = ndjson_path or self.settings.get_output_ndjson_path()
+        self.batch_size = max(1, batch_size or self.settings.output_batch_size)
+        
+        self._pending: List[Tuple[Path, Dict]] = []
+        self._stream = None
+        self.written = 0
+    
+    def _open_stream(self):
+        if self._stream is None:
+            if self.ndjson_path == '-':
+                self._stream = sys.stdout
+            else:
+                Path(self.ndjson_path).parent.mkdir(parents=True, exist_ok=True)
+                self._stream = open(self.ndjson_path, 'a', encoding='utf-8')
+        return self._stream
+    
+    def add(self, collection_path: Path, output: Dict) -> Dict[Path, str]:
+        """Queue one collection's output; writes the batch once it is full (see flush)"""
+        self._pending.append((Path(collection_path), output))
+        if len(self._pending) >= self.batch_size:
+            return self.flush()
+        return {}
+    
+    def flush(self) -> Dict[Path, str]:
+        """Write and fsync every pending output; returns {collection path: error} for failed writes"""
+        failures: Dict[Path, str] = {}
+        if not self._pending:
+            return failures
+        batch, self._pending = self._pending, []
+        
+        if self.write_stream:
+            try:
+                stream = self._open_stream()
+                stream.write(''.join(
+                    compact_json({'collection': path.name, 'output': output}) + '\n' for path, output in batch
+                ))
+                stream.flush()
+                if stream is not sys.stdout:
+                    os.fsync(stream.fileno())
+            except (OSError, ValueError) as e:
+                # Part of the batch may have reached the stream; none of it is known to be durable
+                self.logger.error(f'Error writing the results stream {self.ndjson_path}: {str(e)}')
+                failures.update((path, f'results stream write failed: {str(e)}') for path, _ in batch)
+        
+        if self.write_files:
+            failures.update(self._write_files(batch))
+        
+        self.written += len(batch) - len(failures)
+        self.logger.debug(f'Flushed {len(batch)} output(s), {len(failures)} failed')
+        return failures
+    
+    def _write_files(self, batch: List[Tuple[Path, Dict]]) -> Dict[Path, str]:
+        """Temp files for the whole batch, fsync, then rename into place"""
+        failures: Dict[Path, str] = {}
+        staged = []
+        for collection_path, output in batch:
+            output_file = self.settings.get_output_file(collection_path)
+            temp_path = output_file.with_name(f'.{output_file.name}.{os.getpid()}.tmp')
+            try:
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(compact_json(output))
+                    f.flush()
+                    os.fsync(f.fileno())
+                staged.append((collection_path, temp_path, output_file))
+            except OSError as e:
+                self.logger.error(f'Error writing output for {collection_path.name}: {str(e)}')
+                failures[collection_path] = f'output write failed: {str(e)}'
+                _discard(temp_path)
+        
+        directories = set()
+        for collection_path, temp_path, output_file in staged:
+            try:
+                os.replace(temp_path, output_file)
+            except OSError as e:
+                self.logger.error(f'Error moving output into place for {collection_path.name}: {str(e)}')
+                failures[collection_path] = f'output write failed: {str(e)}'
+                _discard(temp_path)
+                continue
+            directories.add(output_file.parent)
+        
+        # Make the renames themselves durable (not supported everywhere, e.g. Windows)
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+        return failures
+    
+    def close(self) -> Dict[Path, str]:
+        """Flush what is left and close the stream (see flush)"""
+        failures = self.flush()
+        if self._stream is not None and self._stream is not sys.stdout:
+            try:
+                self._stream.close()
+            except OSError as e:
+                self.logger.error(f'Error closing the results stream {self.ndjson_path}: {str(e)}')
+        self._stream = None
+        return failures
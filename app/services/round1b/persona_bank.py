@@ -0,0 +1,182 @@
+﻿"""
+Precomputed persona vector bank with embedding-based role resolution
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.settings import Settings
+
+class PersonaBank:
+    def __init__(self, embedding_generator, personas: Dict[str, List[str]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        self.embedding_generator = embedding_generator
+        self.personas: Dict[str, List[str]] = personas or self.settings.persona_queries
+        
+        # Filled by build() / load()
+        self.names: List[str] = list(self.personas.keys())
+        self.label_matrix: Optional[np.ndarray] = None     # (P, D) persona name vectors
+        self.centroid_matrix: Optional[np.ndarray] = None  # (P, D) normalized mean of term vectors
+        self.term_matrix: Optional[np.ndarray] = None      # (T, D) all term vectors, persona-major
+        self.term_offsets: Optional[np.ndarray] = None     # (P + 1,) slice bounds into term_matrix
+        
+        # Role string -> resolved persona name (None when nothing is close enough)
+        self._role_cache: Dict[str, Optional[str]] = {}
+    
+    def _definition_hash(self) -> str:
+        """Hash of persona names and terms so stale banks are detected"""
+        payload = json.dumps(self.personas, sort_keys=True).encode('utf-8')
+        return hashlib.sha1(payload).hexdigest()[:16]
+    
+    def build(self):
+        """Embed every persona label and term in a single encoder pass"""
+        self.names = list(self.personas.keys())
+        terms = [term for name in self.names for term in self.personas[name]]
+        
+        embeddings = self.embedding_generator.encode_texts(self.names + terms)
+        self.label_matrix = np.asarray(embeddings[:len(self.names)], dtype=np.float32)
+        self.term_matrix = np.asarray(embeddings[len(self.names):], dtype=np.float32)
+        
+        offsets = [0]
+        for name in self.names:
+            offsets.append(offsets[-1] + len(self.personas[name]))
+        self.term_offsets = np.asarray(offsets, dtype=np.int64)
+        
+        # Centroid per persona, re-normalized so dot products stay cosine similarities
+        centroids = np.stack([
+            self.term_matrix[self.term_offsets[i]:self.term_offsets[i + 1]].mean(axis=0)
+            for i in range(len(self.names))
+        ])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroid_matrix = (centroids / np.maximum(norms, 1e-12)).astype(np.float32)
+        
+        self._role_cache.clear()
+        self.logger.info(f'Built persona bank: {len(self.names)} personas, {len(terms)} terms')
+    
+    def save(self, bank_path: Path) -> bool:
+        """Persist bank matrices next to the model"""
+        try:
+            bank_path = Path(bank_path)
+            bank_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(
+                bank_path,
+                names=np.asarray(self.names),
+                label_matrix=self.label_matrix,
+                centroid_matrix=self.centroid_matrix,
+                term_matrix=self.term_matrix,
+                term_offsets=self.term_offsets,
+                model_fingerprint=np.asarray(self.embedding_generator.get_model_fingerprint()),
+                definition_hash=np.asarray(self._definition_hash())
+            )
+            return True
+        except Exception as e:
+            self.logger.warning(f'Could not save persona bank to {bank_path}: {str(e)}')
+            return False
+    
+    def load(self, bank_path: Path) -> bool:
+        """Load a saved bank if it matches the current model and persona definitions"""
+        bank_path = Path(bank_path)
+        if not bank_path.exists():
+            return False
+        
+        try:
+            with np.load(bank_path) as data:
+                if str(data['model_fingerprint']) != self.embedding_generator.get_model_fingerprint():
+                    self.logger.info('Persona bank was built with a different model, rebuilding')
+                    return False
+                if str(data['definition_hash']) != self._definition_hash():
+                    self.logger.info('Persona definitions changed, rebuilding persona bank')
+                    return False
+                
+                self.names = [str(name) for name in data['names']]
+                self.label_matrix = data['label_matrix']
+                self.centroid_matrix = data['centroid_matrix']
+                self.term_matrix = data['term_matrix']
+                self.term_offsets = data['term_offsets']
+            
+            self._role_cache.clear()
+            self.logger.info(f'Loaded persona bank from: {bank_path}')
+            return True
+        
+        except Exception as e:
+            self.logger.warning(f'Could not load persona bank from {bank_path}: {str(e)}')
+            return False
+    
+    def load_or_build(self, bank_path: Path = None):
+        """Load the persisted bank, building (and caching) it when missing or stale"""
+        if bank_path is None:
+            bank_path = Path(self.settings.persona_bank_path)
+        
+        if not self.load(bank_path):
+            self.build()
+            self.save(bank_path)
+    
+    def export_arrays(self) -> Dict[str, np.ndarray]:
+        """Bank matrices keyed for a shared memory arena"""
+        return {
+            'persona/label_matrix': self.label_matrix,
+            'persona/centroid_matrix': self.centroid_matrix,
+            'persona/term_matrix': self.term_matrix,
+            'persona/term_offsets': self.term_offsets
+        }
+    
+    def adopt_arrays(self, names: List[str], arrays: Dict[str, np.ndarray]):
+        """Use matrices owned elsewhere (e.g. shared memory views) instead of building"""
+        self.names = list(names)
+        self.label_matrix = arrays['persona/label_matrix']
+        self.centroid_matrix = arrays['persona/centroid_matrix']
+        self.term_matrix = arrays['persona/term_matrix']
+        self.term_offsets = arrays['persona/term_offsets']
+        self._role_cache.clear()
+    
+    def resolve_role(self, job_role: str) -> Optional[str]:
+        """Map an arbitrary role string onto the nearest known persona"""
+        role_key = ' '.join(job_role.lower().split())
+        if role_key in self._role_cache:
+            return self._role_cache[role_key]
+        
+        resolved = None
+        
+        # Exact (case/whitespace-insensitive) name match needs no encoder call
+        for name in self.names:
+            if ' '.join(name.lower().split()) == role_key:
+                resolved = name
+                break
+        
+        if resolved is None and role_key:
+            role_embedding = self.embedding_generator.encode_single(job_role)
+            
+            # Compare against both the persona name and its term centroid
+            similarity = np.maximum(
+                self.label_matrix @ role_embedding,
+                self.centroid_matrix @ role_embedding
+            )
+            best = int(np.argmax(similarity))
+            
+            if similarity[best] >= self.settings.persona_match_threshold:
+                resolved = self.names[best]
+                self.logger.info(f"Resolved role '{job_role}' to persona '{resolved}' (similarity {similarity[best]:.3f})")
+            else:
+                self.logger.info(f"No persona close to role '{job_role}' (best similarity {similarity[best]:.3f})")
+        
+        self._role_cache[role_key] = resolved
+        return resolved
+    
+    def get_centroid(self, persona: str) -> np.ndarray:
+        """Precomputed centroid vector for a persona"""
+        return self.centroid_matrix[self.names.index(persona)]
+    
+    def get_term_matrix(self, persona: str) -> np.ndarray:
+        """Precomputed term vectors for a persona"""
+        idx = self.names.index(persona)
+        return self.term_matrix[self.term_offsets[idx]:self.term_offsets[idx + 1]]
+    
+    def get_terms(self, persona: str) -> List[str]:
+        """Expansion terms for a persona"""
+        return self.personas.get(persona, [])
@@ -4,38 +4,38 @@ Persona-driven content matching and relevance scoring
 
 import logging
 import json
-from typing import Dict, List, Tuple
+import numpy as np
+from typing import Dict, List, Sequence, Tuple
+from config.settings import Settings
 from services.round1b.embedding_generator import EmbeddingGenerator
+from services.round1b.outline_pack import PackedSections
+from services.round1b.persona_bank import PersonaBank
+from services.round1b.section_deduplicator import SectionDeduplicator
 
 class PersonaMatcher:
-    def __init__(self):
+    def __init__(self, shared_arena=None):
         self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
         self.embedding_generator = EmbeddingGenerator()
+        self.deduplicator = SectionDeduplicator()
+        
+        # Persona vectors are embedded once (or loaded from disk), never per request;
+        # workers map the parent's copy from shared memory when one is provided
+        self.persona_bank = PersonaBank(self.embedding_generator)
+        if shared_arena is not None and 'persona_names' in shared_arena.metadata:
+            self.persona_bank.adopt_arrays(
+                shared_arena.metadata['persona_names'],
+                {name: shared_arena.get(name) for name in self.persona_bank.export_arrays()}
+            )
+        else:
+            self.persona_bank.load_or_build()
         
         # Persona expansion templates
-        self.persona_templates = {
-            'software_engineer': [
-                'technical implementation',
-                'coding practices',
-                'system architecture',
-                'development tools',
-                'programming languages'
-            ],
-            'product_manager': [
-                'product strategy',
-                'user requirements',
-                'market analysis',
-                'roadmap planning',
-                'stakeholder management'
-            ],
-            'data_scientist': [
-                'machine learning',
-                'statistical analysis',
-                'data modeling',
-                'research methodology',
-                'analytics tools'
-            ]
-        }
+        self.persona_templates = self.persona_bank.personas
+        
+        # Query text -> embedding, so repeated tasks skip the encoder
+        self._query_cache: Dict[str, np.ndarray] = {}
+        self._truncated_query_cache: Dict[str, np.ndarray] = {}
     
     def expand_query(self, job_role: str, query: str) -> str:
         """Expand query with persona-specific context"""
@@ -45,52 +45,140 @@ class PersonaMatcher:
         expanded_terms.append(query)
         
         # Add role-specific terms
-        role_key = job_role.lower().replace(' ', '_')
-        if role_key in self.persona_templates:
-            relevant_terms = self.persona_templates[role_key]
-            expanded_terms.extend(relevant_terms[:3])  # Limit expansion
+        persona = self.persona_bank.resolve_role(job_role)
+        if persona:
+            relevant_terms = self.persona_bank.get_terms(persona)
+            expanded_terms.extend(relevant_terms[:self.settings.persona_expansion_terms])  # Limit expansion
         
         return ' '.join(expanded_terms)
     
-    def calculate_persona_relevance(self, content: str, job_role: str, query: str) -> float:
-        """Calculate relevance score for persona-specific content"""
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embed the task query once per distinct text"""
+        if query not in self._query_cache:
+            self._query_cache[query] = self.embedding_generator.encode_single(query)
+        return self._query_cache[query]
+    
+    def get_persona_vector(self, job_role: str, query: str) -> np.ndarray:
+        """Precomputed persona-fit vector for a role"""
+        persona = self.persona_bank.resolve_role(job_role)
+        if persona:
+            return self.persona_bank.get_centroid(persona)
         
-        # Generate embeddings
-        content_embedding = self.embedding_generator.encode_single(content)
-        query_embedding = self.embedding_generator.encode_single(query)
+        # Unknown persona: no expansion, persona fit degrades to query fit
+        return self.encode_query(query)
+    
+    def get_section_text(self, section: Dict) -> str:
+        """Combine section text and child context for embedding"""
+        section_text = section.get('text', '')
+        if section.get('children'):
+            # Include child content for context
+            child_texts = [child.get('text', '') for child in section['children']]
+            section_text += ' ' + ' '.join(child_texts)
+        return section_text
+    
+    def get_section_texts(self, sections: Sequence[Dict]) -> List[str]:
+        """Embedding texts for a batch; packed outlines are read without building row dicts"""
+        if isinstance(sections, PackedSections):
+            return sections.section_texts()
+        return [self.get_section_text(section) for section in sections]
+    
+    def get_weight_vector(self, job_role: str, query: str) -> np.ndarray:
+        """Single vector w with score_embeddings(E) == E @ w (scoring is linear)"""
+        return (self.settings.query_weight * self.encode_query(query) +
+                self.settings.persona_weight * self.get_persona_vector(job_role, query)).astype(np.float32)
+    
+    def score_embeddings(self, embeddings: np.ndarray, job_role: str, query: str) -> np.ndarray:
+        """Score precomputed section embeddings against query and persona"""
+        query_embedding = self.encode_query(query)
+        persona_embedding = self.get_persona_vector(job_role, query)
         
-        # Expand query with persona context
-        expanded_query = self.expand_query(job_role, query)
-        persona_embedding = self.embedding_generator.encode_single(expanded_query)
+        # Weighted combination (70% query relevance, 30% persona fit)
+        return (self.settings.query_weight * (embeddings @ query_embedding) +
+                self.settings.persona_weight * (embeddings @ persona_embedding))
+    
+    def _collapse_sections(self, sections: List[Dict], texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Representative rows and row -> cluster map for duplicate sections"""
+        if not self.settings.dedup_enabled or len(texts) < 2:
+            return np.arange(len(texts)), np.arange(len(texts))
         
-        # Calculate similarities
-        content_query_sim = self.embedding_generator.calculate_similarity(
-            content_embedding, query_embedding
-        )
-        content_persona_sim = self.embedding_generator.calculate_similarity(
-            content_embedding, persona_embedding
-        )
+        clusters = self.deduplicator.collapse(texts)
+        representatives = clusters['representatives']
+        assignment = clusters['assignment']
         
-        # Weighted combination (70% query relevance, 30% persona fit)
-        final_score = 0.7 * content_query_sim + 0.3 * content_persona_sim
+        if len(representatives) < len(texts):
+            self.logger.debug(f'Collapsed {len(texts)} sections into {len(representatives)} clusters')
+            self._attach_cluster_pages(sections, assignment, len(representatives))
+        
+        return representatives, assignment
+    
+    def embed_sections(self, sections: List[Dict]) -> np.ndarray:
+        """Embed sections in one batched encoder pass, once per duplicate cluster"""
+        texts = self.get_section_texts(sections)
+        representatives, assignment = self._collapse_sections(sections, texts)
         
-        return float(final_score)
+        # Encode representatives only, then fan vectors back out to every member
+        rep_embeddings = self.embedding_generator.encode_texts([texts[i] for i in representatives])
+        return rep_embeddings[assignment]
+    
+    def _attach_cluster_pages(self, sections: List[Dict], assignment: np.ndarray, cluster_count: int):
+        """Give members of duplicate clusters the shared list of pages they appear on"""
+        if isinstance(sections, PackedSections):
+            pages = sections.pages().tolist()
+        else:
+            pages = [section.get('page', 1) for section in sections]
+        
+        cluster_pages: List[List] = [[] for _ in range(cluster_count)]
+        for page, cluster in zip(pages, assignment):
+            cluster_pages[cluster].append(page)
+        
+        # Only rows in real clusters are touched (and, for packs, materialized)
+        for row, cluster in enumerate(assignment):
+            if len(cluster_pages[cluster]) > 1:
+                sections[row]['cluster_pages'] = cluster_pages[cluster]
+    
+    def score_sections(self, sections: List[Dict], job_role: str, query: str) -> np.ndarray:
+        """Score sections in one batched encoder pass"""
+        if not sections:
+            return np.zeros(0, dtype=np.float32)
+        
+        if self.settings.cascade_enabled and len(sections) > self.settings.cascade_candidates:
+            return self.cascade_score_sections(sections, job_role, query)
+        
+        return self.score_embeddings(self.embed_sections(sections), job_role, query)
+    
+    def cascade_score_sections(self, sections: List[Dict], job_role: str, query: str) -> np.ndarray:
+        """Two-stage scoring: truncated-layer filter, full-model re-score of the top N"""
+        texts = self.get_section_texts(sections)
+        representatives, assignment = self._collapse_sections(sections, texts)
+        rep_texts = [texts[i] for i in representatives]
+        
+        # Stage one: first few transformer layers, query relevance only
+        layers = self.settings.cascade_layers
+        if query not in self._truncated_query_cache:
+            self._truncated_query_cache[query] = self.embedding_generator.encode_texts_truncated([query], layers)[0]
+        stage_one = self.embedding_generator.encode_texts_truncated(rep_texts, layers) @ self._truncated_query_cache[query]
+        
+        # Stage two: full model on the N best candidates
+        n = min(self.settings.cascade_candidates, len(rep_texts))
+        candidates = np.argpartition(-stage_one, n - 1)[:n]
+        full_embeddings = self.embedding_generator.encode_texts([rep_texts[i] for i in candidates])
+        
+        # Filtered-out rows keep their stage-one order but rank below every candidate
+        # (combined scores are cosine mixes, so they never drop under -1)
+        rep_scores = stage_one.astype(np.float64) - 2.0
+        rep_scores[candidates] = self.score_embeddings(full_embeddings, job_role, query)
+        
+        return rep_scores[assignment]
+    
+    def calculate_persona_relevance(self, content: str, job_role: str, query: str) -> float:
+        """Calculate relevance score for persona-specific content"""
+        content_embedding = self.embedding_generator.encode_single(content)
+        return float(self.score_embeddings(content_embedding[np.newaxis, :], job_role, query)[0])
     
     def rank_sections(self, sections: List[Dict], job_role: str, query: str) -> List[Tuple[Dict, float]]:
         """Rank document sections by persona relevance"""
-        scored_sections = []
-        
-        for section in sections:
-            # Combine section text and context
-            section_text = section.get('text', '')
-            if section.get('children'):
-                # Include child content for context
-                child_texts = [child.get('text', '') for child in section['children']]
-                section_text += ' ' + ' '.join(child_texts)
-            
-            # Calculate relevance score
-            score = self.calculate_persona_relevance(section_text, job_role, query)
-            scored_sections.append((section, score))
+        scores = self.score_sections(sections, job_role, query)
+        scored_sections = [(section, float(score)) for section, score in zip(sections, scores)]
         
         # Sort by score (descending)
         return sorted(scored_sections, key=lambda x: x[1], reverse=True)
@@ -0,0 +1,332 @@
+﻿"""
+Speed/quality evaluation of ranking configurations against a reference configuration
+"""
+
+import logging
+import math
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import Settings
+from services.round1b.challenge1b_input_handler import Challenge1BInputHandler
+from services.round1b.challenge1b_output_formatter import Challenge1BOutputFormatter
+from services.round1b.embedding_generator import EmbeddingGenerator
+from services.round1b.persona_matcher import PersonaMatcher
+from services.round1b.section_filter_index import SectionFilterIndex
+from services.round1b.topk_accumulator import TopKAccumulator
+from services.round1b.vector_codecs import CompressedVectorIndex
+from utils.file_handler import FileHandler
+
+# Exact pipeline: no collapse, no cascade, float32 model and scoring, untruncated inputs
+REFERENCE_CONFIG = {
+    'name': 'reference',
+    'overrides': {'dedup_enabled': False, 'dedup_fuzzy_enabled': False, 'cascade_enabled': False,
+                  'embedding_codec': 'float32', 'encode_precision': 'float32', 'encode_max_tokens': 0}
+}
+
+# Every speed knob the pipeline currently exposes
+DEFAULT_CANDIDATES = [
+    {'name': 'dedup', 'overrides': {'dedup_enabled': True}},
+    {'name': 'dedup+fuzzy', 'overrides': {'dedup_enabled': True, 'dedup_fuzzy_enabled': True}},
+    {'name': 'cascade-2', 'overrides': {'cascade_enabled': True, 'cascade_layers': 2}},
+    {'name': 'cascade-3', 'overrides': {'cascade_enabled': True, 'cascade_layers': 3}},
+    {'name': 'int8', 'overrides': {'embedding_codec': 'int8', 'codec_exact_rescore': False}},
+    {'name': 'pq', 'overrides': {'embedding_codec': 'pq', 'codec_exact_rescore': False}},
+    {'name': 'pq+rescore', 'overrides': {'embedding_codec': 'pq', 'codec_exact_rescore': True}},
+    {'name': 'bf16-model', 'overrides': {'encode_precision': 'bfloat16'}},
+    {'name': 'int8-model', 'overrides': {'encode_precision': 'int8'}},
+    {'name': 'truncate-64', 'overrides': {'encode_max_tokens': 64}},
+    {'name': 'truncate-32', 'overrides': {'encode_max_tokens': 32}}
+]
+
+# Pareto objectives: (row key, True when larger is better)
+PARETO_OBJECTIVES = (
+    ('mean_latency_ms', False),
+    ('sections_per_second', True),
+    ('peak_traced_mb', False),
+    ('ndcg', True)
+)
+
+def section_key(entry: Dict) -> Tuple:
+    """Identity of an extracted section across configurations"""
+    return (entry.get('document'), entry.get('section_title'), entry.get('page_number'))
+
+def topk_overlap(reference: List[Tuple], candidate: List[Tuple]) -> float:
+    """Share of reference items that the candidate also returned"""
+    if not reference:
+        return 1.0
+    return len(set(reference) & set(candidate)) / len(reference)
+
+def kendall_tau(reference: List[Tuple], candidate: List[Tuple]) -> Optional[float]:
+    """Kendall tau over the items both rankings contain (None if fewer than two)"""
+    position = {key: i for i, key in enumerate(candidate)}
+    common = [position[key] for key in reference if key in position]
+    n = len(common)
+    if n < 2:
+        return None
+    
+    concordant = discordant = 0
+    for i in range(n):
+        for j in range(i + 1, n):
+            if common[i] < common[j]:
+                concordant += 1
+            else:
+                discordant += 1
+    return (concordant - discordant) / (n * (n - 1) / 2)
+
+def ndcg(reference: List[Tuple], candidate: List[Tuple], k: int = None) -> float:
+    """NDCG@k with graded relevance k - reference_rank (0 for items outside the reference)"""
+    k = k or len(reference)
+    relevance = {key: k - i for i, key in enumerate(reference[:k])}
+    
+    def dcg(keys: List[Tuple]) -> float:
+        return sum(relevance.get(key, 0) / math.log2(i + 2) for i, key in enumerate(keys[:k]))
+    
+    ideal = dcg(reference)
+    return dcg(candidate) / ideal if ideal else 1.0
+
+class RankingEvaluator:
+    def __init__(self, matcher: PersonaMatcher = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        self.input_handler = Challenge1BInputHandler()
+        self.file_handler = FileHandler()
+        
+        # One warm model shared by every configuration, plus one per other precision when asked for
+        self.persona_matcher = matcher or PersonaMatcher()
+        self.output_formatter = Challenge1BOutputFormatter()
+        self._generators = {self.persona_matcher.embedding_generator.precision: self.persona_matcher.embedding_generator}
+    
+    # ---- workloads --------------------------------------------------------------
+    
+    def load_bundled_collections(self, collections_dir: Path) -> List[Dict]:
+        """Parse every bundled collection once, up front"""
+        collections = []
+        for input_file in sorted(Path(collections_dir).glob(f'*/{self.settings.challenge_input_file}')):
+            query_data = self.input_handler.convert_to_internal_format(
+                self.input_handler.load_challenge_input(input_file)
+            )
+            documents = []
+            for doc_info in query_data['documents']:
+                outline_path = input_file.parent / doc_info['outline_file']
+                if not outline_path.exists():
+                    continue
+                sections = self.file_handler.load_json(outline_path).get('outline', [])
+                for section in sections:
+                    section['document'] = doc_info['name']
+                    section['title'] = doc_info.get('title', doc_info['name'])
+                documents.append(sections)
+            collections.append({'name': input_file.parent.name, 'query_data': query_data, 'documents': documents})
+        return collections
+    
+    def synthetic_collections(self, base: List[Dict], count: int, documents: int = 8,
+                              sections_per_document: int = 60, seed: int = 0) -> List[Dict]:
+        """Larger collections recombined from bundled headings, with light word shuffles"""
+        rng = random.Random(seed)
+        pool = [section for collection in base for sections in collection['documents'] for section in sections]
+        if not pool:
+            return []
+        
+        collections = []
+        for c in range(count):
+            template = base[c % len(base)]['query_data']
+            docs = []
+            for d in range(documents):
+                name = f'synthetic_{c}_{d}.pdf'
+                sections = []
+                for section in rng.sample(pool, min(sections_per_document, len(pool))):
+                    words = section.get('text', '').split()
+                    if len(words) > 3 and rng.random() < 0.3:
+                        rng.shuffle(words)
+                    sections.append({**section, 'text': ' '.join(words), 'document': name, 'title': name})
+                docs.append(sections)
+            collections.append({'name': f'synthetic-{c}', 'query_data': template, 'documents': docs})
+        return collections
+    
+    # ---- configuration handling ------------------------------------------------
+    
+    def _settings_objects(self) -> List[Settings]:
+        matcher = self.persona_matcher
+        return [self.settings, matcher.settings, matcher.deduplicator.settings, self.output_formatter.settings]
+    
+    def _generator(self, precision: str) -> EmbeddingGenerator:
+        """Model at an inference precision, loaded on first use and kept for later configurations"""
+        if precision not in self._generators:
+            base = self.persona_matcher.embedding_generator
+            self._generators[precision] = EmbeddingGenerator(precision=precision, batch_size=base.batch_size)
+        return self._generators[precision]
+    
+    def _apply(self, overrides: Dict) -> Dict:
+        """Set overrides on every component's Settings and on the model; returns what to restore"""
+        matcher = self.persona_matcher
+        saved = {'settings': [], 'generator': matcher.embedding_generator, 'max_tokens': None}
+        for settings in self._settings_objects():
+            saved['settings'].append({key: getattr(settings, key) for key in overrides})
+            for key, value in overrides.items():
+                setattr(settings, key, value)
+        
+        # The loaded model only reads precision and truncation at load, so swap or adjust it
+        if 'encode_precision' in overrides:
+            matcher.embedding_generator = self._generator(overrides['encode_precision'])
+        if 'encode_max_tokens' in overrides:
+            generator = matcher.embedding_generator
+            saved['max_tokens'] = (generator, generator.max_tokens)
+            generator.set_max_tokens(overrides['encode_max_tokens'])
+        
+        # Cached query vectors must not leak between configurations
+        matcher._query_cache.clear()
+        matcher._truncated_query_cache.clear()
+        return saved
+    
+    def _restore(self, saved: Dict):
+        for settings, values in zip(self._settings_objects(), saved['settings']):
+            for key, value in values.items():
+                setattr(settings, key, value)
+        if saved['max_tokens'] is not None:
+            generator, max_tokens = saved['max_tokens']
+            generator.set_max_tokens(max_tokens)
+        self.persona_matcher.embedding_generator = saved['generator']
+    
+    # ---- running ----------------------------------------------------------------
+    
+    def rank_collection(self, collection: Dict) -> Dict:
+        """Rank and format one in-memory collection under the current settings"""
+        query_data = collection['query_data']
+        job_role, query = query_data.get('job_role', ''), query_data.get('query', '')
+        top_k = self.settings.get_ranking_top_k()
+        matcher = self.persona_matcher
+        
+        # Same filtered-candidate rows for the exact and the compressed (ANN) path
+        filter_index = SectionFilterIndex(query_data.get('filters'))
+        document_rows = []
+        for sections in collection['documents']:
+            name = sections[0].get('document', '') if sections else ''
+            document_rows.append(filter_index.rows(filter_index.add_document(name, sections)))
+        
+        if self.settings.embedding_codec == 'float32':
+            accumulator = TopKAccumulator(top_k)
+            for sections, rows in zip(collection['documents'], document_rows):
+                if rows is None:
+                    accumulator.add(sections, matcher.score_sections(sections, job_role, query))
+                elif len(rows):
+                    subset = [sections[int(row)] for row in rows]
+                    accumulator.add(sections, matcher.score_sections(subset, job_role, query), rows=rows)
+            ranked = accumulator.results()
+        else:
+            # Compressed path: one index over the collection, scored with the
+            # combined query/persona vector (scoring is linear in the embedding)
+            sections = [section for document in collection['documents'] for section in document]
+            embeddings = matcher.embed_sections(sections)
+            index = CompressedVectorIndex(embeddings, self.settings.embedding_codec, rescore_vectors=embeddings)
+            candidates = None
+            if filter_index.active:
+                offsets = np.cumsum([0] + [len(document) for document in collection['documents']])
+                candidates = np.concatenate([rows + offset for rows, offset in zip(document_rows, offsets)]
+                                            or [np.zeros(0, dtype=np.int64)])
+            weights = matcher.get_weight_vector(job_role, query)
+            hits = index.search(weights, top_k, rescore=self.settings.codec_exact_rescore, rows=candidates)
+            ranked = [(sections[row], score) for row, score in hits]
+        
+        return self.output_formatter.format_challenge_output(query_data, ranked)
+    
+    def run_config(self, config: Dict, collections: List[Dict], repeats: int = 1) -> Dict:
+        """Outputs plus latency, throughput and traced peak memory for one configuration.
+        
+        tracemalloc hooks every allocation and slows ranking down unevenly across
+        configurations, so latency comes from untraced passes and peak memory
+        from one separate traced pass per collection.
+        """
+        saved = self._apply(config.get('overrides', {}))
+        try:
+            # Warm-up pass (query/persona vectors, codec imports) is not timed
+            self.rank_collection(collections[0])
+            
+            outputs, latencies, peaks = {}, [], []
+            for collection in collections:
+                for _ in range(repeats):
+                    start = time.perf_counter()
+                    outputs[collection['name']] = self.rank_collection(collection)
+                    latencies.append(time.perf_counter() - start)
+                
+                tracemalloc.start()
+                try:
+                    self.rank_collection(collection)
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+        finally:
+            self._restore(saved)
+        
+        section_count = sum(len(sections) for c in collections for sections in c['documents']) * repeats
+        return {
+            'name': config['name'],
+            'outputs': outputs,
+            'mean_latency_ms': 1000.0 * float(np.mean(latencies)),
+            'p95_latency_ms': 1000.0 * float(np.percentile(latencies, 95)),
+            'sections_per_second': section_count / max(sum(latencies), 1e-9),
+            'peak_traced_mb': max(peaks) / 1024 / 1024
+        }
+    
+    def compare(self, reference: Dict, candidate: Dict) -> Dict:
+        """Mean ranking agreement of a candidate's extracted_sections with the reference's"""
+        overlaps, taus, ndcgs = [], [], []
+        for name, reference_output in reference['outputs'].items():
+            ref_keys = [section_key(s) for s in reference_output.get('extracted_sections', [])]
+            cand_keys = [section_key(s) for s in candidate['outputs'].get(name, {}).get('extracted_sections', [])]
+            overlaps.append(topk_overlap(ref_keys, cand_keys))
+            ndcgs.append(ndcg(ref_keys, cand_keys))
+            tau = kendall_tau(ref_keys, cand_keys)
+            if tau is not None:
+                taus.append(tau)
+        
+        return {
+            'topk_overlap': float(np.mean(overlaps)),
+            'kendall_tau': float(np.mean(taus)) if taus else None,
+            'ndcg': float(np.mean(ndcgs))
+        }
+    
+    def evaluate(self, collections: List[Dict], candidates: List[Dict] = None,
+                 reference: Dict = None, repeats: int = 1) -> List[Dict]:
+        """Run reference and candidates; one row per configuration with a Pareto flag"""
+        reference = reference or REFERENCE_CONFIG
+        candidates = DEFAULT_CANDIDATES if candidates is None else candidates
+        
+        reference_run = self.run_config(reference, collections, repeats)
+        rows = []
+        for config in [reference] + list(candidates):
+            if config is reference:
+                run = reference_run
+            else:
+                # Candidates change their own knobs relative to the reference
+                merged = {'name': config['name'], 'overrides': {**reference['overrides'], **config['overrides']}}
+                try:
+                    run = self.run_config(merged, collections, repeats)
+                except Exception as e:
+                    # e.g. int8 on a torch build without a quantized engine
+                    self.logger.warning(f"Skipped {config['name']}: {str(e)}")
+                    continue
+            row = {key: value for key, value in run.items() if key != 'outputs'}
+            row.update(self.compare(reference_run, run))
+            row['speedup'] = reference_run['mean_latency_ms'] / max(run['mean_latency_ms'], 1e-9)
+            rows.append(row)
+            self.logger.info(f"Evaluated {config['name']}: {row['mean_latency_ms']:.1f} ms, NDCG {row['ndcg']:.3f}")
+        
+        return self.mark_pareto(rows)
+    
+    def mark_pareto(self, rows: List[Dict]) -> List[Dict]:
+        """Flag configurations that no other one dominates on latency, throughput, peak memory and NDCG"""
+        def at_least_as_good(a: Dict, b: Dict, key: str, larger_is_better: bool) -> bool:
+            return a[key] >= b[key] if larger_is_better else a[key] <= b[key]
+        
+        def dominates(a: Dict, b: Dict) -> bool:
+            return all(at_least_as_good(a, b, key, larger) for key, larger in PARETO_OBJECTIVES) and \
+                any(a[key] != b[key] for key, _ in PARETO_OBJECTIVES)
+        
+        for row in rows:
+            row['pareto'] = not any(dominates(other, row) for other in rows if other is not row)
+        return sorted(rows, key=lambda row: row['mean_latency_ms'])
@@ -12,7 +12,7 @@ from config.settings import Settings  # ADD THIS IMPORT
 from services.round1b.document_loader import DocumentLoader
 from services.round1b.persona_matcher import PersonaMatcher
 from utils.file_handler import FileHandler
-from utils.logger import setup_logger
+from utils.logger import SAMPLED, setup_logger
 
 class RelevanceRanker:
     def __init__(self):
@@ -91,7 +91,7 @@ class RelevanceRanker:
             outline_filename = doc_info.get('outline_file', f"{doc_info['name'].replace('.pdf', '_outline.json')}")
             outline_path = collection_dir / outline_filename
             
-            self.logger.debug(f"Looking for outline: {outline_path}")
+            self.logger.debug("Looking for outline: %s", outline_path, extra=SAMPLED)
             
             if outline_path.exists():
                 try:
@@ -132,7 +132,7 @@ class RelevanceRanker:
                     }
                     all_results.append(doc_results)
                     
-                    self.logger.info(f"   Processed {len(sections)} sections from {doc_info['name']}")
+                    self.logger.info("   Processed %d sections from %s", len(sections), doc_info['name'], extra=SAMPLED)
                     
                 except Exception as e:
                     self.logger.error(f"Error processing document {doc_info['name']}: {str(e)}")
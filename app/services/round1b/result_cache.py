@@ -0,0 +1,276 @@
+﻿"""
+LRU cache of formatted collection outputs for repeated persona/task requests
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from config.settings import Settings
+
+# Every setting that changes which sections are ranked, or how they are formatted
+RANKING_SETTINGS = (
+    'similarity_search_top_k', 'query_weight', 'persona_weight', 'persona_match_threshold',
+    'dedup_enabled', 'dedup_fuzzy_enabled', 'dedup_fuzzy_threshold',
+    'cascade_enabled', 'cascade_layers', 'cascade_candidates',
+    'max_extracted_sections', 'max_subsection_analyses', 'embedding_codec'
+)
+
+# Part of every context key: bump it when ranking or output formatting code changes,
+# so persisted outputs from older code are never served
+CACHE_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    context TEXT NOT NULL,
+    persona TEXT NOT NULL,
+    task TEXT NOT NULL,
+    resolved_persona TEXT,
+    vector BLOB,
+    output_json TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (context, persona, task)
+);
+
+CREATE INDEX IF NOT EXISTS idx_results_last_used ON results (last_used);
+"""
+
+def normalize_text(text: str) -> str:
+    """Case and whitespace insensitive form used for exact matches"""
+    return ' '.join((text or '').lower().split())
+
+class ResultCache:
+    """Size-bounded LRU of outputs keyed by document set, ranking settings, persona and task.
+    
+    Exact lookups match normalized (persona, task). Near lookups (optional) accept a
+    cached output for the same document set, settings and resolved persona whose
+    task embedding is within `near_threshold` cosine of the new one; those are the
+    only inputs the ranking depends on, so a reworded task reuses the ranking.
+    
+    With a `db_path`, every entry is also written to an SQLite file (WAL mode),
+    which outlives the run and is shared by worker processes; the in-memory LRU
+    stays in front of it. The file keeps the `max_entries` most recently used.
+    """
+    
+    def __init__(self, max_entries: int = None, near_threshold: float = None,
+                 db_path: Union[str, Path] = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        self.max_entries = max_entries if max_entries is not None else self.settings.result_cache_size
+        # None disables near lookups
+        if near_threshold is None and self.settings.result_cache_near_enabled:
+            near_threshold = self.settings.result_cache_near_threshold
+        self.near_threshold = near_threshold
+        
+        # (context key, persona, task) -> entry; most recently used last
+        self._entries: 'OrderedDict[Tuple[str, str, str], Dict]' = OrderedDict()
+        # context key -> entry keys, for near lookups
+        self._by_context: Dict[str, List[Tuple[str, str, str]]] = {}
+        
+        self.stats = {'exact_hits': 0, 'near_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                      'hit_seconds': 0.0}
+        
+        self.db_path = Path(db_path) if db_path else None
+        self._db: Optional[sqlite3.Connection] = None
+        self.reopen()
+    
+    # ---- persistence ------------------------------------------------------------
+    
+    def reopen(self):
+        """(Re)open the cache file; forked workers call this since connections do not survive fork"""
+        self._db = None
+        if self.db_path is None:
+            return
+        try:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self.db_path), isolation_level=None, timeout=30.0)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            self.logger.warning(f'⚠️ Result cache file unavailable, caching in memory only: {str(e)}')
+            self._db = None
+    
+    def _entry_from_row(self, row: sqlite3.Row) -> Dict:
+        return {
+            'key': (row['context'], row['persona'], row['task']),
+            'output': json.loads(row['output_json']),
+            'resolved_persona': row['resolved_persona'],
+            'vector': None if row['vector'] is None else np.frombuffer(row['vector'], dtype=np.float32)
+        }
+    
+    def _load_persisted(self, key: Tuple[str, str, str]) -> Optional[Dict]:
+        """Entry stored by an earlier run or another worker, copied into the in-memory LRU"""
+        try:
+            row = self._db.execute(
+                'SELECT * FROM results WHERE context = ? AND persona = ? AND task = ?', key
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.logger.warning(f'Result cache read failed: {str(e)}')
+            return None
+        if row is None:
+            return None
+        entry = self._entry_from_row(row)
+        self._remember(entry)
+        return entry
+    
+    def _persisted_candidates(self, context: str, resolved: Optional[str]) -> List[Dict]:
+        try:
+            rows = self._db.execute(
+                'SELECT * FROM results WHERE context = ? AND resolved_persona IS ? AND vector IS NOT NULL',
+                (context, resolved)
+            ).fetchall()
+        except sqlite3.Error as e:
+            self.logger.warning(f'Result cache read failed: {str(e)}')
+            return []
+        return [self._entry_from_row(row) for row in rows]
+    
+    def _persist(self, entry: Dict):
+        vector = entry['vector']
+        try:
+            self._db.execute('BEGIN IMMEDIATE')
+            self._db.execute(
+                'INSERT OR REPLACE INTO results (context, persona, task, resolved_persona, vector, output_json, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (*entry['key'], entry['resolved_persona'], None if vector is None else vector.tobytes(),
+                 json.dumps(entry['output'], ensure_ascii=False), time.time())
+            )
+            self._db.execute(
+                'DELETE FROM results WHERE rowid IN '
+                '(SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,)
+            )
+            self._db.execute('COMMIT')
+        except sqlite3.Error as e:
+            if self._db.in_transaction:
+                self._db.execute('ROLLBACK')
+            self.logger.warning(f'Result cache write failed: {str(e)}')
+    
+    def _touch(self, key: Tuple[str, str, str]):
+        try:
+            self._db.execute('UPDATE results SET last_used = ? WHERE context = ? AND persona = ? AND task = ?',
+                             (time.time(), *key))
+        except sqlite3.Error:
+            pass  # recency of a shared file is best effort
+    
+    # ---- lookups ----------------------------------------------------------------
+    
+    def context_key(self, documents: List[Tuple], model_fingerprint: str, filters: Dict = None,
+                    persona_definitions: str = '') -> str:
+        """Key for (name, title, version) of every document, the model, persona definitions,
+        filters, ranking settings and the cache version"""
+        digest = hashlib.sha1(f'v{CACHE_VERSION}:{model_fingerprint}:{persona_definitions}'.encode('utf-8'))
+        digest.update(json.dumps(documents).encode('utf-8'))
+        digest.update(json.dumps(filters or {}, sort_keys=True).encode('utf-8'))
+        digest.update(json.dumps({name: getattr(self.settings, name) for name in RANKING_SETTINGS},
+                                 sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def lookup(self, context: str, persona: str, task: str,
+               near_key: Callable[[], Tuple[Optional[str], np.ndarray]] = None) -> Optional[Tuple[Dict, str]]:
+        """Cached output and match kind ('exact' or 'near'), or None.
+        
+        `near_key` returns (resolved persona, task embedding); it is only called
+        when the exact lookup misses and entries for this context exist.
+        """
+        start = time.perf_counter()
+        key = (context, normalize_text(persona), normalize_text(task))
+        
+        entry = self._entries.get(key)
+        if entry is None and self._db is not None:
+            entry = self._load_persisted(key)
+        kind = 'exact'
+        if entry is None and near_key is not None and self.near_threshold is not None and \
+                (self._db is not None or self._by_context.get(context)):
+            resolved, vector = near_key()
+            entry = self._nearest(context, resolved, vector)
+            kind = 'near'
+        
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        
+        if entry['key'] in self._entries:
+            self._entries.move_to_end(entry['key'])
+        else:
+            self._remember(entry)
+        if self._db is not None:
+            self._touch(entry['key'])
+        self.stats[f'{kind}_hits'] += 1
+        self.stats['hit_seconds'] += time.perf_counter() - start
+        return copy.deepcopy(entry['output']), kind
+    
+    def _nearest(self, context: str, resolved: Optional[str], vector: np.ndarray) -> Optional[Dict]:
+        """Most similar cached task for the same context and persona, if above the threshold"""
+        best, best_similarity = None, self.near_threshold
+        if self._db is not None:
+            # The file holds every entry in memory as well
+            candidates = self._persisted_candidates(context, resolved)
+        else:
+            candidates = [self._entries[key] for key in self._by_context.get(context, [])]
+        for entry in candidates:
+            if entry['resolved_persona'] != resolved or entry['vector'] is None:
+                continue
+            # Query vectors are L2-normalized, so the dot product is the cosine
+            similarity = float(entry['vector'] @ vector)
+            if similarity >= best_similarity:
+                best, best_similarity = entry, similarity
+        return best
+    
+    def store(self, context: str, persona: str, task: str, output: Dict,
+              resolved_persona: Optional[str] = None, vector: np.ndarray = None):
+        """Insert or refresh an output, evicting the least recently used entries over the limit"""
+        if self.max_entries <= 0:
+            return
+        
+        entry = {
+            'key': (context, normalize_text(persona), normalize_text(task)),
+            'output': copy.deepcopy(output),
+            'resolved_persona': resolved_persona,
+            'vector': None if vector is None else np.asarray(vector, dtype=np.float32)
+        }
+        self._remember(entry)
+        self.stats['stores'] += 1
+        if self._db is not None:
+            self._persist(entry)
+    
+    def _remember(self, entry: Dict):
+        """Put an entry in the in-memory LRU, evicting the least recently used over the limit"""
+        key = entry['key']
+        if key not in self._entries:
+            self._by_context.setdefault(key[0], []).append(key)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            siblings = self._by_context[old_key[0]]
+            siblings.remove(old_key)
+            if not siblings:
+                del self._by_context[old_key[0]]
+            self.stats['evictions'] += 1
+    
+    def get_stats(self) -> Dict:
+        """Hit/miss counters, hit rate and mean hit latency"""
+        hits = self.stats['exact_hits'] + self.stats['near_hits']
+        lookups = hits + self.stats['misses']
+        return {
+            **{key: value for key, value in self.stats.items() if key != 'hit_seconds'},
+            'entries': len(self._entries),
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'mean_hit_ms': 1000.0 * self.stats['hit_seconds'] / hits if hits else 0.0
+        }
+    
+    def clear(self):
+        self._entries.clear()
+        self._by_context.clear()
+        if self._db is not None:
+            self._db.execute('DELETE FROM results')
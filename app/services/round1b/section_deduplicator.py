@@ -0,0 +1,109 @@
+﻿"""
+Near-duplicate section collapse so repeated headings are scored once
+"""
+
+import logging
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+from config.settings import Settings
+
+# Mersenne prime used for the MinHash universal hash family
+_MINHASH_PRIME = (1 << 61) - 1
+
+class SectionDeduplicator:
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        
+        # Fixed seed: signatures must be comparable across runs and processes
+        rng = np.random.default_rng(1234)
+        num_perm = self.settings.dedup_minhash_permutations
+        self._hash_a = rng.integers(1, _MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+        self._hash_b = rng.integers(0, _MINHASH_PRIME, size=num_perm, dtype=np.uint64)
+    
+    def normalize(self, text: str) -> str:
+        """Normalization that cannot change the (uncased) embedding"""
+        return ' '.join(text.lower().split())
+    
+    def _shingles(self, text: str) -> np.ndarray:
+        """Hashed character shingles of a normalized text"""
+        size = self.settings.dedup_shingle_size
+        if len(text) <= size:
+            grams = {text}
+        else:
+            grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+        return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+    
+    def minhash_signature(self, text: str) -> np.ndarray:
+        """MinHash signature over character shingles"""
+        shingles = self._shingles(text)
+        # (a * x + b) mod p for every permutation/shingle pair; crc32 < 2^32 and
+        # a < 2^61 can overflow uint64, which is fine for hashing purposes
+        hashed = (np.outer(self._hash_a, shingles) + self._hash_b[:, np.newaxis]) % np.uint64(_MINHASH_PRIME)
+        return hashed.min(axis=1)
+    
+    def _fuzzy_merge(self, texts: List[str], parent: List[int]):
+        """Union near-duplicate texts found through LSH banding"""
+        bands = self.settings.dedup_lsh_bands
+        signatures = np.stack([self.minhash_signature(text) for text in texts])
+        rows_per_band = signatures.shape[1] // bands
+        threshold = self.settings.dedup_fuzzy_threshold
+        
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for band in range(bands):
+            buckets: Dict[bytes, List[int]] = {}
+            band_slice = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+            for i, key in enumerate(band_slice):
+                buckets.setdefault(key.tobytes(), []).append(i)
+            
+            for members in buckets.values():
+                for other in members[1:]:
+                    # Verify the candidate pair with the full-signature Jaccard estimate
+                    root_a, root_b = find(members[0]), find(other)
+                    if root_a == root_b:
+                        continue
+                    similarity = float(np.mean(signatures[members[0]] == signatures[other]))
+                    if similarity >= threshold:
+                        # Smallest index stays the representative
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+        
+        return [find(i) for i in range(len(texts))]
+    
+    def collapse(self, texts: List[str]) -> Dict:
+        """Cluster texts; returns representative row indices and a row -> cluster map"""
+        n = len(texts)
+        assignment = np.empty(n, dtype=np.int64)
+        
+        # Stage 1: exact match on normalized text
+        first_seen: Dict[str, int] = {}
+        unique_rows: List[int] = []
+        for i, text in enumerate(texts):
+            key = self.normalize(text)
+            if key not in first_seen:
+                first_seen[key] = len(unique_rows)
+                unique_rows.append(i)
+            assignment[i] = first_seen[key]
+        
+        # Stage 2: MinHash/LSH over the distinct texts only
+        if self.settings.dedup_fuzzy_enabled and len(unique_rows) > 1:
+            roots = self._fuzzy_merge([self.normalize(texts[i]) for i in unique_rows], list(range(len(unique_rows))))
+            # Re-number clusters densely, in order of first appearance
+            dense: Dict[int, int] = {}
+            remap = np.empty(len(unique_rows), dtype=np.int64)
+            for u, root in enumerate(roots):
+                remap[u] = dense.setdefault(root, len(dense))
+            unique_rows = [unique_rows[root] for root in dense]
+            assignment = remap[assignment]
+        
+        return {
+            'representatives': np.asarray(unique_rows, dtype=np.int64),
+            'assignment': assignment
+        }
@@ -0,0 +1,99 @@
+﻿"""
+Level, page and document filter indexes so ranking only scores matching sections
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.round1b.outline_pack import PackedSections
+
+def normalize_filters(filters: Optional[Dict]) -> Dict:
+    """Canonical form of the input payload's "filters" object ({} when nothing is restricted)"""
+    filters = filters or {}
+    normalized = {}
+    if filters.get('levels'):
+        normalized['levels'] = sorted({str(level).strip().upper() for level in filters['levels']})
+    if filters.get('documents'):
+        normalized['documents'] = sorted(set(filters['documents']))
+    pages = filters.get('pages') or {}
+    if pages.get('min') is not None or pages.get('max') is not None:
+        normalized['pages'] = {'min': pages.get('min'), 'max': pages.get('max')}
+    return normalized
+
+class SectionFilterIndex:
+    """Column indexes over a collection's sections: level code, page and document id.
+    
+    Documents are appended as they are loaded. Packed outlines and federated
+    shards persist level and page columns, which are used as they are, without
+    materializing any section; other outlines get theirs built, and only when a
+    filter is active. Masks are plain vectorized comparisons, and the resulting
+    row lists feed every scorer (matmul, tree search, shard scan) the same way.
+    """
+    
+    def __init__(self, filters: Dict = None):
+        self.filters = normalize_filters(filters)
+        self.document_names: List[str] = []
+        self.level_table: List[str] = []
+        self._level_codes: Dict[str, int] = {}
+        self._columns: List[Dict[str, np.ndarray]] = []
+    
+    @property
+    def active(self) -> bool:
+        return bool(self.filters)
+    
+    def allows_document(self, name: str) -> bool:
+        """Document filter, checked before a document is even loaded"""
+        return 'documents' not in self.filters or name in self.filters['documents']
+    
+    def _level_code(self, level) -> int:
+        key = str(level or '').strip().upper()
+        if key not in self._level_codes:
+            self._level_codes[key] = len(self.level_table)
+            self.level_table.append(key)
+        return self._level_codes[key]
+    
+    def add_document(self, name: str, sections: Sequence[Dict]) -> int:
+        """Index one document's sections; returns its document id"""
+        if not self.active:
+            # Nothing to mask: rows() never reads the columns
+            return self.add_columns(name, [], np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32))
+        if isinstance(sections, PackedSections):
+            # Pages come straight from the mapped column
+            return self.add_columns(name, sections.pack.levels, sections.pack.level_codes, sections.pages())
+        levels = np.array([self._level_code(section.get('level')) for section in sections], dtype=np.int32)
+        pages = np.array([1 if section.get('page') is None else section['page'] for section in sections], dtype=np.int32)
+        return self.add_columns(name, self.level_table, levels, pages)
+    
+    def add_columns(self, name: str, level_table: Sequence, level_codes: np.ndarray, pages: np.ndarray) -> int:
+        """Index a document from persisted columns (codes into its own `level_table`); returns its document id"""
+        if level_table is not self.level_table:
+            remap = np.array([self._level_code(level) for level in level_table] or [0], dtype=np.int32)
+            level_codes = remap[level_codes]
+        self.document_names.append(name)
+        self._columns.append({'levels': level_codes, 'pages': pages})
+        return len(self.document_names) - 1
+    
+    def mask(self, document_id: int) -> np.ndarray:
+        """Boolean mask of the document's sections that pass the level and page filters"""
+        columns = self._columns[document_id]
+        keep = np.ones(len(columns['levels']), dtype=bool)
+        if not self.allows_document(self.document_names[document_id]):
+            keep[:] = False
+            return keep
+        
+        if 'levels' in self.filters:
+            allowed = [self._level_codes[level] for level in self.filters['levels'] if level in self._level_codes]
+            keep &= np.isin(columns['levels'], allowed)
+        if 'pages' in self.filters:
+            if self.filters['pages']['min'] is not None:
+                keep &= columns['pages'] >= self.filters['pages']['min']
+            if self.filters['pages']['max'] is not None:
+                keep &= columns['pages'] <= self.filters['pages']['max']
+        return keep
+    
+    def rows(self, document_id: int) -> Optional[np.ndarray]:
+        """Row indexes to score, or None when no filter applies (score everything)"""
+        if not self.active:
+            return None
+        return np.flatnonzero(self.mask(document_id))
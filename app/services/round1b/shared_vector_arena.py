@@ -0,0 +1,145 @@
+﻿"""
+Shared-memory arena for embedding matrices used by every collection worker
+"""
+
+import atexit
+import logging
+import os
+import secrets
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+# Segment names carry the owner pid so leftovers of dead owners can be swept
+SEGMENT_PREFIX = 's1b_arena'
+ALIGNMENT = 64
+
+class SharedVectorArena:
+    """Named NumPy arrays packed into one shared memory segment.
+    
+    The owner creates the segment and copies arrays in once; other processes
+    attach with the (small, picklable) descriptor and get read-only zero-copy
+    views, so resident memory does not grow with the number of workers.
+    """
+    
+    def __init__(self, segment: shared_memory.SharedMemory, layout: Dict[str, Dict],
+                 metadata: Dict = None, owner: bool = False):
+        self.logger = logging.getLogger(__name__)
+        self.segment = segment
+        self.layout = layout
+        self.metadata = metadata or {}
+        self.owner = owner
+        self._views: Dict[str, np.ndarray] = {}
+        
+        for name, entry in layout.items():
+            view = np.ndarray(tuple(entry['shape']), dtype=np.dtype(entry['dtype']),
+                              buffer=segment.buf, offset=entry['offset'])
+            if not owner:
+                view.flags.writeable = False
+            self._views[name] = view
+    
+    @classmethod
+    def create(cls, arrays: Dict[str, np.ndarray], metadata: Dict = None) -> 'SharedVectorArena':
+        """Allocate one segment for all arrays and copy them in"""
+        cleanup_stale_segments()
+        
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            layout[name] = {'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str}
+            offset += array.nbytes
+        
+        segment_name = f'{SEGMENT_PREFIX}_{os.getpid()}_{secrets.token_hex(4)}'
+        segment = shared_memory.SharedMemory(name=segment_name, create=True, size=max(offset, 1))
+        arena = cls(segment, layout, metadata, owner=True)
+        for name, array in arrays.items():
+            arena._views[name][...] = array
+        
+        # Normal exit unlinks here; on a crash the resource tracker process
+        # (which outlives us) unlinks every segment we registered
+        atexit.register(arena.destroy)
+        arena.logger.info(f'💾 Shared arena {segment_name}: {len(arrays)} arrays, {offset / 1024 / 1024:.2f} MB')
+        return arena
+    
+    @classmethod
+    def attach(cls, descriptor: Dict, shares_tracker: bool = True) -> 'SharedVectorArena':
+        """Map an existing arena from its descriptor.
+        
+        Pool workers share their parent's resource tracker, so their attach
+        registration is harmless. An unrelated process has its own tracker,
+        which would unlink the segment when that process exits; unregister there.
+        """
+        segment = shared_memory.SharedMemory(name=descriptor['segment'], create=False)
+        if not shares_tracker:
+            resource_tracker.unregister(segment._name, 'shared_memory')
+        return cls(segment, descriptor['layout'], descriptor.get('metadata'), owner=False)
+    
+    def descriptor(self) -> Dict:
+        """Everything another process needs to attach"""
+        return {'segment': self.segment.name, 'layout': self.layout, 'metadata': self.metadata}
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._views
+    
+    def get(self, name: str) -> Optional[np.ndarray]:
+        """Zero-copy view of a named array (None if absent)"""
+        return self._views.get(name)
+    
+    def nbytes(self) -> int:
+        return self.segment.size
+    
+    def close(self):
+        """Unmap this process's view of the segment"""
+        if self.segment is None:
+            return
+        self._views.clear()
+        try:
+            self.segment.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes away with the process
+            self.logger.debug(f'Shared arena {self.segment.name} still referenced; leaving it mapped')
+    
+    def destroy(self):
+        """Owner only: unmap and remove the segment"""
+        if self.segment is None:
+            return
+        segment = self.segment
+        self.close()
+        if self.owner:
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self.segment = None
+
+def cleanup_stale_segments(shm_dir: Path = Path('/dev/shm')) -> int:
+    """Remove arenas whose owner process no longer exists (e.g. after SIGKILL of the whole group)"""
+    removed = 0
+    if not shm_dir.exists():
+        return removed
+    
+    for path in shm_dir.glob(f'{SEGMENT_PREFIX}_*'):
+        try:
+            owner_pid = int(path.name.split('_')[2])
+        except (IndexError, ValueError):
+            continue
+        try:
+            os.kill(owner_pid, 0)
+            continue  # Owner alive
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            continue  # Alive, owned by someone else
+        try:
+            path.unlink()
+            removed += 1
+        except OSError:
+            pass
+    
+    if removed:
+        logging.getLogger(__name__).warning(f'⚠️ Removed {removed} stale shared arena segment(s)')
+    return removed
@@ -0,0 +1,90 @@
+﻿"""
+Bounded-memory streaming top-k selection across documents and collections
+"""
+
+import heapq
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+class TopKAccumulator:
+    """Keeps the k best (section, score) pairs seen so far.
+    
+    Ordering matches a stable descending sort over the concatenation of every
+    batch in arrival order, so output is identical to the old
+    extend-then-sort approach while holding at most k sections.
+    """
+    
+    def __init__(self, k: int):
+        self.k = k
+        self.total_seen = 0
+        
+        # Min-heap of (score, -sequence, section): the root is the weakest entry.
+        # Sequence numbers are unique, so sections are never compared.
+        self._heap: List[Tuple[float, int, Dict]] = []
+        self._sequence = 0
+    
+    def _select_candidates(self, scores: np.ndarray) -> np.ndarray:
+        """Partial selection of row indices that can reach the top k"""
+        n = len(scores)
+        if n <= self.k:
+            return np.arange(n)
+        
+        # argpartition finds the k-th best score in O(n); keep every row tied
+        # with it so tie-breaking by position stays exact
+        top = np.argpartition(-scores, self.k - 1)[:self.k]
+        threshold = scores[top].min()
+        
+        # Rows that cannot beat the current heap root are skipped as well
+        if len(self._heap) >= self.k:
+            threshold = max(threshold, self._heap[0][0])
+        
+        return np.flatnonzero(scores >= threshold)
+    
+    def floor(self) -> float:
+        """Score a new section must beat to enter (-inf until k sections are held)"""
+        return self._heap[0][0] if self.k > 0 and len(self._heap) >= self.k else -np.inf
+    
+    def add(self, sections: Sequence[Dict], scores: np.ndarray, rows: np.ndarray = None):
+        """Offer one batch (typically one document) of scored sections.
+        
+        With `rows`, only those rows of the batch were scored (e.g. by a pruned
+        tree search); `scores` then align with `rows`, and positions for
+        tie-breaking still come from the full batch.
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        base = self._sequence
+        self._sequence += len(sections)
+        self.total_seen += len(sections)
+        
+        if self.k <= 0 or len(scores) == 0:
+            return
+        
+        # Only candidate rows are touched, so lazy section sequences stay lazy
+        for idx in self._select_candidates(scores):
+            row = int(idx) if rows is None else int(rows[idx])
+            self._offer((float(scores[idx]), -(base + row), sections[row]))
+    
+    def _offer(self, entry: Tuple[float, int, Dict]):
+        if self.k <= 0:
+            return
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+    
+    def merge(self, other: 'TopKAccumulator'):
+        """Fold another accumulator in, ordered after everything already added"""
+        entries = sorted(other._heap, key=lambda item: (-item[0], -item[1]))
+        sections = [section for _, _, section in entries]
+        scores = np.asarray([score for score, _, _ in entries], dtype=np.float64)
+        self.add(sections, scores)
+        self.total_seen += other.total_seen - len(entries)
+    
+    def results(self) -> List[Tuple[Dict, float]]:
+        """Best-first (section, score) list"""
+        ordered = sorted(self._heap, key=lambda item: (-item[0], -item[1]))
+        return [(section, score) for score, _, section in ordered]
+    
+    def __len__(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,343 @@
+﻿"""
+Compressed embedding storage: float16, int8 scalar and product quantization
+"""
+
+import logging
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Union
+
+import numpy as np
+
+from config.settings import Settings
+
+class Float32Codec:
+    """Uncompressed reference codec"""
+    
+    name = 'float32'
+    code_dtype = np.float32
+    needs_fit = False
+    
+    def fit(self, vectors: np.ndarray) -> 'Float32Codec':
+        return self
+    
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {}
+    
+    def set_params(self, params: Dict[str, np.ndarray]) -> 'Float32Codec':
+        return self
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes
+    
+    def score(self, codes: np.ndarray, query: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        return codes @ query.astype(np.float32)
+    
+    def bytes_per_vector(self, dimension: int) -> float:
+        return 4.0 * dimension
+
+class Float16Codec:
+    """Half precision; scored by decoding fixed-size blocks to float32"""
+    
+    name = 'float16'
+    code_dtype = np.float16
+    needs_fit = False
+    
+    def fit(self, vectors: np.ndarray) -> 'Float16Codec':
+        return self
+    
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {}
+    
+    def set_params(self, params: Dict[str, np.ndarray]) -> 'Float16Codec':
+        return self
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32)
+    
+    def score(self, codes: np.ndarray, query: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        # numpy has no fast float16 GEMM, so widen one block at a time
+        query = query.astype(np.float32)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), block_size):
+            block = codes[start:start + block_size].astype(np.float32)
+            scores[start:start + block_size] = block @ query
+        return scores
+    
+    def bytes_per_vector(self, dimension: int) -> float:
+        return 2.0 * dimension
+
+class Int8ScalarCodec:
+    """Per-dimension 8-bit scalar quantization: x ~= code * scale + offset"""
+    
+    name = 'int8'
+    code_dtype = np.uint8
+    needs_fit = True   # fit() learns parameters from sample vectors
+    
+    def __init__(self):
+        self.scale: Optional[np.ndarray] = None
+        self.offset: Optional[np.ndarray] = None
+    
+    def fit(self, vectors: np.ndarray) -> 'Int8ScalarCodec':
+        low = vectors.min(axis=0).astype(np.float32)
+        high = vectors.max(axis=0).astype(np.float32)
+        self.offset = low
+        self.scale = np.maximum(high - low, 1e-12) / 255.0
+        return self
+    
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {'scale': self.scale, 'offset': self.offset}
+    
+    def set_params(self, params: Dict[str, np.ndarray]) -> 'Int8ScalarCodec':
+        self.scale = np.asarray(params['scale'], dtype=np.float32)
+        self.offset = np.asarray(params['offset'], dtype=np.float32)
+        return self
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.offset) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.offset
+    
+    def score(self, codes: np.ndarray, query: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        # q . (c * s + o) = c . (q * s) + q . o, so the codes are never decoded
+        query = query.astype(np.float32)
+        scaled_query = query * self.scale
+        constant = float(query @ self.offset)
+        
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), block_size):
+            scores[start:start + block_size] = codes[start:start + block_size] @ scaled_query
+        return scores + constant
+    
+    def bytes_per_vector(self, dimension: int) -> float:
+        return 1.0 * dimension
+
+class ProductQuantizationCodec:
+    """Product quantization with asymmetric (lookup table) distance scoring"""
+    
+    name = 'pq'
+    code_dtype = np.uint8
+    needs_fit = True
+    
+    def __init__(self, subspaces: int = 48, centroids: int = 256, iterations: int = 20,
+                 training_sample: int = 20000, seed: int = 0):
+        self.subspaces = subspaces
+        self.training_sample = training_sample
+        self.centroids = centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.codebooks: Optional[np.ndarray] = None  # (M, K, D / M)
+    
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(N, D) -> (M, N, D / M) subvectors"""
+        n, dimension = vectors.shape
+        if dimension % self.subspaces:
+            raise ValueError(f'Dimension {dimension} is not divisible by {self.subspaces} subspaces')
+        return vectors.reshape(n, self.subspaces, dimension // self.subspaces).transpose(1, 0, 2)
+    
+    def _kmeans(self, data: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+        """Plain Lloyd iterations; codebooks are small so this stays cheap"""
+        centers = data[rng.choice(len(data), size=k, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = self._nearest(data, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assignment, data)
+            counts = np.bincount(assignment, minlength=k)
+            # Empty clusters keep their previous center
+            filled = counts > 0
+            centers[filled] = sums[filled] / counts[filled, np.newaxis]
+        return centers
+    
+    def _nearest(self, data: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        distances = (
+            (data ** 2).sum(axis=1, keepdims=True)
+            - 2.0 * data @ centers.T
+            + (centers ** 2).sum(axis=1)
+        )
+        return distances.argmin(axis=1)
+    
+    def fit(self, vectors: np.ndarray) -> 'ProductQuantizationCodec':
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        
+        # Codebooks only need a sample; training cost stays flat as the corpus grows
+        if len(vectors) > self.training_sample:
+            vectors = vectors[rng.choice(len(vectors), size=self.training_sample, replace=False)]
+        k = min(self.centroids, len(vectors))
+        self.codebooks = np.stack([self._kmeans(sub, k, rng) for sub in self._split(vectors)])
+        return self
+    
+    def get_params(self) -> Dict[str, np.ndarray]:
+        return {'codebooks': self.codebooks}
+    
+    def set_params(self, params: Dict[str, np.ndarray]) -> 'ProductQuantizationCodec':
+        self.codebooks = np.asarray(params['codebooks'], dtype=np.float32)
+        self.subspaces = self.codebooks.shape[0]
+        return self
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subvectors = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = np.stack([
+            self._nearest(sub, codebook) for sub, codebook in zip(subvectors, self.codebooks)
+        ], axis=1)
+        return codes.astype(np.uint8)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+    
+    def score(self, codes: np.ndarray, query: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        # Lookup table of query . centroid per subspace; a score is M table reads
+        query_parts = query.astype(np.float32).reshape(self.subspaces, -1)
+        table = np.einsum('mkd,md->mk', self.codebooks, query_parts)
+        
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for m in range(self.subspaces):
+            scores += table[m][codes[:, m]]
+        return scores
+    
+    def bytes_per_vector(self, dimension: int) -> float:
+        return float(self.subspaces)
+
+def get_codec(name: str, settings: Settings = None):
+    """Build a codec by name"""
+    settings = settings or Settings()
+    if name == 'float32':
+        return Float32Codec()
+    if name == 'float16':
+        return Float16Codec()
+    if name == 'int8':
+        return Int8ScalarCodec()
+    if name == 'pq':
+        return ProductQuantizationCodec(subspaces=settings.pq_subspaces, centroids=settings.pq_centroids)
+    raise ValueError(f'Unknown embedding codec: {name}')
+
+def save_codec(codec, file: Union[str, Path, BinaryIO]):
+    """Write a fitted codec's name and parameters as .npz"""
+    np.savez(file, codec=np.array(codec.name), **codec.get_params())
+
+def load_codec(file: Union[str, Path, BinaryIO], settings: Settings = None):
+    """Rebuild a fitted codec written by save_codec"""
+    with np.load(file) as data:
+        codec = get_codec(str(data['codec']), settings)
+        return codec.set_params({key: data[key] for key in data.files if key != 'codec'})
+
+class EncodedVectors:
+    """Rows of codes together with the fitted codec that wrote them"""
+    
+    def __init__(self, codes: np.ndarray, codec):
+        self.codes = codes
+        self.codec = codec
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def __getitem__(self, rows) -> 'EncodedVectors':
+        return EncodedVectors(self.codes[rows], self.codec)
+    
+    def score(self, query: np.ndarray) -> np.ndarray:
+        """Dot products with `query`, computed on the codes (nothing is decoded)"""
+        return self.codec.score(self.codes, query)
+    
+    def decode(self) -> np.ndarray:
+        return np.ascontiguousarray(self.codec.decode(self.codes), dtype=np.float32)
+
+class CompressedVectorIndex:
+    """Vectors kept only in compressed form, with optional exact rescoring"""
+    
+    def __init__(self, vectors: np.ndarray, codec_name: str = None, rescore_vectors: np.ndarray = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        self.codec = get_codec(codec_name or self.settings.embedding_codec, self.settings)
+        self.dimension = vectors.shape[1]
+        self.codes = self.codec.fit(vectors).encode(vectors)
+        
+        # Exact vectors for final top-k rescoring; callers may pass an np.memmap
+        # so the float32 copy stays on disk
+        self.rescore_vectors = rescore_vectors
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def memory_bytes(self) -> int:
+        """Bytes held by codes (excluding small codec parameters)"""
+        return int(self.codes.nbytes)
+    
+    def search(self, query: np.ndarray, k: int, rescore: bool = None, rows: np.ndarray = None) -> List[tuple]:
+        """Top-k (row, score) pairs, best first; with `rows` (sorted), only those rows are scored"""
+        if rescore is None:
+            rescore = self.settings.codec_exact_rescore
+        if rows is not None:
+            rows = np.asarray(rows, dtype=np.int64)
+        if (len(self.codes) if rows is None else len(rows)) == 0 or k <= 0:
+            return []
+        
+        scores = self.codec.score(self.codes if rows is None else self.codes[rows], query)
+        
+        # Over-fetch candidates when rescoring so quantization error can be undone
+        fetch = min(len(scores), k * self.settings.codec_rescore_factor if rescore else k)
+        candidates = np.argpartition(-scores, fetch - 1)[:fetch]
+        
+        if rescore and self.rescore_vectors is not None:
+            # Sorted rows read sequentially when rescore_vectors is a memmap
+            candidates = np.sort(candidates)
+            global_rows = candidates if rows is None else rows[candidates]
+            candidate_scores = np.asarray(self.rescore_vectors[global_rows], dtype=np.float32) @ query
+        else:
+            candidate_scores = scores[candidates]
+        if rows is not None:
+            candidates = rows[candidates]
+        
+        order = np.argsort(-candidate_scores, kind='stable')[:k]
+        return [(int(candidates[i]), float(candidate_scores[i])) for i in order]
+
+def evaluate_codecs(vectors: np.ndarray, queries: np.ndarray, k: int = 20,
+                    codec_names: List[str] = None) -> List[Dict]:
+    """Memory per vector and recall@k against exact float32 search for each codec"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    codec_names = codec_names or ['float32', 'float16', 'int8', 'pq']
+    k = min(k, len(vectors))
+    
+    exact_scores = queries @ vectors.T
+    exact_top = [set(np.argpartition(-row, k - 1)[:k].tolist()) for row in exact_scores]
+    
+    report = []
+    for name in codec_names:
+        start = time.time()
+        codec = get_codec(name).fit(vectors)
+        codes = codec.encode(vectors)
+        fit_time = time.time() - start
+        
+        start = time.time()
+        hits = 0
+        rescored_hits = 0
+        fetch = min(len(vectors), k * Settings().codec_rescore_factor)
+        for query, truth in zip(queries, exact_top):
+            scores = codec.score(codes, query)
+            hits += len(truth & set(np.argpartition(-scores, k - 1)[:k].tolist()))
+            
+            # Same candidates, final top-k re-scored with float32
+            candidates = np.argpartition(-scores, fetch - 1)[:fetch]
+            exact = vectors[candidates] @ query
+            rescored_hits += len(truth & set(candidates[np.argsort(-exact)[:k]].tolist()))
+        query_time = (time.time() - start) / max(len(queries), 1)
+        
+        report.append({
+            'codec': name,
+            'bytes_per_vector': codec.bytes_per_vector(vectors.shape[1]),
+            'compression_ratio': 4.0 * vectors.shape[1] / codec.bytes_per_vector(vectors.shape[1]),
+            f'recall@{k}': hits / (k * max(len(queries), 1)),
+            f'recall@{k}_rescored': rescored_hits / (k * max(len(queries), 1)),
+            'fit_seconds': fit_time,
+            'query_ms': query_time * 1000.0
+        })
+    
+    return report
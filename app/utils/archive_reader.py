@@ -0,0 +1,178 @@
+﻿"""
+Read collections straight out of zip/tar archives (no extraction)
+"""
+
+import calendar
+import os
+import tarfile
+import threading
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Dict, List, Optional, Tuple, Union
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Members of compressed tars worth keeping in memory (everything else is skipped)
+_TAR_MEMBER_SUFFIXES = ('.json',)
+
+def is_archive_name(path: Union[str, Path]) -> bool:
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+def is_archive(path: Union[str, Path]) -> bool:
+    """An existing zip or tar file (judged by suffix)"""
+    return is_archive_name(path) and Path(path).is_file()
+
+def archive_stem(path: Union[str, Path]) -> str:
+    """'collections.tar.gz' -> 'collections'"""
+    name = Path(path).name
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def _member_name(name: str) -> str:
+    """Canonical member path ('./a/b/' -> 'a/b')"""
+    return PurePosixPath(name).as_posix().strip('/')
+
+def split_archive_path(path: Union[str, Path]) -> Optional[Tuple[Path, str]]:
+    """('/data/batch.zip', 'Collection 1/x.json') for a path inside an archive, else None"""
+    # String scan rather than walking Path.parents: this runs on every file read
+    text = os.fspath(path)
+    lowered = text.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        index = lowered.find(suffix)
+        while index >= 0:
+            end = index + len(suffix)
+            if (end == len(text) or text[end] in (os.sep, '/')) and os.path.isfile(text[:end]):
+                return Path(text[:end]), text[end + 1:].replace(os.sep, '/')
+            index = lowered.find(suffix, index + 1)
+    return None
+
+class ArchiveReader:
+    """Member index plus random-access reads for one zip or tar archive.
+    
+    Zip files and plain tars are indexed once (central directory / member
+    offsets) and each read seeks straight to its member. Compressed tars cannot
+    seek cheaply, so their JSON members are streamed into memory in one pass.
+    
+    Forked workers inherit the parent's file descriptors, and with them one
+    shared file offset: plain-tar members are read with pread, which never moves
+    it, and a zip is reopened by the first read in a new process.
+    """
+    
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._file = None
+        self._contents: Dict[str, bytes] = {}
+        self._zip_names: Dict[str, str] = {}
+        # member -> (mtime_ns, size, offset or -1)
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        # directory -> {file name: (mtime_ns, size)}
+        self.directories: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        
+        if zipfile.is_zipfile(self.path):
+            self._zip = zipfile.ZipFile(self.path)
+            for info in self._zip.infolist():
+                if not info.is_dir():
+                    mtime = calendar.timegm(info.date_time + (0, 0, -1))
+                    name = _member_name(info.filename)
+                    self._zip_names[name] = info.filename
+                    self.index[name] = (mtime * 10**9, info.file_size, -1)
+        elif str(self.path).lower().endswith('.tar'):
+            self._file = open(self.path, 'rb')
+            with tarfile.open(fileobj=self._file, mode='r:') as tar:
+                for member in tar.getmembers():
+                    if member.isfile():
+                        self.index[_member_name(member.name)] = (int(member.mtime) * 10**9, member.size, member.offset_data)
+        else:
+            with tarfile.open(self.path, mode='r:*') as tar:
+                for member in tar:
+                    if member.isfile():
+                        name = _member_name(member.name)
+                        self.index[name] = (int(member.mtime) * 10**9, member.size, -1)
+                        if name.lower().endswith(_TAR_MEMBER_SUFFIXES):
+                            self._contents[name] = tar.extractfile(member).read()
+        
+        for name, (mtime_ns, size, _) in self.index.items():
+            directory, _, file_name = name.rpartition('/')
+            self.directories.setdefault(directory, {})[file_name] = (mtime_ns, size)
+    
+    def names(self) -> List[str]:
+        return list(self.index)
+    
+    def stat(self, member: str) -> Optional[Tuple[int, int]]:
+        entry = self.index.get(_member_name(member))
+        return entry[:2] if entry else None
+    
+    def list_dir(self, directory: str) -> Dict[str, Tuple[int, int]]:
+        """Files directly inside a member directory: name -> (mtime_ns, size)"""
+        directory = _member_name(directory)
+        return dict(self.directories.get('' if directory == '.' else directory, {}))
+    
+    def read(self, member: str) -> bytes:
+        member = _member_name(member)
+        if member not in self.index:
+            raise FileNotFoundError(f'{member} not found in {self.path}')
+        if self._zip is not None:
+            if self._pid != os.getpid():
+                self._reopen_zip()
+            with self._lock:
+                return self._zip.read(self._zip_names[member])
+        if member in self._contents:
+            return self._contents[member]
+        _, size, offset = self.index[member]
+        if offset < 0:
+            raise OSError(f'{member} in {self.path} is not readable without extraction')
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), size, offset)
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+    
+    def _reopen_zip(self):
+        """Private zip handle for this process (the inherited one shares the parent's offset)"""
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(self.path)
+        self._pid = os.getpid()
+    
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        if self._file is not None:
+            self._file.close()
+
+# Open archives per process, reopened when the archive file changes
+_readers: Dict[Path, Tuple[Tuple[int, int], ArchiveReader]] = {}
+_readers_lock = threading.Lock()
+
+def _forget_readers_after_fork():
+    """A forked child starts with no readers of its own (and a lock no other thread holds)"""
+    global _readers_lock
+    _readers.clear()
+    _readers_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_readers_after_fork)
+
+def open_archive(path: Union[str, Path]) -> ArchiveReader:
+    path = Path(path)
+    stat = path.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _readers_lock:
+        cached = _readers.get(path)
+        if cached is None or cached[0] != key:
+            if cached is not None:
+                cached[1].close()
+            _readers[path] = (key, ArchiveReader(path))
+        return _readers[path][1]
+
+def read_path_bytes(path: Union[str, Path]) -> bytes:
+    """File bytes, whether the path is on disk or inside an archive"""
+    located = split_archive_path(path)
+    if located is None:
+        return Path(path).read_bytes()
+    archive_path, member = located
+    return open_archive(archive_path).read(member)
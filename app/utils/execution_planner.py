@@ -0,0 +1,480 @@
+﻿"""
+CPU topology-aware execution planner for collection workers x encoder threads
+"""
+
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import Settings
+from utils.logger import setup_logger
+
+class ExecutionPlanner:
+    def __init__(self):
+        self.logger = setup_logger(__name__)
+        self.settings = Settings()
+    
+    # ---- topology -------------------------------------------------------------
+    
+    def _read_cgroup_cpu_quota(self) -> Optional[float]:
+        """CPU limit imposed by the container (cgroup v2, then v1), in cores"""
+        try:
+            cpu_max = Path('/sys/fs/cgroup/cpu.max')
+            if cpu_max.exists():
+                quota, period = cpu_max.read_text().split()[:2]
+                if quota != 'max':
+                    return int(quota) / int(period)
+                return None
+            
+            quota_file = Path('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+            period_file = Path('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+            if quota_file.exists() and period_file.exists():
+                quota = int(quota_file.read_text().strip())
+                if quota > 0:
+                    return quota / int(period_file.read_text().strip())
+        except Exception as e:
+            self.logger.debug(f'Could not read cgroup CPU quota: {str(e)}')
+        return None
+    
+    def _read_cache_sizes(self) -> Dict[str, int]:
+        """Cache sizes (KB) of the first CPU, keyed by level"""
+        caches = {}
+        cache_dir = Path('/sys/devices/system/cpu/cpu0/cache')
+        try:
+            for index in sorted(cache_dir.glob('index*')):
+                level = (index / 'level').read_text().strip()
+                cache_type = (index / 'type').read_text().strip()
+                size = (index / 'size').read_text().strip()
+                if cache_type == 'Instruction':
+                    continue
+                if size.endswith('M'):
+                    size_kb = int(size[:-1]) * 1024
+                elif size.endswith('K'):
+                    size_kb = int(size[:-1])
+                else:
+                    size_kb = int(size) // 1024
+                caches[f'l{level}_kb'] = size_kb
+        except Exception as e:
+            self.logger.debug(f'Could not read CPU cache sizes: {str(e)}')
+        return caches
+    
+    def inspect_cpus(self) -> Dict:
+        """Describe the CPUs this process may actually use"""
+        try:
+            affinity = sorted(os.sched_getaffinity(0))
+        except AttributeError:
+            affinity = list(range(os.cpu_count() or 1))
+        
+        quota = self._read_cgroup_cpu_quota()
+        effective = len(affinity)
+        if quota is not None:
+            effective = max(1, min(effective, math.floor(quota)))
+        
+        try:
+            load_average = os.getloadavg()[0]
+        except OSError:
+            load_average = 0.0
+        
+        topology = {
+            'affinity': affinity,
+            'logical_cpus': os.cpu_count() or 1,
+            'cgroup_quota': quota,
+            'effective_cpus': effective,
+            'load_average': load_average
+        }
+        topology.update(self._read_cache_sizes())
+        return topology
+    
+    def host_fingerprint(self, topology: Dict = None) -> str:
+        """Identify a host shape (CPU model, usable cores), not a container instance"""
+        topology = topology or self.inspect_cpus()
+        cpu_model = platform.processor()
+        try:
+            for line in Path('/proc/cpuinfo').read_text().splitlines():
+                if line.startswith('model name'):
+                    cpu_model = line.split(':', 1)[1].strip()
+                    break
+        except Exception:
+            pass
+        
+        payload = f"{cpu_model}|{topology['effective_cpus']}|{topology.get('l3_kb', 0)}"
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+    
+    # ---- planning -------------------------------------------------------------
+    
+    def _cpu_sets(self, affinity: List[int], workers: int, threads: int) -> List[List[int]]:
+        """Contiguous, non-overlapping CPU sets per worker"""
+        if workers <= 1 or len(affinity) < workers * threads:
+            return [affinity for _ in range(workers)]
+        return [affinity[i * threads:(i + 1) * threads] for i in range(workers)]
+    
+    def _build_plan(self, topology: Dict, workers: int, threads: int, source: str) -> Dict:
+        return {
+            'workers': workers,
+            'threads_per_worker': threads,
+            'cpu_sets': self._cpu_sets(topology['affinity'], workers, threads),
+            'effective_cpus': topology['effective_cpus'],
+            'source': source
+        }
+    
+    def plan(self, collection_count: int = 1, forked: bool = False) -> Dict:
+        """Pick workers, threads per worker and CPU affinity for this run.
+        
+        `forked`: workers will be forked from a parent holding the model, so
+        they share its weights copy-on-write (see memory_worker_cap).
+        """
+        topology = self.inspect_cpus()
+        
+        # Explicit overrides win
+        if self.settings.execution_workers or self.settings.execution_threads:
+            workers = self.settings.execution_workers or 1
+            threads = self.settings.execution_threads or max(1, topology['effective_cpus'] // workers)
+            plan = self._build_plan(topology, workers, threads, 'env')
+        else:
+            calibrated = self.load_calibrated_plan(topology)
+            if calibrated:
+                workers = self._clamp_workers(calibrated['workers'], {
+                    'collections': collection_count,
+                    'memory': self.memory_worker_cap(forked)
+                })
+                plan = self._build_plan(topology, workers, calibrated['threads_per_worker'], 'calibrated')
+            else:
+                plan = self._heuristic_plan(topology, collection_count, forked)
+        
+        self.logger.info(
+            f"Execution plan ({plan['source']}): {plan['workers']} worker(s) x "
+            f"{plan['threads_per_worker']} thread(s) on {topology['effective_cpus']} usable CPU(s), "
+            f"load {topology['load_average']:.2f}, cgroup quota {topology['cgroup_quota']}"
+        )
+        return plan
+    
+    def _clamp_workers(self, workers: int, limits: Dict[str, int]) -> int:
+        """Workers after every limit, logging the limits that lowered it"""
+        clamped = max(1, min(workers, *limits.values()))
+        if clamped < workers:
+            reasons = ', '.join(f'{name} ({limit})' for name, limit in limits.items() if limit <= clamped)
+            self.logger.info(f'Workers clamped from {workers} to {clamped} by: {reasons}')
+        return clamped
+    
+    def _heuristic_plan(self, topology: Dict, collection_count: int, forked: bool = False) -> Dict:
+        """Threads first (small batches scale to a few threads), then workers"""
+        # Leave room for whatever else is already running on the node
+        budget = max(1, topology['effective_cpus'] - int(topology['load_average']))
+        tuned = self.load_encoder_profile(topology) or {}
+        threads = max(1, min(tuned.get('threads') or self.settings.target_threads_per_worker, budget))
+        
+        workers = self._clamp_workers(budget // threads, {
+            'collections': collection_count,
+            'max_concurrent_collections': self.settings.max_concurrent_collections,
+            'memory': self.memory_worker_cap(forked)
+        })
+        
+        # Hand any leftover cores to the workers we have
+        threads = max(threads, budget // workers)
+        
+        # Small last-level caches thrash with many threads per worker sharing them
+        if topology.get('l3_kb') and topology['l3_kb'] < 4096:
+            threads = min(threads, 2)
+        return self._build_plan(topology, workers, threads, 'heuristic')
+    
+    def memory_worker_cap(self, forked: bool = False) -> int:
+        """Workers that fit in the memory budget next to the parent, which holds its own model.
+        
+        Forked workers share the parent's model weights copy-on-write, so each
+        only adds its private pages; spawned workers load a full model each.
+        """
+        worker_mb = self.settings.worker_memory_mb
+        if forked:
+            worker_mb = max(1, worker_mb - self.settings.worker_shared_memory_mb)
+        return max(1, (self.settings.max_memory_mb - self.settings.worker_memory_mb) // worker_mb)
+    
+    def worker_memory_budget_mb(self, workers: int) -> int:
+        """Share of the memory budget left for each of `workers` workers after the parent"""
+        return max(0, self.settings.max_memory_mb - self.settings.worker_memory_mb) // max(1, workers)
+    
+    def apply_plan(self, plan: Dict, worker_index: Optional[int] = None):
+        """Pin this process and size torch's intra-op pool according to the plan"""
+        threads = plan['threads_per_worker']
+        
+        if worker_index is not None and plan['workers'] > 1:
+            cpu_set = plan['cpu_sets'][worker_index % len(plan['cpu_sets'])]
+            try:
+                os.sched_setaffinity(0, cpu_set)
+            except (AttributeError, OSError) as e:
+                self.logger.debug(f'Could not set CPU affinity: {str(e)}')
+        
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+    
+    # ---- calibration ----------------------------------------------------------
+    
+    def _plan_file(self) -> Path:
+        return self.settings.get_logs_path() / self.settings.execution_plan_file
+    
+    def load_calibrated_plan(self, topology: Dict = None) -> Optional[Dict]:
+        """Previously calibrated plan for this host shape, if any"""
+        plan_file = self._plan_file()
+        if not plan_file.exists():
+            return None
+        try:
+            with open(plan_file, 'r', encoding='utf-8') as f:
+                plans = json.load(f)
+            return plans.get(self.host_fingerprint(topology))
+        except Exception as e:
+            self.logger.warning(f'Could not read calibrated plan: {str(e)}')
+            return None
+    
+    def candidate_plans(self, topology: Dict) -> List[Dict]:
+        """A handful of workers x threads splits of the CPU budget that a run could actually use"""
+        budget = topology['effective_cpus']
+        # Runs fork their workers where they can, so that is the memory cap a plan must fit
+        memory_cap = self.memory_worker_cap(forked='fork' in multiprocessing.get_all_start_methods())
+        candidates = []
+        for workers in range(1, budget + 1):
+            if budget % workers or workers > self.settings.max_concurrent_collections:
+                continue
+            if workers > memory_cap:
+                self.logger.info(f'Calibration: skipping {workers} workers, over the memory cap of {memory_cap}')
+                continue
+            candidates.append(self._build_plan(topology, workers, budget // workers, 'calibration'))
+        return candidates
+    
+    def calibrate(self, texts_per_worker: int = 256) -> Dict:
+        """Micro-benchmark candidate plans and persist the fastest one for this host"""
+        topology = self.inspect_cpus()
+        results = []
+        
+        for candidate in self.candidate_plans(topology):
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=candidate['workers'], mp_context=context) as pool:
+                timings = list(pool.map(
+                    _benchmark_worker,
+                    [candidate] * candidate['workers'],
+                    range(candidate['workers']),
+                    [texts_per_worker] * candidate['workers']
+                ))
+            
+            # Workers run concurrently; the slowest one bounds throughput
+            throughput = candidate['workers'] * texts_per_worker / max(timings)
+            results.append((throughput, candidate))
+            self.logger.info(
+                f"Calibration: {candidate['workers']} x {candidate['threads_per_worker']} -> "
+                f"{throughput:.1f} texts/s"
+            )
+        
+        throughput, best = max(results, key=lambda item: item[0])
+        self.save_calibrated_plan(best, throughput, topology)
+        return best
+    
+    def save_calibrated_plan(self, plan: Dict, throughput: float, topology: Dict):
+        """Persist a plan under this host's fingerprint"""
+        plan_file = self._plan_file()
+        plans = {}
+        if plan_file.exists():
+            try:
+                with open(plan_file, 'r', encoding='utf-8') as f:
+                    plans = json.load(f)
+            except Exception:
+                plans = {}
+        
+        plans[self.host_fingerprint(topology)] = {
+            'workers': plan['workers'],
+            'threads_per_worker': plan['threads_per_worker'],
+            'texts_per_second': round(throughput, 2),
+            'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        
+        plan_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(plan_file, 'w', encoding='utf-8') as f:
+            json.dump(plans, f, indent=4)
+        self.logger.info(f"Saved calibrated plan to {plan_file}: {plan['workers']} x {plan['threads_per_worker']}")
+    
+    # ---- encoder profile ------------------------------------------------------
+    
+    def _encoder_profile_file(self) -> Path:
+        return self.settings.get_logs_path() / self.settings.encoder_profile_file
+    
+    def load_encoder_profile(self, topology: Dict = None) -> Optional[Dict]:
+        """Previously tuned encoder profile for this host shape, if any"""
+        profile_file = self._encoder_profile_file()
+        if not profile_file.exists():
+            return None
+        try:
+            with open(profile_file, 'r', encoding='utf-8') as f:
+                profiles = json.load(f)
+            return profiles.get(self.host_fingerprint(topology))
+        except Exception as e:
+            self.logger.warning(f'Could not read encoder profile: {str(e)}')
+            return None
+    
+    def encoder_profile(self) -> Dict:
+        """Batch size and precision the encoder should use: env, then tuned profile, then defaults"""
+        tuned = self.load_encoder_profile() or {}
+        profile = {
+            'batch_size': self.settings.encode_batch_size or tuned.get('batch_size')
+                          or self.settings.encode_default_batch_size,
+            'precision': (self.settings.encode_precision or tuned.get('precision') or 'float32').lower(),
+            'threads': tuned.get('threads')
+        }
+        if self.settings.encode_batch_size or self.settings.encode_precision:
+            profile['source'] = 'env'
+        else:
+            profile['source'] = 'tuned' if tuned else 'default'
+        return profile
+    
+    def _thread_candidates(self, topology: Dict) -> List[int]:
+        """Powers of two up to the usable CPUs, plus the CPU count itself"""
+        budget = topology['effective_cpus']
+        candidates = {budget}
+        threads = 1
+        while threads < budget:
+            candidates.add(threads)
+            threads *= 2
+        return sorted(candidates)
+    
+    def tune_encoder(self, text_count: int = 512) -> Dict:
+        """Sweep encoder threads, batch size and precision on synthetic headings; persist the fastest.
+        
+        The sweep runs in a spawned process, like calibration, so this process
+        never runs torch and can still fork model-holding workers afterwards.
+        """
+        topology = self.inspect_cpus()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            profile, throughput, notes = pool.submit(_tune_encoder_worker, topology, text_count).result()
+        
+        for note in notes:
+            self.logger.info(f"Encoder tuning: {note}")
+        self.save_encoder_profile(profile, throughput, topology)
+        return profile
+    
+    def save_encoder_profile(self, profile: Dict, throughput: float, topology: Dict):
+        """Persist an encoder profile under this host's fingerprint"""
+        profile_file = self._encoder_profile_file()
+        profiles = {}
+        if profile_file.exists():
+            try:
+                with open(profile_file, 'r', encoding='utf-8') as f:
+                    profiles = json.load(f)
+            except Exception:
+                profiles = {}
+        
+        profiles[self.host_fingerprint(topology)] = {
+            'batch_size': profile['batch_size'],
+            'threads': profile['threads'],
+            'precision': profile['precision'],
+            'texts_per_second': round(throughput, 2),
+            'tuned_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        
+        profile_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(profile_file, 'w', encoding='utf-8') as f:
+            json.dump(profiles, f, indent=4)
+        self.logger.info(
+            f"Saved encoder profile to {profile_file}: batch {profile['batch_size']}, "
+            f"{profile['threads']} thread(s), {profile['precision']}"
+        )
+
+def _synthetic_headings(count: int) -> List[str]:
+    """Headings of the lengths real outlines have (a few words to a long sentence)"""
+    templates = (
+        'Section {i}: testing methodology and quality practices part {j}',
+        'Chapter {j}',
+        'Day {j} itinerary: coastal towns, local cuisine and evening activities around the old harbour',
+        '{i}.{j} Configuring forms and signatures',
+        'Appendix {j}: frequently asked questions about onboarding, compliance reviews and reporting deadlines'
+    )
+    return [templates[i % len(templates)].format(i=i, j=i % 17) for i in range(count)]
+
+def _texts_per_second(generator, texts: List[str], repeats: int = 2) -> float:
+    """Best-of-n encode throughput after a warm-up"""
+    generator.encode_texts(texts[:generator.batch_size])
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        generator.encode_texts(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+def _tune_encoder_worker(topology: Dict, text_count: int) -> Tuple[Dict, float, List[str]]:
+    """One dimension at a time, each starting from the best of the previous one.
+    
+    Threads at the default batch size, then batch sizes, then reduced
+    precisions, which are only eligible while their vectors stay within
+    encode_min_cosine of the float32 ones. Returns (profile, texts/s, notes).
+    """
+    # Imported here so the planner itself never pulls in torch
+    import torch
+    from services.round1b.embedding_generator import EmbeddingGenerator
+    
+    planner = ExecutionPlanner()
+    settings = planner.settings
+    notes = []
+    texts = _synthetic_headings(text_count)
+    generator = EmbeddingGenerator(precision='float32', batch_size=settings.encode_default_batch_size)
+    reference = generator.encode_texts(texts)
+    
+    timings = {}
+    for threads in planner._thread_candidates(topology):
+        torch.set_num_threads(threads)
+        timings[threads] = _texts_per_second(generator, texts)
+        notes.append(f"{threads} thread(s) -> {timings[threads]:.1f} texts/s")
+    threads = max(timings, key=timings.get)
+    torch.set_num_threads(threads)
+    
+    timings = {}
+    for batch_size in settings.encode_batch_candidates:
+        generator.batch_size = batch_size
+        timings[batch_size] = _texts_per_second(generator, texts)
+        notes.append(f"batch {batch_size} -> {timings[batch_size]:.1f} texts/s")
+    batch_size = max(timings, key=timings.get)
+    
+    timings = {'float32': timings[batch_size]}
+    del generator
+    for precision in ('bfloat16', 'int8'):
+        try:
+            candidate = EmbeddingGenerator(precision=precision, batch_size=batch_size)
+            vectors = candidate.encode_texts(texts)
+        except Exception as e:
+            notes.append(f"{precision} not available here ({str(e)})")
+            continue
+        
+        # Both sides are normalized, so the row-wise dot product is the cosine
+        cosine = float(np.mean(np.sum(vectors * reference, axis=1)))
+        if cosine < settings.encode_min_cosine:
+            notes.append(f"{precision} rejected, mean cosine to float32 {cosine:.4f}")
+            continue
+        timings[precision] = _texts_per_second(candidate, texts)
+        notes.append(f"{precision} -> {timings[precision]:.1f} texts/s (cosine {cosine:.4f})")
+        del candidate
+    precision = max(timings, key=timings.get)
+    
+    return {'batch_size': batch_size, 'threads': threads, 'precision': precision}, timings[precision], notes
+
+def _benchmark_worker(plan: Dict, worker_index: int, text_count: int) -> float:
+    """Encode synthetic headings under a plan; returns encode seconds"""
+    ExecutionPlanner().apply_plan(plan, worker_index)
+    
+    # Imported here so the planner itself never pulls in torch
+    from services.round1b.embedding_generator import EmbeddingGenerator
+    generator = EmbeddingGenerator()
+    
+    texts = _synthetic_headings(text_count)
+    generator.encode_texts(texts[:16])  # Warm-up
+    
+    start = time.time()
+    generator.encode_texts(texts)
+    return time.time() - start
@@ -4,9 +4,12 @@ File handling utilities with UTF-8 BOM support
 
 import json
 import logging
+import os
 from pathlib import Path
 from typing import Dict, List, Union
 
+from utils.archive_reader import read_path_bytes
+
 class FileHandler:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
@@ -14,29 +17,40 @@ class FileHandler:
     def load_json(self, file_path: Union[str, Path]) -> Dict:
         """Load JSON file with error handling and UTF-8 BOM support"""
         try:
-            # First try with utf-8-sig to handle BOM
-            with open(file_path, 'r', encoding='utf-8-sig') as f:
-                return json.load(f)
-        except UnicodeDecodeError:
-            # Fallback to regular utf-8
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                self.logger.error(f'Error loading JSON from {file_path}: {str(e)}')
-                raise
+            # One read (from disk or a zip/tar member); utf-8-sig also strips a BOM
+            raw = read_path_bytes(file_path)
         except Exception as e:
             self.logger.error(f'Error loading JSON from {file_path}: {str(e)}')
             raise
+        return self.parse_json_bytes(raw, file_path)
+    
+    def parse_json_bytes(self, raw: bytes, source: Union[str, Path] = '<bytes>') -> Dict:
+        """Parse JSON from already-read bytes, tolerating a UTF-8 BOM"""
+        try:
+            return json.loads(raw.decode('utf-8-sig'))
+        except Exception as e:
+            self.logger.error(f'Error loading JSON from {source}: {str(e)}')
+            raise
     
     def save_json(self, data: Dict, file_path: Union[str, Path]) -> bool:
-        """Save data to JSON file without BOM"""
+        """Save data to JSON file without BOM, atomically (temp file + rename)"""
+        file_path = Path(file_path)
+        # Same directory, so the rename never crosses filesystems
+        temp_path = file_path.with_name(f'.{file_path.name}.{os.getpid()}.tmp')
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
+            with open(temp_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # Readers (and other nodes) see the old file or the new one, never a partial write
+            os.replace(temp_path, file_path)
             return True
         except Exception as e:
             self.logger.error(f'Error saving JSON to {file_path}: {str(e)}')
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
             return False
     
     def ensure_directory(self, dir_path: Union[str, Path]) -> Path:
@@ -4,146 +4,131 @@ JSON validation utilities for Service 1B - Challenge 1B Format Compliance
 
 import json
 import logging
-from typing import Dict, List, Union
+from typing import Any, Callable, Dict, List, Union
 from pathlib import Path
 
+_SCHEMA_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool
+}
+
+_TYPE_NAMES = {
+    'object': 'an object',
+    'array': 'an array',
+    'string': 'a string',
+    'integer': 'an integer',
+    'number': 'a number',
+    'boolean': 'a boolean'
+}
+
+def compile_schema(schema: Dict, path: str = '') -> Callable[[Any], List[str]]:
+    """Compile a JSON-schema subset into a validator function returning error strings.
+    
+    Supports type, required, properties, items, minimum and minLength - the
+    keywords used by the Challenge 1B schemas. All schema walking happens
+    here, once; the returned closures only check values.
+    """
+    checks: List[Callable[[Any, str, List[str]], bool]] = []
+    expected_type = schema.get('type')
+    
+    if expected_type:
+        python_types = _SCHEMA_TYPES[expected_type]
+        
+        def check_type(value, where, errors):
+            # bool is an int subclass but never a valid JSON integer/number
+            if not isinstance(value, python_types) or (isinstance(value, bool) and expected_type != 'boolean'):
+                errors.append(f'{where or "document"} must be {_TYPE_NAMES[expected_type]}')
+                return False
+            return True
+        checks.append(check_type)
+    
+    if 'minimum' in schema:
+        minimum = schema['minimum']
+        
+        def check_minimum(value, where, errors):
+            if value < minimum:
+                errors.append(f'{where} must be >= {minimum}')
+            return True
+        checks.append(check_minimum)
+    
+    if 'minLength' in schema:
+        min_length = schema['minLength']
+        
+        def check_min_length(value, where, errors):
+            if len(value.strip()) < min_length:
+                errors.append(f'{where} must be a non-empty string')
+            return True
+        checks.append(check_min_length)
+    
+    required = tuple(schema.get('required', []))
+    properties = [
+        (name, compile_schema(sub_schema, f'{path}.{name}' if path else name))
+        for name, sub_schema in schema.get('properties', {}).items()
+    ]
+    
+    if required or properties:
+        def check_object(value, where, errors):
+            for name in required:
+                if name not in value:
+                    errors.append(f'{where or "document"} missing required field: {name}')
+            for name, validate in properties:
+                if name in value:
+                    errors.extend(validate(value[name], f'{where}.{name}' if where else name))
+            return True
+        checks.append(check_object)
+    
+    if 'items' in schema:
+        validate_item = compile_schema(schema['items'], f'{path}[]')
+        
+        def check_items(value, where, errors):
+            for idx, item in enumerate(value):
+                errors.extend(validate_item(item, f'{where}[{idx}]'))
+            return True
+        checks.append(check_items)
+    
+    def validate(value: Any, where: str = path) -> List[str]:
+        errors: List[str] = []
+        for check in checks:
+            # A failed type check makes the remaining checks meaningless
+            if not check(value, where, errors):
+                break
+        return errors
+    
+    return validate
+
 class JSONValidator:
+    # Compiled once per process and shared by every instance
+    _compiled_validators: Dict[str, Callable[[Any], List[str]]] = {}
+    
     def __init__(self):
         self.logger = logging.getLogger(__name__)
     
+    def get_input_validator(self) -> Callable[[Any], List[str]]:
+        """Compiled validator for challenge1b_input.json"""
+        if 'input' not in self._compiled_validators:
+            self._compiled_validators['input'] = compile_schema(self.get_expected_input_schema())
+        return self._compiled_validators['input']
+    
+    def get_output_validator(self) -> Callable[[Any], List[str]]:
+        """Compiled validator for challenge1b_output.json"""
+        if 'output' not in self._compiled_validators:
+            self._compiled_validators['output'] = compile_schema(self.get_expected_output_schema())
+        return self._compiled_validators['output']
+    
     def validate_challenge1b_input(self, input_data: Dict) -> tuple[bool, List[str]]:
         """Validate challenge1b_input.json format"""
-        errors = []
-        
-        # Check required top-level fields for Challenge 1B input
-        required_fields = ['challenge_info', 'documents', 'persona', 'job_to_be_done']
-        for field in required_fields:
-            if field not in input_data:
-                errors.append(f'Missing required field: {field}')
-        
-        # Validate challenge_info structure
-        if 'challenge_info' in input_data:
-            challenge_info = input_data['challenge_info']
-            if not isinstance(challenge_info, dict):
-                errors.append('challenge_info must be an object')
-            else:
-                if 'challenge_id' not in challenge_info:
-                    errors.append('challenge_info missing challenge_id')
-        
-        # Validate documents structure
-        if 'documents' in input_data:
-            documents = input_data['documents']
-            if not isinstance(documents, list):
-                errors.append('documents must be an array')
-            else:
-                for idx, doc in enumerate(documents):
-                    if not isinstance(doc, dict):
-                        errors.append(f'Document {idx} must be an object')
-                        continue
-                    if 'filename' not in doc:
-                        errors.append(f'Document {idx} missing filename')
-        
-        # Validate persona structure
-        if 'persona' in input_data:
-            persona = input_data['persona']
-            if not isinstance(persona, dict):
-                errors.append('persona must be an object')
-            elif 'role' not in persona:
-                errors.append('persona missing role field')
-        
-        # Validate job_to_be_done structure
-        if 'job_to_be_done' in input_data:
-            job = input_data['job_to_be_done']
-            if not isinstance(job, dict):
-                errors.append('job_to_be_done must be an object')
-            elif 'task' not in job:
-                errors.append('job_to_be_done missing task field')
-        
+        errors = self.get_input_validator()(input_data)
         return len(errors) == 0, errors
     
     def validate_challenge1b_output(self, output_data: Dict) -> tuple[bool, List[str]]:
         """Validate challenge1b_output.json format"""
-        errors = []
-        
-        # Check required top-level fields for Challenge 1B output
-        required_fields = ['metadata', 'extracted_sections', 'subsection_analysis']
-        for field in required_fields:
-            if field not in output_data:
-                errors.append(f'Missing required field: {field}')
-        
-        # Validate metadata structure
-        if 'metadata' in output_data:
-            metadata = output_data['metadata']
-            if not isinstance(metadata, dict):
-                errors.append('metadata must be an object')
-            else:
-                metadata_fields = ['input_documents', 'persona', 'job_to_be_done']
-                for field in metadata_fields:
-                    if field not in metadata:
-                        errors.append(f'metadata missing field: {field}')
-        
-        # Validate extracted_sections structure
-        if 'extracted_sections' in output_data:
-            extracted_sections = output_data['extracted_sections']
-            if not isinstance(extracted_sections, list):
-                errors.append('extracted_sections must be an array')
-            else:
-                for idx, section in enumerate(extracted_sections):
-                    section_errors = self._validate_extracted_section(section, idx)
-                    errors.extend(section_errors)
-        
-        # Validate subsection_analysis structure
-        if 'subsection_analysis' in output_data:
-            subsection_analysis = output_data['subsection_analysis']
-            if not isinstance(subsection_analysis, list):
-                errors.append('subsection_analysis must be an array')
-            else:
-                for idx, subsection in enumerate(subsection_analysis):
-                    subsection_errors = self._validate_subsection_analysis(subsection, idx)
-                    errors.extend(subsection_errors)
-        
+        errors = self.get_output_validator()(output_data)
         return len(errors) == 0, errors
     
-    def _validate_extracted_section(self, section: Dict, idx: int) -> List[str]:
-        """Validate individual extracted section"""
-        errors = []
-        
-        required_fields = ['document', 'section_title', 'importance_rank', 'page_number']
-        for field in required_fields:
-            if field not in section:
-                errors.append(f'Extracted section {idx} missing field: {field}')
-        
-        # Validate field types
-        if 'importance_rank' in section:
-            if not isinstance(section['importance_rank'], int) or section['importance_rank'] < 1:
-                errors.append(f'Extracted section {idx} importance_rank must be positive integer')
-        
-        if 'page_number' in section:
-            if not isinstance(section['page_number'], int) or section['page_number'] < 1:
-                errors.append(f'Extracted section {idx} page_number must be positive integer')
-        
-        return errors
-    
-    def _validate_subsection_analysis(self, subsection: Dict, idx: int) -> List[str]:
-        """Validate individual subsection analysis"""
-        errors = []
-        
-        required_fields = ['document', 'refined_text', 'page_number']
-        for field in required_fields:
-            if field not in subsection:
-                errors.append(f'Subsection analysis {idx} missing field: {field}')
-        
-        # Validate field types
-        if 'refined_text' in subsection:
-            if not isinstance(subsection['refined_text'], str) or not subsection['refined_text'].strip():
-                errors.append(f'Subsection analysis {idx} refined_text must be non-empty string')
-        
-        if 'page_number' in subsection:
-            if not isinstance(subsection['page_number'], int) or subsection['page_number'] < 1:
-                errors.append(f'Subsection analysis {idx} page_number must be positive integer')
-        
-        return errors
-    
     def validate_input_file(self, file_path: Union[str, Path]) -> tuple[bool, List[str]]:
         """Validate challenge1b_input.json file"""
         try:
@@ -242,6 +227,20 @@ class JSONValidator:
                     "properties": {
                         "task": {"type": "string"}
                     }
+                },
+                "filters": {
+                    "type": "object",
+                    "properties": {
+                        "levels": {"type": "array", "items": {"type": "string"}},
+                        "documents": {"type": "array", "items": {"type": "string"}},
+                        "pages": {
+                            "type": "object",
+                            "properties": {
+                                "min": {"type": "integer", "minimum": 0},
+                                "max": {"type": "integer", "minimum": 0}
+                            }
+                        }
+                    }
                 }
             }
         }
@@ -281,7 +280,7 @@ class JSONValidator:
                         "required": ["document", "refined_text", "page_number"],
                         "properties": {
                             "document": {"type": "string"},
-                            "refined_text": {"type": "string"},
+                            "refined_text": {"type": "string", "minLength": 1},
                             "page_number": {"type": "integer", "minimum": 1}
                         }
                     }
@@ -0,0 +1,176 @@
+﻿"""
+Lease files for sharing one collections volume between several nodes
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from config.settings import Settings
+
+class LeaseManager:
+    """Claims collections with O_EXCL lease files kept alive by a heartbeat thread.
+    
+    A lease is a small JSON file inside the collection folder. Creating it with
+    O_CREAT | O_EXCL is atomic on local filesystems and NFSv3+, so exactly one
+    node wins each claim. The owner refreshes the file's mtime every heartbeat;
+    a lease whose mtime is older than the TTL is treated as abandoned.
+    """
+    
+    def __init__(self, owner_id: str = None, output_dir: str = None):
+        self.logger = logging.getLogger(__name__)
+        self.settings = Settings()
+        if output_dir:
+            self.settings.output_dir = output_dir
+        self.owner_id = owner_id or self.settings.node_id
+        
+        self._held: Dict[Path, Path] = {}  # collection -> lease file
+        self._lost = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+    
+    def _lease_path(self, collection_path: Path) -> Path:
+        # Next to the output, so archived (read-only) collections can be leased too
+        return self.settings.get_output_file(collection_path).parent / self.settings.lease_file_name
+    
+    def _read_owner(self, lease_path: Path) -> Optional[str]:
+        try:
+            with open(lease_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('owner')
+        except (OSError, ValueError):
+            return None
+    
+    def _is_stale(self, lease_path: Path) -> bool:
+        try:
+            return time.time() - lease_path.stat().st_mtime > self.settings.lease_ttl_seconds
+        except FileNotFoundError:
+            return False
+    
+    def _create(self, lease_path: Path) -> bool:
+        """Atomically create the lease file; False if someone else holds it"""
+        try:
+            lease_path.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'owner': self.owner_id,
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'acquired_at': time.time()
+            }, f)
+        return True
+    
+    def _reclaim(self, lease_path: Path) -> bool:
+        """Remove a stale lease; only one of several racing reclaimers succeeds.
+        
+        Removal happens under an O_EXCL reclaim lock and only after re-checking
+        the file currently at the lease path. A node whose staleness check is out
+        of date therefore finds the fresh lease that replaced the stale one and
+        leaves it alone, and the lease name is never free while a live lease exists.
+        """
+        lock_path = lease_path.with_name(f'{lease_path.name}.reclaim')
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            # Another node is reclaiming; a lock left by a crashed reclaimer expires like a lease
+            if self._is_stale(lock_path):
+                try:
+                    os.unlink(lock_path)
+                except FileNotFoundError:
+                    pass
+            return False
+        
+        try:
+            if not self._is_stale(lease_path):
+                # Already reclaimed and re-leased (or released) since our check
+                return False
+            try:
+                os.unlink(lease_path)
+            except FileNotFoundError:
+                return False
+        finally:
+            os.unlink(lock_path)
+        
+        self.logger.warning(f"⚠️ Reclaimed stale lease on {lease_path.parent.name}")
+        return True
+    
+    def acquire(self, collection_path: Path) -> bool:
+        """Try to claim a collection for this node"""
+        lease_path = self._lease_path(collection_path)
+        
+        acquired = self._create(lease_path)
+        if not acquired and self._is_stale(lease_path) and self._reclaim(lease_path):
+            acquired = self._create(lease_path)
+        
+        if acquired:
+            with self._lock:
+                self._held[Path(collection_path)] = lease_path
+                self._lost.discard(Path(collection_path))
+            self.logger.debug(f"Lease acquired on {Path(collection_path).name} by {self.owner_id}")
+        return acquired
+    
+    def release(self, collection_path: Path):
+        """Drop a lease this node holds"""
+        with self._lock:
+            lease_path = self._held.pop(Path(collection_path), None)
+        if lease_path is None:
+            return
+        
+        # Never delete a lease that was reclaimed by another node
+        if self._read_owner(lease_path) == self.owner_id:
+            try:
+                lease_path.unlink()
+            except FileNotFoundError:
+                pass
+    
+    def still_held(self, collection_path: Path) -> bool:
+        """False if the heartbeat found the lease taken over"""
+        with self._lock:
+            return Path(collection_path) in self._held and Path(collection_path) not in self._lost
+    
+    def renew_all(self):
+        """Refresh the mtime of every held lease"""
+        with self._lock:
+            held = list(self._held.items())
+        
+        for collection_path, lease_path in held:
+            if self._read_owner(lease_path) != self.owner_id:
+                with self._lock:
+                    self._lost.add(collection_path)
+                self.logger.warning(f"⚠️ Lost lease on {collection_path.name}")
+                continue
+            try:
+                os.utime(lease_path)
+            except FileNotFoundError:
+                with self._lock:
+                    self._lost.add(collection_path)
+    
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.settings.lease_heartbeat_seconds):
+            self.renew_all()
+    
+    def start_heartbeat(self):
+        """Start renewing held leases in the background"""
+        if self._heartbeat_thread is None:
+            self._stop.clear()
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='lease-heartbeat', daemon=True)
+            self._heartbeat_thread.start()
+    
+    def stop_heartbeat(self):
+        """Stop the heartbeat and release anything still held"""
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        
+        for collection_path in list(self._held):
+            self.release(collection_path)
@@ -2,54 +2,187 @@
 Logging configuration - Windows & Docker compatible
 """
 
+import atexit
+import json
 import logging
+import multiprocessing.util
+import queue
 import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from typing import Dict, Optional, Tuple
 
-def setup_logger(name: str = None, level: str = 'INFO') -> logging.Logger:
-    """Setup application logger with cross-platform path handling"""
+from config.settings import Settings
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Pass as extra= on high-volume per-document messages so they can be sampled
+SAMPLED = {'sampled': True}
+
+# Top-level loggers of the app's packages; module loggers inherit their level
+APP_LOGGERS = ('__main__', 'config', 'services', 'utils')
+
+# One queue, one listener thread and one set of real handlers per process
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record"""
     
-    # Create logger
-    logger = logging.getLogger(name or __name__)
-    logger.setLevel(getattr(logging, level.upper()))
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue records unformatted; the listener thread does the formatting.
     
-    # Avoid duplicate handlers
-    if logger.handlers:
-        return logger
+    The stock QueueHandler formats every record on the calling thread so it can
+    be pickled. Our queue never leaves the process, so msg/args are kept as-is
+    and only the traceback (which references live frames) is rendered here.
+    """
+    
+    _traceback_formatter = logging.Formatter()
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = self._traceback_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class SamplingFilter(logging.Filter):
+    """Keep the first `burst` records of each sampled message, then one in `every`"""
+    
+    def __init__(self, every: int, burst: int):
+        super().__init__()
+        self.every = max(1, every)
+        self.burst = burst
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or not getattr(record, 'sampled', False):
+            return True
+        
+        # Keyed by the unformatted message template
+        key = (record.name, str(record.msg))
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count < self.burst or (count - self.burst) % self.every == 0
+
+def _get_log_dir() -> Path:
+    # Use relative path that works in both environments
+    if Path('/app').exists():
+        # Docker environment
+        return Path('/app/logs')
+    # Local development environment
+    return Path('./logs')
+
+def _start_listener() -> QueueHandler:
+    """Create the shared queue handler on the root logger and start its listener thread.
     
-    # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    Every module logger propagates to root, so plain logging.getLogger(__name__)
+    loggers reach the same console and file handlers as setup_logger ones.
+    """
+    global _queue_handler, _listener
+    settings = Settings()
+    root = logging.getLogger()
+    formatter = logging.Formatter(LOG_FORMAT)
     
-    # Console handler (always works)
-    console_handler = logging.StreamHandler(sys.stdout)
+    # Console handler (always works); stderr when stdout carries the NDJSON results stream
+    results_on_stdout = settings.output_mode in ('bulk', 'ndjson') and settings.output_ndjson_path == '-'
+    console_handler = logging.StreamHandler(sys.stderr if results_on_stdout else sys.stdout)
     console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
-    # File handler with relative path
+    # Single file handler shared by every module logger
     try:
-        # Use relative path that works in both environments
-        if Path('/app').exists():
-            # Docker environment
-            log_dir = Path('/app/logs')
-        else:
-            # Local development environment
-            log_dir = Path('./logs')
-        
+        log_dir = _get_log_dir()
         log_dir.mkdir(parents=True, exist_ok=True)
         
         file_handler = logging.FileHandler(log_dir / 'application.log')
         file_handler.setLevel(logging.DEBUG)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        
-        logger.debug(f'Log file created at: {log_dir / "application.log"}')
+        handlers.append(file_handler)
         
+        if settings.log_json:
+            json_handler = logging.FileHandler(log_dir / 'application.jsonl')
+            json_handler.setLevel(logging.DEBUG)
+            json_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(json_handler)
     except Exception as e:
         # If file logging fails, continue with console only
-        logger.warning(f'Could not setup file logging: {str(e)}')
-        logger.info('Using console logging only')
+        console_handler.handle(logging.makeLogRecord({
+            'msg': f'Could not setup file logging: {str(e)}; using console logging only',
+            'levelname': 'WARNING', 'levelno': logging.WARNING, 'name': __name__
+        }))
+    
+    log_queue = queue.SimpleQueue()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)  # restarted after stop_logging
+    _queue_handler = LazyQueueHandler(log_queue)
+    _queue_handler.addFilter(SamplingFilter(settings.log_sample_every, settings.log_sample_burst))
+    
+    # A host program that configured root itself (the scripts' basicConfig) keeps its handlers
+    if not root.handlers:
+        root.addHandler(_queue_handler)
+    # Root stays at WARNING for third-party libraries; the app's packages log at LOG_LEVEL
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(getattr(logging, settings.log_level.upper(), logging.INFO))
+    
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _queue_handler
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def restart_logging_after_fork():
+    """Give a forked child its own queue and listener thread.
+    
+    Threads do not survive fork: the inherited queue would fill up with nobody
+    draining it, and hold copies of the parent's not-yet-written records.
+    Loggers keep the same handler object, which now feeds the new listener.
+    """
+    global _listener
+    if _queue_handler is None:
+        return
+    handlers = _listener.handlers if _listener is not None else ()
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Worker processes leave through os._exit, which skips atexit but runs these
+    multiprocessing.util.Finalize(None, stop_logging, exitpriority=0)
+
+def setup_logger(name: str = None, level: str = None) -> logging.Logger:
+    """Module logger; records propagate to the shared handler on the root logger"""
+    logger = logging.getLogger(name or __name__)
+    if level:
+        logger.setLevel(getattr(logging, level.upper()))
+    
+    # File and console I/O happen on the listener thread, off the processing hot path
+    with _setup_lock:
+        if _listener is None:
+            _start_listener()
     
     return logger
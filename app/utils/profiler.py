@@ -0,0 +1,182 @@
+﻿"""
+Per-collection CPU and memory profiling hooks (cProfile, tracemalloc, torch profiler)
+"""
+
+import cProfile
+import io
+import json
+import pstats
+import re
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, List
+
+from config.settings import Settings
+from utils.logger import setup_logger
+
+PROFILE_STAGES = ('cpu', 'memory', 'torch')
+
+class CollectionProfiler:
+    """Wraps one collection run with the selected profilers and writes reports.
+    
+    Stages are independent so overhead stays contained: 'cpu' runs cProfile,
+    'memory' runs tracemalloc, and 'torch' runs the torch profiler around
+    EmbeddingGenerator.encode_texts calls only.
+    """
+    
+    def __init__(self, stages: List[str] = None):
+        self.logger = setup_logger(__name__)
+        self.settings = Settings()
+        self.stages = set(stages if stages is not None else self.settings.profile_stages)
+        unknown = self.stages - set(PROFILE_STAGES)
+        if unknown:
+            raise ValueError(f"Unknown profile stage(s): {', '.join(sorted(unknown))}")
+        
+        self.output_dir = self.settings.get_logs_path() / self.settings.profile_dir_name
+        self.summaries: Dict[str, Dict] = {}
+    
+    def _file_stem(self, collection_name: str) -> str:
+        return re.sub(r'[^\w.-]+', '_', collection_name)
+    
+    @contextmanager
+    def _torch_profile(self, embedding_generator, op_totals: Dict):
+        """Profile encode_texts calls and accumulate per-op CPU time"""
+        try:
+            from torch.profiler import profile, ProfilerActivity
+        except ImportError:
+            self.logger.warning("⚠️ torch profiler unavailable; skipping 'torch' stage")
+            yield
+            return
+        
+        original = embedding_generator.encode_texts
+        
+        def profiled_encode(texts, *args, **kwargs):
+            with profile(activities=[ProfilerActivity.CPU]) as prof:
+                result = original(texts, *args, **kwargs)
+            for event in prof.key_averages():
+                totals = op_totals[event.key]
+                totals['count'] += event.count
+                totals['cpu_time_us'] += event.cpu_time_total
+                totals['self_cpu_time_us'] += event.self_cpu_time_total
+            return result
+        
+        # Instance attribute shadows the method only for this collection
+        embedding_generator.encode_texts = profiled_encode
+        try:
+            yield
+        finally:
+            del embedding_generator.encode_texts
+    
+    @contextmanager
+    def profile_collection(self, collection_name: str, embedding_generator=None):
+        """Profile everything run inside the block as one collection"""
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = self._file_stem(collection_name)
+        
+        profiler = cProfile.Profile() if 'cpu' in self.stages else None
+        started_tracing = False
+        if 'memory' in self.stages and not tracemalloc.is_tracing():
+            tracemalloc.start(self.settings.profile_traceback_depth)
+            started_tracing = True
+        baseline = tracemalloc.take_snapshot() if 'memory' in self.stages else None
+        if baseline is not None:
+            tracemalloc.reset_peak()
+        
+        op_totals = defaultdict(lambda: {'count': 0, 'cpu_time_us': 0.0, 'self_cpu_time_us': 0.0})
+        use_torch = 'torch' in self.stages and embedding_generator is not None
+        
+        start = time.time()
+        try:
+            with self._torch_profile(embedding_generator, op_totals) if use_torch else nullcontext():
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    yield
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            summary = {'collection': collection_name, 'wall_seconds': round(time.time() - start, 4)}
+            
+            # Snapshot memory before building the pstats report allocates anything
+            if baseline is not None:
+                summary.update(self._write_memory_report(baseline, stem))
+                if started_tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                summary.update(self._write_cpu_report(profiler, stem))
+            if use_torch and op_totals:
+                summary.update(self._write_torch_report(op_totals, stem))
+            
+            self.summaries[collection_name] = summary
+            self._write_summary(summary, stem)
+            self._log_summary(summary)
+    
+    def _write_cpu_report(self, profiler: cProfile.Profile, stem: str) -> Dict:
+        """pstats dump plus a readable top list"""
+        pstats_file = self.output_dir / f'{stem}.pstats'
+        profiler.dump_stats(str(pstats_file))
+        
+        buffer = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buffer)
+        stats.sort_stats('cumulative').print_stats(self.settings.profile_top_n)
+        (self.output_dir / f'{stem}_cpu.txt').write_text(buffer.getvalue(), encoding='utf-8')
+        
+        # Hottest functions by own time, as "file:line(function)"
+        hottest = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        return {
+            'pstats_file': str(pstats_file),
+            'hottest_functions': [
+                {'function': f'{Path(filename).name}:{line}({name})', 'self_seconds': round(tottime, 4),
+                 'cumulative_seconds': round(cumtime, 4), 'calls': calls}
+                for (filename, line, name), (_, calls, tottime, cumtime, _) in hottest[:5]
+            ]
+        }
+    
+    def _write_memory_report(self, baseline: tracemalloc.Snapshot, stem: str) -> Dict:
+        """Top allocation sites, and growth since the collection started"""
+        # Leave out the profilers' own bookkeeping
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, __file__)
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        top_n = self.settings.profile_top_n
+        
+        lines = [f'Current traced: {current / 1024 / 1024:.2f} MB, peak: {peak / 1024 / 1024:.2f} MB', '']
+        lines.append(f'Top {top_n} allocation sites:')
+        lines.extend(str(stat) for stat in snapshot.statistics('lineno')[:top_n])
+        lines.append('')
+        lines.append(f'Top {top_n} growth since collection start:')
+        lines.extend(str(stat) for stat in snapshot.compare_to(baseline, 'lineno')[:top_n] if stat.size_diff)
+        (self.output_dir / f'{stem}_memory.txt').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        
+        return {'traced_peak_mb': round(peak / 1024 / 1024, 2), 'traced_current_mb': round(current / 1024 / 1024, 2)}
+    
+    def _write_torch_report(self, op_totals: Dict, stem: str) -> Dict:
+        """Per-op CPU time across every encode call of the collection"""
+        ordered = sorted(op_totals.items(), key=lambda item: item[1]['self_cpu_time_us'], reverse=True)
+        lines = [f"{'op':<48} {'calls':>8} {'self ms':>10} {'total ms':>10}"]
+        for key, totals in ordered[:self.settings.profile_top_n]:
+            lines.append(
+                f"{key[:48]:<48} {totals['count']:>8} {totals['self_cpu_time_us'] / 1000:>10.2f} "
+                f"{totals['cpu_time_us'] / 1000:>10.2f}"
+            )
+        (self.output_dir / f'{stem}_torch.txt').write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        return {'torch_top_ops': [key for key, _ in ordered[:5]]}
+    
+    def _write_summary(self, summary: Dict, stem: str):
+        # One file per collection: workers profiling in parallel never share a file
+        with open(self.output_dir / f'{stem}_summary.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4, ensure_ascii=False)
+    
+    def _log_summary(self, summary: Dict):
+        self.logger.info(f"📊 Profile for {summary['collection']} ({summary['wall_seconds']:.2f}s) in {self.output_dir}")
+        for entry in summary.get('hottest_functions', [])[:3]:
+            self.logger.info(f"   🔥 {entry['function']}: {entry['self_seconds']:.3f}s self, {entry['calls']} calls")
+        if 'traced_peak_mb' in summary:
+            self.logger.info(f"   💾 Traced peak: {summary['traced_peak_mb']:.2f} MB")
@@ -0,0 +1,71 @@
+﻿"""
+Compare reading collections from an extracted tree with reading them from zip/tar archives
+"""
+
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from services.round1b.collection_manifest import CollectionManifest
+
+def write_collections(root: Path, collections: int, documents: int, sections: int):
+    '''Synthetic collections shaped like the bundled ones'''
+    for c in range(collections):
+        folder = root / f'Collection {c + 1}'
+        folder.mkdir(parents=True)
+        names = [f'doc_{d}.pdf' for d in range(documents)]
+        (folder / 'challenge1b_input.json').write_text(json.dumps({
+            'persona': {'role': 'Travel Planner'},
+            'job_to_be_done': {'task': 'Plan a trip'},
+            'documents': [{'filename': name, 'title': name} for name in names]
+        }), encoding='utf-8')
+        for name in names:
+            outline = [{'level': 'H2', 'text': f'Section {s} of {name}', 'page': s // 5 + 1} for s in range(sections)]
+            (folder / name.replace('.pdf', '_outline.json')).write_text(
+                json.dumps({'title': name, 'outline': outline}), encoding='utf-8'
+            )
+
+def read_all(root: Path) -> int:
+    '''What a run reads: the scan, every input and every outline'''
+    manifest = CollectionManifest(root)
+    total = 0
+    for collection in manifest.paths():
+        for doc_info in manifest.query_data(collection)['documents']:
+            total += len(manifest.read_bytes(collection / doc_info['outline_file']))
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description='Extracted tree vs zip/tar archive reads')
+    parser.add_argument('--collections', type=int, default=200)
+    parser.add_argument('--documents', type=int, default=5)
+    parser.add_argument('--sections', type=int, default=200)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        tree = scratch / 'collections'
+        write_collections(tree, args.collections, args.documents, args.sections)
+        sources = {'directory': tree}
+        for label, archive_format in (('zip', 'zip'), ('tar', 'tar'), ('tar.gz', 'gztar')):
+            sources[label] = Path(shutil.make_archive(str(scratch / 'collections'), archive_format, tree))
+        
+        print(f"{'source':>10} {'MB read':>8} {'best s':>8}")
+        for label, source in sources.items():
+            best = float('inf')
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                total = read_all(source)
+                best = min(best, time.perf_counter() - start)
+            print(f"{label:>10} {total / 2**20:>8.1f} {best:>8.3f}")
+
+if __name__ == '__main__':
+    main()
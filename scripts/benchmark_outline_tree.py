@@ -0,0 +1,62 @@
+﻿"""
+Compare outline tree search with exhaustive scoring on synthetic hierarchical documents
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from services.round1b.outline_tree_index import OutlineTreeIndex
+
+def synthetic_document(rows: int, dim: int, rng: np.random.Generator):
+    '''H1/H2/H3 outline whose chapters share a topic, like real manuals'''
+    topics = rng.standard_normal((max(4, rows // 200), dim))
+    sections, vectors = [], []
+    for i in range(rows):
+        level = 'H1' if i % 50 == 0 else ('H2' if i % 10 == 0 else 'H3')
+        sections.append({'level': level, 'text': f'Section {i}'})
+        vectors.append(topics[i * len(topics) // rows] + 0.6 * rng.standard_normal(dim))
+    embeddings = np.asarray(vectors, dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return sections, embeddings
+
+def main():
+    parser = argparse.ArgumentParser(description='Outline tree search vs exhaustive scoring')
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--top-k', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=5)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(0)
+    print(f"{'sections':>9} {'scored':>8} {'tree ms':>9} {'matmul ms':>10} {'exact':>6}")
+    for rows in [int(n) for n in args.sizes.split(',')]:
+        sections, embeddings = synthetic_document(rows, args.dim, rng)
+        tree = OutlineTreeIndex(sections, embeddings)
+        
+        scored, tree_seconds, full_seconds, exact = [], 0.0, 0.0, True
+        for _ in range(args.queries):
+            weights = embeddings[rng.integers(rows)] + 0.05 * rng.standard_normal(args.dim).astype(np.float32)
+            
+            start = time.perf_counter()
+            found, _ = tree.search(weights, args.top_k)
+            tree_seconds += time.perf_counter() - start
+            scored.append(tree.last_stats['scored'])
+            
+            start = time.perf_counter()
+            reference = np.argsort(-(embeddings @ weights), kind='stable')[:args.top_k]
+            full_seconds += time.perf_counter() - start
+            exact &= list(found) == list(reference)
+        
+        print(f"{rows:>9} {np.mean(scored):>8.0f} {1000 * tree_seconds / args.queries:>9.2f} "
+              f"{1000 * full_seconds / args.queries:>10.2f} {str(exact):>6}")
+
+if __name__ == '__main__':
+    main()
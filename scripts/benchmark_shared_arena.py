@@ -0,0 +1,117 @@
+﻿"""
+Compare per-worker memory with a shared arena vs private matrix copies, and
+model-holding collection workers forked after load vs spawned
+"""
+
+import sys
+import argparse
+import multiprocessing
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from services.round1b.shared_vector_arena import SharedVectorArena
+
+def private_memory_mb() -> float:
+    '''Private (unshared) resident memory of this process, from smaps_rollup'''
+    return memory_mb()[0]
+
+def memory_mb() -> Tuple[float, float]:
+    '''(private, proportional) resident memory of this process, from smaps_rollup'''
+    private_kb = pss_kb = 0
+    with open('/proc/self/smaps_rollup', 'r') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                private_kb += int(line.split()[1])
+            elif line.startswith('Pss:'):
+                pss_kb = int(line.split()[1])
+    return private_kb / 1024, pss_kb / 1024
+
+# Model loaded by the parent before forking (forked mode only)
+_generator = None
+
+def model_worker(reports, done, texts: List[str]):
+    '''Encode like a collection worker, report memory while every worker is alive'''
+    generator = _generator
+    if generator is None:
+        from services.round1b.embedding_generator import EmbeddingGenerator
+        generator = EmbeddingGenerator()
+    generator.encode_texts(texts)
+    reports.put(memory_mb())
+    done.wait()
+
+def model_scaling(counts: List[int], text_count: int):
+    '''Total worker memory for model-holding workers, spawned vs forked after load'''
+    global _generator
+    from services.round1b.embedding_generator import EmbeddingGenerator
+    texts = [f'Section {i}: testing methodology and quality practices part {i % 17}' for i in range(text_count)]
+    
+    print(f"{'workers':>8} {'spawn private':>14} {'spawn PSS':>10} {'fork private':>13} {'fork PSS':>9}")
+    for count in counts:
+        totals = {}
+        for method in ('spawn', 'fork'):
+            context = multiprocessing.get_context(method)
+            # The parent holds a model in both cases, as the processor does; it never encodes
+            _generator = EmbeddingGenerator()
+            shared = _generator if method == 'fork' else None
+            _generator = shared
+            reports, done = context.Queue(), context.Event()
+            workers = [context.Process(target=model_worker, args=(reports, done, texts)) for _ in range(count)]
+            for process in workers:
+                process.start()
+            measured = [reports.get() for _ in workers]
+            done.set()
+            for process in workers:
+                process.join()
+            totals[method] = (sum(m[0] for m in measured), sum(m[1] for m in measured))
+        print(f"{count:>8} {totals['spawn'][0]:>14.1f} {totals['spawn'][1]:>10.1f} "
+              f"{totals['fork'][0]:>13.1f} {totals['fork'][1]:>9.1f}")
+
+def worker(mode: str, payload, rows: int, dim: int) -> float:
+    '''Touch every row of the matrix, then report private memory'''
+    if mode == 'shared':
+        arena = SharedVectorArena.attach(payload)
+        matrix = arena.get('sections')
+    else:
+        matrix = np.random.default_rng(0).standard_normal((rows, dim), dtype=np.float32)
+    
+    query = np.ones(dim, dtype=np.float32)
+    float((matrix @ query).sum())
+    return private_memory_mb()
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared arena vs private copies')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--model', action='store_true',
+                        help='Also measure collection workers holding the embedding model (needs the bundled model)')
+    parser.add_argument('--texts', type=int, default=256, help='Headings each model worker encodes')
+    args = parser.parse_args()
+    
+    matrix = np.random.default_rng(0).standard_normal((args.rows, args.dim), dtype=np.float32)
+    arena = SharedVectorArena.create({'sections': matrix})
+    print(f"matrix: {matrix.nbytes / 1024 / 1024:.1f} MB")
+    print(f"{'workers':>8} {'private MB (copies)':>20} {'private MB (shared)':>20}")
+    
+    context = multiprocessing.get_context('spawn')
+    for count in [int(n) for n in args.workers.split(',')]:
+        totals = {}
+        for mode, payload in (('private', None), ('shared', arena.descriptor())):
+            with context.Pool(count) as pool:
+                totals[mode] = sum(pool.starmap(worker, [(mode, payload, args.rows, args.dim)] * count))
+        print(f"{count:>8} {totals['private']:>20.1f} {totals['shared']:>20.1f}")
+    
+    arena.destroy()
+    
+    if args.model:
+        print()
+        model_scaling([int(n) for n in args.workers.split(',')], args.texts)
+
+if __name__ == '__main__':
+    main()
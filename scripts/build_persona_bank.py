@@ -0,0 +1,34 @@
+﻿"""
+Build the persona vector bank ahead of time so startup only loads it
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from config.settings import Settings
+from services.round1b.embedding_generator import EmbeddingGenerator
+from services.round1b.persona_bank import PersonaBank
+
+def build_persona_bank():
+    '''Embed all persona vocabularies and save the bank next to the model'''
+    
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+    
+    settings = Settings()
+    bank = PersonaBank(EmbeddingGenerator())
+    bank.build()
+    
+    bank_path = Path(settings.persona_bank_path)
+    if bank.save(bank_path):
+        logger.info(f'Persona bank saved to {bank_path}')
+    else:
+        raise RuntimeError(f'Could not save persona bank to {bank_path}')
+
+if __name__ == '__main__':
+    build_persona_bank()
@@ -0,0 +1,83 @@
+﻿"""
+Report speedup and top-20 agreement of cascade ranking against the full model
+"""
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from services.round1b.persona_matcher import PersonaMatcher
+from services.round1b.topk_accumulator import TopKAccumulator
+
+def load_collection(collection_path: Path):
+    '''Query fields and per-document outline sections of one collection'''
+    with open(collection_path / 'challenge1b_input.json', 'r', encoding='utf-8-sig') as f:
+        data = json.load(f)
+    
+    documents = []
+    for doc in data.get('documents', []):
+        outline_file = collection_path / doc['filename'].replace('.pdf', '_outline.json')
+        if outline_file.exists():
+            with open(outline_file, 'r', encoding='utf-8-sig') as f:
+                sections = json.load(f).get('outline', [])
+            for position, section in enumerate(sections):
+                section['document'] = doc['filename']
+                section['position'] = position
+            documents.append(sections)
+    return data['persona']['role'], data['job_to_be_done']['task'], documents
+
+def rank(matcher: PersonaMatcher, role: str, task: str, documents, k: int):
+    '''Top-k (document, position) keys and total scoring seconds'''
+    top_k = TopKAccumulator(k)
+    start = time.time()
+    for sections in documents:
+        top_k.add(sections, matcher.score_sections(sections, role, task))
+    elapsed = time.time() - start
+    return [(s['document'], s['position']) for s, _ in top_k.results()], elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cascade ranking with full-model ranking')
+    parser.add_argument('--collections', default='./collections', help='Collections directory')
+    parser.add_argument('--layers', type=int, default=None, help='Transformer layers used in stage one')
+    parser.add_argument('--candidates', type=int, default=None, help='Sections re-scored in stage two')
+    parser.add_argument('--k', type=int, default=20)
+    args = parser.parse_args()
+    
+    matcher = PersonaMatcher()
+    settings = matcher.settings
+    if args.layers:
+        settings.cascade_layers = args.layers
+    if args.candidates:
+        settings.cascade_candidates = args.candidates
+    
+    # Warm up both paths so model load and first-call overhead are not timed
+    matcher.embedding_generator.encode_texts(['warm up'])
+    matcher.embedding_generator.encode_texts_truncated(['warm up'], settings.cascade_layers)
+    
+    print(f"cascade: {settings.cascade_layers}/{matcher.embedding_generator.get_num_layers()} layers, "
+          f"top {settings.cascade_candidates} re-scored")
+    print(f"{'collection':<20} {'sections':>8} {'full s':>8} {'cascade s':>10} {'speedup':>8} {'agree@' + str(args.k):>9}")
+    
+    for collection_path in sorted(Path(args.collections).glob('*/challenge1b_input.json')):
+        collection_path = collection_path.parent
+        role, task, documents = load_collection(collection_path)
+        
+        settings.cascade_enabled = False
+        full_top, full_time = rank(matcher, role, task, documents, args.k)
+        
+        settings.cascade_enabled = True
+        cascade_top, cascade_time = rank(matcher, role, task, documents, args.k)
+        
+        agreement = len(set(full_top) & set(cascade_top)) / max(len(full_top), 1)
+        section_count = sum(len(sections) for sections in documents)
+        print(f"{collection_path.name:<20} {section_count:>8} {full_time:>8.3f} {cascade_time:>10.3f} "
+              f"{full_time / max(cascade_time, 1e-9):>7.2f}x {agreement:>9.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+﻿"""
+Report memory per vector and recall@20 of each embedding codec against float32
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from services.round1b.vector_codecs import evaluate_codecs
+
+def load_bundled_embeddings(collections_dir: Path):
+    '''Embed every bundled section heading and use the task queries as queries'''
+    from services.round1b.persona_matcher import PersonaMatcher
+    
+    matcher = PersonaMatcher()
+    sections = []
+    queries = []
+    
+    for input_file in sorted(collections_dir.glob('*/challenge1b_input.json')):
+        with open(input_file, 'r', encoding='utf-8-sig') as f:
+            queries.append(json.load(f)['job_to_be_done']['task'])
+        for outline_file in sorted(input_file.parent.glob('*_outline.json')):
+            with open(outline_file, 'r', encoding='utf-8-sig') as f:
+                sections.extend(json.load(f).get('outline', []))
+    
+    vectors = matcher.embedding_generator.encode_texts([matcher.get_section_text(s) for s in sections])
+    query_vectors = matcher.embedding_generator.encode_texts(queries + [s['text'] for s in sections[:50]])
+    return vectors, query_vectors
+
+def synthetic_embeddings(count: int, dimension: int = 384, seed: int = 0):
+    '''Clustered unit vectors that mimic heading embeddings'''
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(count // 100, 8), dimension))
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.5 * rng.normal(size=(count, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(count, size=50, replace=False)] + 0.1 * rng.normal(size=(50, dimension))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare embedding codecs against float32')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Use N synthetic vectors instead of the bundled collections')
+    parser.add_argument('--collections', default='./collections', help='Collections directory')
+    parser.add_argument('--k', type=int, default=20)
+    args = parser.parse_args()
+    
+    if args.synthetic:
+        vectors, queries = synthetic_embeddings(args.synthetic)
+    else:
+        vectors, queries = load_bundled_embeddings(Path(args.collections))
+    
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries")
+    print(f"{'codec':<8} {'bytes/vec':>10} {'ratio':>7} {'recall@' + str(args.k):>10} {'rescored':>9} {'ms/query':>9}")
+    for row in evaluate_codecs(vectors, queries, k=args.k):
+        print(f"{row['codec']:<8} {row['bytes_per_vector']:>10.0f} {row['compression_ratio']:>6.1f}x "
+              f"{row[f'recall@{args.k}']:>10.3f} {row[f'recall@{args.k}_rescored']:>9.3f} {row['query_ms']:>9.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+﻿"""
+Pareto table of ranking configurations: latency/throughput/memory vs agreement with the reference
+"""
+
+import sys
+import json
+import argparse
+from pathlib import Path
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from services.round1b.ranking_evaluator import DEFAULT_CANDIDATES, RankingEvaluator
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare ranking configurations against the exact reference')
+    parser.add_argument('--collections', default='./collections', help='Bundled collections directory')
+    parser.add_argument('--synthetic', type=int, default=4, help='Synthetic collections added to the workload')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per collection')
+    parser.add_argument('--only', default=None, help='Comma-separated candidate names to run')
+    parser.add_argument('--config', default=None,
+                        help='JSON file with extra candidates: [{"name": ..., "overrides": {...}}]')
+    parser.add_argument('--json', default=None, help='Also write the table to this JSON file')
+    args = parser.parse_args()
+    
+    candidates = list(DEFAULT_CANDIDATES)
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            candidates.extend(json.load(f))
+    if args.only:
+        wanted = set(args.only.split(','))
+        candidates = [c for c in candidates if c['name'] in wanted]
+    
+    evaluator = RankingEvaluator()
+    collections = evaluator.load_bundled_collections(Path(args.collections))
+    collections += evaluator.synthetic_collections(collections, args.synthetic)
+    section_count = sum(len(s) for c in collections for s in c['documents'])
+    print(f"{len(collections)} collections, {section_count} sections, {len(candidates)} candidates")
+    
+    rows = evaluator.evaluate(collections, candidates, repeats=args.repeats)
+    
+    print(f"{'config':<14} {'mean ms':>8} {'p95 ms':>8} {'speedup':>8} {'sec/s':>9} {'peak MB':>8} "
+          f"{'overlap':>8} {'tau':>6} {'NDCG':>6} {'pareto':>7}")
+    for row in rows:
+        tau = f"{row['kendall_tau']:.3f}" if row['kendall_tau'] is not None else '-'
+        print(f"{row['name']:<14} {row['mean_latency_ms']:>8.1f} {row['p95_latency_ms']:>8.1f} "
+              f"{row['speedup']:>7.2f}x {row['sections_per_second']:>9.0f} {row['peak_traced_mb']:>8.2f} "
+              f"{row['topk_overlap']:>8.3f} {tau:>6} {row['ndcg']:>6.3f} {'*' if row['pareto'] else '':>7}")
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=4)
+
+if __name__ == '__main__':
+    main()
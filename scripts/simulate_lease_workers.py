@@ -0,0 +1,99 @@
+﻿"""
+Run several coordinated processes against one collections directory and
+check that every collection is processed exactly once
+"""
+
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+from pathlib import Path
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
+
+from config.settings import Settings
+
+def run_node(node_index: int, root_path: str):
+    '''One simulated node: lease, process and report what it handled'''
+    os.environ['NODE_ID'] = f'sim-node-{node_index}'
+    from services.round1b.collection_processor import CollectionProcessor
+    
+    report = CollectionProcessor().process_all_collections(Path(root_path), coordinate=True)
+    return node_index, {name: entry.get('success', False) for name, entry in report['collections'].items()}
+
+def build_workspace(source: Path, copies: int, stale_lease: bool) -> Path:
+    '''Replicate the bundled collections into a scratch directory without outputs'''
+    settings = Settings()
+    root = Path(tempfile.mkdtemp(prefix='lease_sim_'))
+    
+    for collection in sorted(p.parent for p in source.glob(f'*/{settings.challenge_input_file}')):
+        for copy_index in range(copies):
+            target = root / f'{collection.name} #{copy_index}'
+            shutil.copytree(collection, target)
+            (target / settings.challenge_output_file).unlink(missing_ok=True)
+    
+    if stale_lease:
+        # A lease left behind by a crashed node, older than the TTL
+        victim = sorted(root.iterdir())[0] / settings.lease_file_name
+        victim.write_text(json.dumps({'owner': 'crashed-node'}), encoding='utf-8')
+        old = time.time() - settings.lease_ttl_seconds - 60
+        os.utime(victim, (old, old))
+    
+    return root
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate several nodes sharing one collections volume')
+    parser.add_argument('--collections', default='./collections', help='Bundled collections to replicate')
+    parser.add_argument('--copies', type=int, default=4, help='Copies of each bundled collection')
+    parser.add_argument('--processes', type=int, default=3, help='Simulated nodes')
+    parser.add_argument('--stale-lease', action='store_true', help='Plant an expired lease to be reclaimed')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+    args = parser.parse_args()
+    
+    settings = Settings()
+    root = build_workspace(Path(args.collections), args.copies, args.stale_lease)
+    collections = sorted(p.name for p in root.iterdir())
+    print(f"{len(collections)} collections in {root}, {args.processes} nodes")
+    
+    start = time.time()
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(run_node, [(i, str(root)) for i in range(args.processes)])
+    elapsed = time.time() - start
+    
+    handled = Counter()
+    for node_index, processed in sorted(results):
+        print(f"  node {node_index}: {len(processed)} collection(s) {sorted(processed)}")
+        handled.update(processed)
+    
+    duplicates = sorted(name for name, count in handled.items() if count > 1)
+    missing = sorted(name for name in collections if name not in handled)
+    leftover_leases = sorted(p.parent.name for p in root.glob(f'*/{settings.lease_file_name}*'))
+    unreadable = []
+    for name in collections:
+        try:
+            with open(root / name / settings.challenge_output_file, 'r', encoding='utf-8') as f:
+                json.load(f)
+        except (OSError, ValueError):
+            unreadable.append(name)
+    
+    print(f"elapsed {elapsed:.2f}s")
+    print(f"duplicates: {duplicates or 'none'}")
+    print(f"missing: {missing or 'none'}")
+    print(f"leftover leases: {leftover_leases or 'none'}")
+    print(f"unreadable outputs: {unreadable or 'none'}")
+    
+    if not args.keep:
+        shutil.rmtree(root)
+    
+    sys.exit(1 if duplicates or missing or leftover_leases or unreadable else 0)
+
+if __name__ == '__main__':
+    main()
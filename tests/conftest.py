@@ -0,0 +1,10 @@
+"""
+Shared pytest setup: the app's packages are imported the way app/main.py imports them
+"""
+
+import sys
+from pathlib import Path
+
+# Add the app directory to Python path
+app_dir = Path(__file__).parent.parent / 'app'
+sys.path.insert(0, str(app_dir))
@@ -0,0 +1,71 @@
+"""
+Archive members read from forked workers that inherited the parent's open reader
+"""
+
+import io
+import json
+import multiprocessing
+import tarfile
+import zipfile
+
+import pytest
+
+from utils.archive_reader import open_archive
+
+pytestmark = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                                reason='readers are only inherited by forked workers')
+
+MEMBERS = 50
+ROUNDS = 40
+
+def _payload(i):
+    # Different sizes, so a read at a shifted offset cannot parse as the right member
+    return json.dumps({'member': i, 'padding': 'x' * (97 * i + 13)}).encode('utf-8')
+
+def _write_tar(path):
+    with tarfile.open(path, 'w') as tar:
+        for i in range(MEMBERS):
+            data = _payload(i)
+            info = tarfile.TarInfo(f'Collection 1/member_{i}.json')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+def _write_zip(path):
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for i in range(MEMBERS):
+            archive.writestr(f'Collection 1/member_{i}.json', _payload(i))
+
+def _read_all(archive_path, reader, errors):
+    """Read every member ROUNDS times, through the inherited reader and through open_archive"""
+    bad = 0
+    for round_index in range(ROUNDS):
+        source = reader if round_index % 2 else open_archive(archive_path)
+        for i in range(MEMBERS):
+            try:
+                if json.loads(source.read(f'Collection 1/member_{i}.json'))['member'] != i:
+                    bad += 1
+            except Exception:
+                bad += 1
+    errors.put(bad)
+
+@pytest.mark.parametrize('writer, name', [(_write_tar, 'batch.tar'), (_write_zip, 'batch.zip')])
+def test_forked_workers_read_members_intact(tmp_path, writer, name):
+    archive_path = tmp_path / name
+    writer(archive_path)
+    
+    # Opened (and read from) in the parent, as the manifest scan does before workers fork
+    reader = open_archive(archive_path)
+    assert json.loads(reader.read('Collection 1/member_0.json'))['member'] == 0
+    
+    context = multiprocessing.get_context('fork')
+    errors = context.Queue()
+    workers = [context.Process(target=_read_all, args=(archive_path, reader, errors)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    bad = [errors.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    
+    assert bad == [0] * len(workers)
+    # The parent's reader still reads correctly after its children used theirs
+    assert json.loads(reader.read(f'Collection 1/member_{MEMBERS - 1}.json'))['member'] == MEMBERS - 1
@@ -0,0 +1,87 @@
+"""
+Per-shard top-k scan: duplicates and untitled sections never leave a shard short of k
+"""
+
+import numpy as np
+import pytest
+
+from services.round1b.collection_shard import read_manifest, search_shard, write_shard
+
+DIMENSION = 8
+
+def _shard(tmp_path, sections, embeddings, codec_name='float32'):
+    shard_dir = tmp_path / 'Collection 1' / '.challenge1b_shard'
+    manifest = {'model': 'test', 'documents': [], 'codec': codec_name, 'exact_rescore': codec_name != 'float32'}
+    write_shard(shard_dir, sections, embeddings, manifest, codec_name, codec_name != 'float32')
+    assert read_manifest(shard_dir)['sections'] == len(sections)
+    return shard_dir
+
+def _section(text, page=1, document='doc.pdf'):
+    return {'document': document, 'title': document, 'collection': 'Collection 1',
+            'text': text, 'level': 'H1', 'page': page}
+
+def _duplicated_corpus(k):
+    """The best 3k rows are copies of one heading or untitled; distinct headings score lower"""
+    weights = np.zeros(DIMENSION, dtype=np.float32)
+    weights[0] = 1.0
+    
+    sections, scores = [], []
+    for i in range(3 * k):
+        sections.append(_section('Repeated heading' if i % 2 else '   '))
+        scores.append(1.0 - i * 1e-4)
+    for i in range(2 * k):
+        sections.append(_section(f'Distinct heading {i}', page=i + 1))
+        scores.append(0.5 - i * 1e-3)
+    
+    embeddings = np.zeros((len(sections), DIMENSION), dtype=np.float32)
+    embeddings[:, 0] = scores
+    embeddings[:, 1] = np.sqrt(1.0 - embeddings[:, 0] ** 2)
+    return sections, embeddings, weights
+
+@pytest.mark.parametrize('codec_name', ['float32', 'int8'])
+def test_shard_returns_exactly_k_distinct_titled_sections(tmp_path, codec_name):
+    k = 5
+    sections, embeddings, weights = _duplicated_corpus(k)
+    shard_dir = _shard(tmp_path, sections, embeddings, codec_name)
+    
+    result = search_shard(str(shard_dir), weights, k, block_rows=7)
+    
+    assert 'error' not in result
+    titles = [hit['section']['text'].strip() for hit in result['hits']]
+    assert len(titles) == k
+    assert len(set(titles)) == k
+    assert all(titles)
+    assert titles[0] == 'Repeated heading'
+    assert titles[1:] == [f'Distinct heading {i}' for i in range(k - 1)]
+    scores = [hit['score'] for hit in result['hits']]
+    assert scores == sorted(scores, reverse=True)
+
+def test_shard_with_fewer_distinct_sections_than_k_returns_them_all(tmp_path):
+    sections = [_section('Same'), _section('Same'), _section(''), _section('Other', page=2)]
+    embeddings = np.eye(len(sections), DIMENSION, dtype=np.float32)
+    shard_dir = _shard(tmp_path, sections, embeddings)
+    
+    result = search_shard(str(shard_dir), np.ones(DIMENSION, dtype=np.float32), 10)
+    
+    assert sorted(hit['section']['text'] for hit in result['hits']) == ['Other', 'Same']
+
+@pytest.mark.parametrize('codec_name', ['float32', 'int8'])
+def test_shard_filters_select_rows_from_stored_columns(tmp_path, codec_name):
+    rng = np.random.default_rng(0)
+    sections = [dict(_section(f'Heading {i}', page=i % 7 + 1, document=f'doc{i // 20}.pdf'), level=f'H{i % 3 + 1}')
+                for i in range(60)]
+    embeddings = rng.standard_normal((len(sections), DIMENSION)).astype(np.float32)
+    weights = rng.standard_normal(DIMENSION).astype(np.float32)
+    shard_dir = _shard(tmp_path, sections, embeddings, codec_name)
+    filters = {'levels': ['h1', 'H2'], 'pages': {'min': 2, 'max': 5}, 'documents': ['doc0.pdf', 'doc2.pdf']}
+    
+    result = search_shard(str(shard_dir), weights, 5, block_rows=4, filters=filters)
+    
+    assert 'error' not in result
+    allowed = [i for i, section in enumerate(sections)
+               if section['level'] in ('H1', 'H2') and 2 <= section['page'] <= 5
+               and section['document'] in ('doc0.pdf', 'doc2.pdf')]
+    assert {hit['row'] for hit in result['hits']} <= set(allowed)
+    if codec_name == 'float32':
+        expected = sorted(allowed, key=lambda row: -float(embeddings[row] @ weights))[:5]
+        assert [hit['row'] for hit in result['hits']] == expected
@@ -0,0 +1,73 @@
+"""
+Supervised execution: a worker that overruns or dies is replaced and the batch carries on
+"""
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from config.settings import Settings
+from services.round1b.collection_supervisor import CollectionSupervisor, fork_available
+
+pytestmark = pytest.mark.skipif(not fork_available(), reason='workers are handed the processor by fork')
+
+TIMEOUT_SECONDS = 1.0
+
+class FakeProcessor:
+    """Stands in for CollectionProcessor: collection names say how the run behaves"""
+    
+    def __init__(self):
+        self.settings = Settings()
+    
+    def reinit_after_fork(self):
+        pass
+    
+    def run_collection(self, collection_path: Path):
+        if collection_path.name.startswith('hang'):
+            time.sleep(60)
+        if collection_path.name.startswith('crash'):
+            os._exit(3)
+        return True, {'success': True, 'pid': os.getpid()}
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    monkeypatch.setenv('SUPERVISOR_TIMEOUT_SECONDS', str(TIMEOUT_SECONDS))
+    monkeypatch.setenv('SUPERVISOR_MEMORY_MB', '1000000')  # only the time limit is under test
+    plan = {'workers': 2, 'threads_per_worker': 1, 'cpu_sets': [sorted(os.sched_getaffinity(0))]}
+    supervisor = CollectionSupervisor(FakeProcessor(), plan)
+    assert supervisor.start_method == 'fork'
+    yield supervisor
+    supervisor.close()
+
+def test_worker_over_the_time_limit_is_killed_and_the_batch_continues(supervisor):
+    names = ['first', 'hang', 'second', 'third', 'fourth']
+    
+    start = time.monotonic()
+    outcomes = {path.name: outcome for path, outcome in supervisor.run([Path(name) for name in names])}
+    elapsed = time.monotonic() - start
+    
+    assert sorted(outcomes) == sorted(names)
+    success, record = outcomes['hang']
+    assert not success
+    assert record['supervisor']['reason'] == 'timeout'
+    assert record['supervisor']['elapsed_seconds'] >= TIMEOUT_SECONDS
+    assert all(outcomes[name][0] for name in names if name != 'hang')
+    # Killed at the limit, not after the 60 s the collection would take
+    assert elapsed < 15
+    
+    report = supervisor.report()
+    assert report['killed'] == 1
+    assert report['respawned'] == 1
+    assert [failure['collection'] for failure in report['failures']] == ['hang']
+
+def test_crashed_worker_is_replaced(supervisor):
+    names = ['crash', 'after-1', 'after-2']
+    
+    outcomes = {path.name: outcome for path, outcome in supervisor.run([Path(name) for name in names])}
+    
+    assert outcomes['crash'][0] is False
+    assert outcomes['crash'][1]['supervisor']['reason'] == 'crashed'
+    assert outcomes['after-1'][0] and outcomes['after-2'][0]
+    assert supervisor.report()['respawned'] == 1
@@ -0,0 +1,49 @@
+"""
+Corpus store codecs: one codec per (model, codec), fitted once enough vectors are stored
+"""
+
+import numpy as np
+import pytest
+
+from services.round1b.corpus_store import CorpusStore
+
+DIMENSION = 16
+SECTIONS = 10
+
+def _save_document(store, name, rng):
+    sections = [{'level': 'H1', 'text': f'{name} section {i}', 'page': i + 1} for i in range(SECTIONS)]
+    document_id = store.upsert_document('Collection 1', name, name, f'hash-{name}', sections)
+    embeddings = rng.standard_normal((SECTIONS, DIMENSION)).astype(np.float32)
+    store.save_embeddings(document_id, 'model', embeddings)
+    return document_id, embeddings
+
+@pytest.mark.parametrize('codec_name', ['int8', 'pq'])
+def test_store_fits_one_codec_and_scores_codes(tmp_path, monkeypatch, codec_name):
+    monkeypatch.setenv('CODEC_TRAIN_VECTORS', str(3 * SECTIONS))
+    rng = np.random.default_rng(0)
+    store = CorpusStore(tmp_path / 'corpus.db', codec_name)
+    if codec_name == 'pq':
+        store.settings.pq_subspaces = 4
+    
+    # Below the training threshold documents are kept as float32
+    documents = [_save_document(store, f'doc{i}.pdf', rng) for i in range(2)]
+    assert all(store.load_codes(document_id, 'model').codec.name == 'float32' for document_id, _ in documents)
+    
+    # Crossing it fits the codec once and re-encodes what was stored before
+    documents += [_save_document(store, f'doc{i}.pdf', rng) for i in range(2, 5)]
+    assert store.conn.execute('SELECT COUNT(*) FROM embedding_codecs').fetchone()[0] == 1
+    
+    query = rng.standard_normal(DIMENSION).astype(np.float32)
+    for document_id, embeddings in documents:
+        vectors = store.load_codes(document_id, 'model')
+        assert vectors.codec.name == codec_name
+        assert vectors.codes.dtype == np.uint8
+        exact = embeddings @ query
+        # Codes are scored directly; the ranking stays close to float32
+        assert np.corrcoef(vectors.score(query), exact)[0, 1] > 0.7
+        np.testing.assert_allclose(vectors.score(query), vectors.decode() @ query, rtol=1e-4, atol=1e-4)
+    
+    # A reopened store reads the same fitted codec
+    store.close()
+    reopened = CorpusStore(tmp_path / 'corpus.db', codec_name)
+    assert reopened.load_codes(documents[0][0], 'model').codec.name == codec_name
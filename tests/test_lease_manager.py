@@ -0,0 +1,100 @@
+"""
+Lease claims between racing nodes on one collections volume
+"""
+
+import json
+import os
+import threading
+import time
+
+from config.settings import Settings
+from utils.lease_manager import LeaseManager
+
+NODES = 8
+ROUNDS = 25
+
+def _plant_stale_lease(collection_path):
+    """A lease left behind by a crashed node, older than the TTL"""
+    settings = Settings()
+    lease_path = collection_path / settings.lease_file_name
+    lease_path.write_text(json.dumps({'owner': 'crashed-node'}), encoding='utf-8')
+    old = time.time() - settings.lease_ttl_seconds - 60
+    os.utime(lease_path, (old, old))
+    return lease_path
+
+def _race(collection_path, managers):
+    """Every manager calls acquire at the same moment; returns the owners that won"""
+    barrier = threading.Barrier(len(managers))
+    results = {}
+    
+    def claim(manager):
+        barrier.wait()
+        results[manager.owner_id] = manager.acquire(collection_path)
+    
+    threads = [threading.Thread(target=claim, args=(manager,)) for manager in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [owner for owner, acquired in results.items() if acquired]
+
+def test_stale_lease_is_reclaimed_by_exactly_one_node(tmp_path):
+    collection_path = tmp_path / 'Collection 1'
+    collection_path.mkdir()
+    
+    for _ in range(ROUNDS):
+        lease_path = _plant_stale_lease(collection_path)
+        managers = [LeaseManager(owner_id=f'node-{i}') for i in range(NODES)]
+        
+        winners = _race(collection_path, managers)
+        
+        assert len(winners) == 1
+        assert json.loads(lease_path.read_text(encoding='utf-8'))['owner'] == winners[0]
+        # No reclaim leftovers next to the lease
+        assert sorted(path.name for path in collection_path.iterdir()) == [lease_path.name]
+        lease_path.unlink()
+
+def test_fresh_lease_is_never_taken_over(tmp_path):
+    collection_path = tmp_path / 'Collection 1'
+    collection_path.mkdir()
+    holder = LeaseManager(owner_id='holder')
+    assert holder.acquire(collection_path)
+    
+    winners = _race(collection_path, [LeaseManager(owner_id=f'node-{i}') for i in range(NODES)])
+    
+    assert winners == []
+    assert holder.still_held(collection_path)
+    holder.release(collection_path)
+    assert not (collection_path / Settings().lease_file_name).exists()
+
+def test_late_reclaimer_never_frees_a_fresh_lease(tmp_path, monkeypatch):
+    """A node that judged the old lease stale must not move aside the lease that replaced it"""
+    collection_path = tmp_path / 'Collection 1'
+    collection_path.mkdir()
+    lease_path = _plant_stale_lease(collection_path)
+    
+    winner = LeaseManager(owner_id='winner')
+    late = LeaseManager(owner_id='late')
+    intruder = LeaseManager(owner_id='intruder')
+    assert winner.acquire(collection_path)
+    
+    # The intruder tries to claim at the moment the late node removes or renames the lease file
+    intruder_results = []
+    
+    def racing(original):
+        def call(source, *args):
+            result = original(source, *args)
+            if os.fspath(source) == os.fspath(lease_path) and not intruder_results:
+                intruder_results.append(intruder.acquire(collection_path))
+            return result
+        return call
+    
+    monkeypatch.setattr(os, 'rename', racing(os.rename))
+    monkeypatch.setattr(os, 'unlink', racing(os.unlink))
+    late._reclaim(lease_path)
+    monkeypatch.undo()
+    
+    assert intruder_results in ([], [False])
+    assert not intruder.acquire(collection_path)
+    assert json.loads(lease_path.read_text(encoding='utf-8'))['owner'] == 'winner'
+    assert winner.still_held(collection_path)
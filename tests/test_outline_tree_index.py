@@ -0,0 +1,23 @@
+"""
+Outline tree search with filtered rows matches exhaustive scoring of those rows
+"""
+
+import numpy as np
+
+from services.round1b.outline_tree_index import OutlineTreeIndex
+
+def test_tree_search_over_allowed_rows_is_exact():
+    rng = np.random.default_rng(1)
+    sections = [{'level': f'H{i % 4 + 1}', 'text': f'Heading {i}'} for i in range(300)]
+    embeddings = rng.standard_normal((len(sections), 16)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    tree = OutlineTreeIndex(sections, embeddings, branching=4)
+    
+    for seed in range(5):
+        weights = np.random.default_rng(seed).standard_normal(16).astype(np.float32)
+        allowed = np.flatnonzero(np.random.default_rng(seed + 100).random(len(sections)) < 0.3)
+        rows, scores = tree.search(weights, 10, rows=allowed)
+        
+        exact = allowed[np.argsort(-(embeddings[allowed] @ weights), kind='stable')[:10]]
+        assert list(rows) == list(exact)
+        np.testing.assert_allclose(scores, embeddings[exact] @ weights, rtol=1e-5)